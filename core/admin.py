@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User, SocialProfile, Run, UserList, ListColumn, ListRow
+from .models import User, SocialProfile, Run, UserList, ListColumn, ListRow, ListChange, ListSnapshot, ImportJob, ImportMapping, ExportJob
 
 # Register your models here.
 admin.site.register(User)
@@ -8,3 +8,8 @@ admin.site.register(Run)
 admin.site.register(UserList)
 admin.site.register(ListColumn)
 admin.site.register(ListRow)
+admin.site.register(ListChange)
+admin.site.register(ListSnapshot)
+admin.site.register(ImportJob)
+admin.site.register(ImportMapping)
+admin.site.register(ExportJob)
@@ -12,22 +12,79 @@ Behaviour:
 - In PRODUCTION (settings.DEBUG = False):
     * Uses Supabase client auth.get_user(token) to validate the JWT.
     * Creates/updates a Django user from the returned Supabase user object.
+
+Django instantiates the backend for every authenticate() and get_user() call,
+so the backend does no work when constructed. The Supabase client, with its
+HTTP connection pools, is created on first use and shared by the whole
+process (see get_supabase_client).
 """
 
 import logging
 import os
+import threading
 
 from django.contrib.auth.backends import BaseBackend
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ImproperlyConfigured
 from django.conf import settings
 
-from supabase import create_client, Client
+from supabase import create_client, Client, ClientOptions
+from supabase_auth.helpers import parse_auth_response
 import jwt
+import requests
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
+_client = None
+_client_lock = threading.Lock()
+
+# Seconds to wait for the Auth server when refreshing a token
+REFRESH_TIMEOUT = 10
+
+
+def supabase_settings():
+    """
+    URL and anon key of the Supabase project.
+
+    Raises:
+        ImproperlyConfigured: if SUPABASE_URL or SUPABASE_ANON_KEY is not set.
+    """
+    supabase_url = os.getenv("SUPABASE_URL")
+    supabase_key = os.getenv("SUPABASE_ANON_KEY")
+    if not supabase_url or not supabase_key:
+        raise ImproperlyConfigured(
+            "SUPABASE_URL and SUPABASE_ANON_KEY must be set in environment variables"
+        )
+    return supabase_url, supabase_key
+
+
+def get_supabase_client() -> Client:
+    """
+    Process-wide Supabase client, created on first use.
+
+    The client is shared by every thread, so it must never hold a user
+    session: a session stored on it would put that user's access token in
+    the headers of every later request. Only calls that take the user's
+    token explicitly (auth.get_user, auth.admin.sign_out) go through it;
+    token refresh, which would store the new session, does not (see
+    SupabaseAuthBackend.refresh_token).
+
+    Raises:
+        ImproperlyConfigured: if SUPABASE_URL or SUPABASE_ANON_KEY is not set.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                supabase_url, supabase_key = supabase_settings()
+                _client = create_client(
+                    supabase_url,
+                    supabase_key,
+                    options=ClientOptions(auto_refresh_token=False, persist_session=False),
+                )
+    return _client
+
 
 class SupabaseAuthBackend(BaseBackend):
     """
@@ -39,17 +96,10 @@ class SupabaseAuthBackend(BaseBackend):
     3. Provides helpers for token refresh and sign-out.
     """
 
-    def __init__(self):
-        self.supabase_url = os.getenv("SUPABASE_URL")
-        self.supabase_key = os.getenv("SUPABASE_ANON_KEY")
-
-        if not self.supabase_url or not self.supabase_key:
-            raise ImproperlyConfigured(
-                "SUPABASE_URL and SUPABASE_ANON_KEY must be set in environment variables"
-            )
-
-        # Supabase client is used for production auth and token operations
-        self.client: Client = create_client(self.supabase_url, self.supabase_key)
+    @property
+    def client(self) -> Client:
+        """Shared Supabase client used for production auth and token operations"""
+        return get_supabase_client()
 
     # -------------------------------------------------------------------------
     # Core authentication
@@ -239,12 +289,24 @@ class SupabaseAuthBackend(BaseBackend):
         """
         Refresh Supabase session using a refresh token.
 
+        Posts to the Auth token endpoint directly: the shared client's
+        refresh_session would keep the new session and send its access
+        token with every later request, whoever makes it.
+
         Returns:
-            New session data or None if failed.
+            New session or None if failed.
         """
         try:
-            session = self.client.auth.refresh_session(refresh_token)
-            return session
+            supabase_url, supabase_key = supabase_settings()
+            response = requests.post(
+                f"{supabase_url}/auth/v1/token",
+                params={"grant_type": "refresh_token"},
+                headers={"apikey": supabase_key, "Authorization": f"Bearer {supabase_key}"},
+                json={"refresh_token": refresh_token},
+                timeout=REFRESH_TIMEOUT,
+            )
+            response.raise_for_status()
+            return parse_auth_response(response).session
         except Exception as e:
             logger.error(f"Supabase token refresh error: {e}")
             return None
@@ -257,6 +319,8 @@ class SupabaseAuthBackend(BaseBackend):
             token: Supabase JWT access token (or current session).
         """
         try:
-            self.client.auth.sign_out(token)
+            # The admin API revokes the given token's session; the shared
+            # client's own sign_out would act on its (absent) current session
+            self.client.auth.admin.sign_out(token)
         except Exception as e:
             logger.error(f"Supabase sign out error: {e}")
@@ -0,0 +1,30 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from core.services.export_jobs import claim_next_job, purge_expired, run_job
+
+
+class Command(BaseCommand):
+    help = "Process background export jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit when no job is pending instead of polling")
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Seconds to wait between polls when idle")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Export worker started")
+        while True:
+            close_old_connections()
+            job = claim_next_job()
+            if job is None:
+                purged = purge_expired()
+                if purged:
+                    self.stdout.write(f"Deleted {purged} expired export files")
+                if options['once']:
+                    return
+                time.sleep(options['poll_interval'])
+                continue
+
+            self.stdout.write(f"Exporting job {job.pk} as {job.export_format}")
+            job = run_job(job)
+            self.stdout.write(f"Job {job.pk} {job.status}: {job.bytes_written} bytes")
@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from core.services.import_jobs import claim_next_job, run_job
+
+
+class Command(BaseCommand):
+    help = "Process background list import jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit when no job is pending instead of polling")
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Seconds to wait between polls when idle")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Import worker started")
+        while True:
+            close_old_connections()
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['poll_interval'])
+                continue
+
+            self.stdout.write(f"Importing job {job.pk} into list {job.user_list_id}")
+            job = run_job(job)
+            self.stdout.write(f"Job {job.pk} {job.status}: {job.processed_rows}/{job.total_rows} rows")
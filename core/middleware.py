@@ -0,0 +1,68 @@
+"""
+Response compression for pages, API responses and exports.
+"""
+
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from .services.compression import (
+    COMPRESSION_MIN_SIZE, acompress_chunks, compress_bytes, compress_chunks, is_compressible, is_html, negotiate,
+)
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """Compress responses with the best encoding the client accepts.
+
+    Like Django's GZipMiddleware, but negotiates zstd and brotli too and
+    leaves alone responses that are small, already encoded, of binary types,
+    or offer byte ranges, whose offsets refer to the uncompressed file.
+
+    HTML pages carry CSRF tokens, which BREACH can recover from the size of
+    compressed responses. They are left to GZipMiddleware, whose random
+    padding of the gzip header hides the size, as it has no counterpart for
+    zstd and brotli.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.html = GZipMiddleware(get_response)
+
+    def process_response(self, request, response):
+        if response.status_code != 200 or response.has_header('Content-Encoding'):
+            return response
+        if is_html(response.get('Content-Type')):
+            return self.html.process_response(request, response)
+        if response.has_header('Accept-Ranges') or not is_compressible(response.get('Content-Type')):
+            return response
+        if not response.streaming and len(response.content) < COMPRESSION_MIN_SIZE:
+            return response
+        if response.streaming and response.has_header('Content-Length'):
+            if int(response['Content-Length']) < COMPRESSION_MIN_SIZE:
+                return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate(request.headers.get('Accept-Encoding'))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            # Generated streams are flushed per chunk so they keep streaming
+            flush = not getattr(response, 'file_to_stream', None)
+            if response.is_async:
+                response.streaming_content = acompress_chunks(encoding, response.streaming_content, flush)
+            else:
+                response.streaming_content = compress_chunks(encoding, response.streaming_content, flush)
+            del response['Content-Length']
+        else:
+            compressed = compress_bytes(encoding, response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        # The encoded body differs byte for byte, so a strong ETag becomes weak
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
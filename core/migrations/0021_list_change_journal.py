@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_user_api_credits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userlist',
+            name='version',
+            field=models.PositiveIntegerField(default=0, help_text="Incremented on every change to the list's rows or columns"),
+        ),
+        migrations.CreateModel(
+            name='ListSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField()),
+                ('columns', models.JSONField()),
+                ('rows', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user_list', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='core.userlist')),
+            ],
+            options={
+                'ordering': ['-version'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ListChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(help_text='List version produced by the action this change belongs to')),
+                ('kind', models.CharField(choices=[('edit', 'Edit'), ('undo', 'Undo'), ('redo', 'Redo'), ('restore', 'Restore'), ('import', 'Import')], default='edit', max_length=20)),
+                ('reverts_version', models.PositiveIntegerField(blank=True, help_text='Version undone or redone by this change', null=True)),
+                ('action', models.CharField(choices=[('cell_update', 'Cell Update'), ('row_create', 'Row Create'), ('row_delete', 'Row Delete'), ('column_create', 'Column Create'), ('column_update', 'Column Update'), ('column_delete', 'Column Delete'), ('bulk_write', 'Bulk Write')], max_length=20)),
+                ('row_id', models.BigIntegerField(blank=True, null=True)),
+                ('column', models.CharField(blank=True, help_text='Row data key for cell updates', max_length=255)),
+                ('old_value', models.JSONField(blank=True, null=True)),
+                ('new_value', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('actor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('user_list', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='changes', to='core.userlist')),
+            ],
+            options={
+                'ordering': ['version', 'pk'],
+                'indexes': [models.Index(fields=['user_list', 'version'], name='core_listch_user_li_7c7d31_idx')],
+            },
+        ),
+    ]
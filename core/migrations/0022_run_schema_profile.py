@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_list_change_journal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='run',
+            name='schema_profile',
+            field=models.JSONField(blank=True, help_text='Fields, inferred types and samples of the extracted entities', null=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_run_schema_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listrow',
+            name='key_hash',
+            field=models.CharField(blank=True, help_text='Hash of the dedupe column values the row was imported with', max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='userlist',
+            name='dedupe_columns',
+            field=models.JSONField(blank=True, default=list, help_text='Names of the columns that identify a row across imports'),
+        ),
+        migrations.AddConstraint(
+            model_name='listrow',
+            constraint=models.UniqueConstraint(fields=('user_list', 'key_hash'), name='unique_list_row_key'),
+        ),
+    ]
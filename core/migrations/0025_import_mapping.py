@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_import_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportMapping',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fields', models.JSONField(blank=True, default=dict, help_text="Source field -> {'column': column name, 'type': optional coercion type}")),
+                ('ignored', models.JSONField(blank=True, default=list, help_text='Source fields that are never imported')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user_list', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='import_mapping', to='core.userlist')),
+            ],
+        ),
+    ]
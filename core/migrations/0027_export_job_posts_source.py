@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_export_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='exportjob',
+            name='source',
+            field=models.CharField(default='extracted', help_text='Run payload exported: extracted, scraped or posts', max_length=20),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0027_export_job_posts_source'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='exportjob',
+            name='export_format',
+            field=models.CharField(choices=[('csv', 'CSV'), ('json', 'JSON'), ('ndjson', 'NDJSON'), ('sqlite', 'SQLite')], default='csv', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='exportjob',
+            name='source',
+            field=models.CharField(default='extracted', help_text='Run payload exported: extracted, scraped, posts or snapshot', max_length=20),
+        ),
+    ]
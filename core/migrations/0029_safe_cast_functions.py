@@ -0,0 +1,38 @@
+from django.db import migrations
+
+# Casts used by list aggregation and queries. Values matching the type
+# patterns can still be out of range ('1e999', '2024-13-45'); these return
+# NULL for them instead of failing the whole query.
+CREATE_FUNCTIONS = """
+CREATE OR REPLACE FUNCTION core_safe_float(value text) RETURNS double precision AS $$
+BEGIN
+    RETURN value::double precision;
+EXCEPTION WHEN data_exception THEN
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE;
+
+CREATE OR REPLACE FUNCTION core_safe_date(value text) RETURNS date AS $$
+BEGIN
+    RETURN value::date;
+EXCEPTION WHEN data_exception THEN
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql STABLE STRICT PARALLEL SAFE;
+"""
+
+DROP_FUNCTIONS = """
+DROP FUNCTION IF EXISTS core_safe_float(text);
+DROP FUNCTION IF EXISTS core_safe_date(text);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_export_job_sqlite'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_FUNCTIONS, DROP_FUNCTIONS),
+    ]
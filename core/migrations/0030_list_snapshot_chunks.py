@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0029_safe_cast_functions'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='listsnapshot',
+            options={'ordering': ['-version', 'chunk']},
+        ),
+        migrations.AddField(
+            model_name='listsnapshot',
+            name='chunk',
+            field=models.PositiveIntegerField(default=0, help_text='Position of this part of the rows; columns are stored with chunk 0'),
+        ),
+    ]
@@ -22,6 +22,7 @@ class Run(models.Model):
     enhanced_prompt = models.TextField(blank=True, null=True, help_text="Enhanced extraction prompt generated by n8n workflow")
     scraped = models.JSONField(null=True, help_text="Raw scraped data organized by platform: {'instagram': [...], 'tiktok': [...], ...}")
     extracted = models.JSONField(null=True, help_text="Processed entities extracted from scraped data")
+    schema_profile = models.JSONField(null=True, blank=True, help_text="Fields, inferred types and samples of the extracted entities")
     # Keep output temporarily for backward compatibility
     output = models.JSONField(null=True)  # DEPRECATED: Will be removed after migration
     created_at = models.DateTimeField(auto_now_add=True)
@@ -33,6 +34,8 @@ class UserList(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True)
     icon = models.CharField(max_length=50, blank=True, help_text="Emoji or icon for the list")
+    version = models.PositiveIntegerField(default=0, help_text="Incremented on every change to the list's rows or columns")
+    dedupe_columns = models.JSONField(default=list, blank=True, help_text="Names of the columns that identify a row across imports")
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -77,8 +80,127 @@ class ListColumn(models.Model):
 class ListRow(models.Model):
     user_list = models.ForeignKey(UserList, on_delete=models.CASCADE, related_name='rows')
     data = models.JSONField()  # Stores the row data as JSON
+    key_hash = models.CharField(max_length=64, null=True, blank=True, help_text="Hash of the dedupe column values the row was imported with")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['user_list', 'key_hash'], name='unique_list_row_key'),
+        ]
+
+
+class ListChange(models.Model):
+    """Append-only journal entry for one row, column or cell mutation of a list"""
+    ACTIONS = [
+        ('cell_update', 'Cell Update'),
+        ('row_create', 'Row Create'),
+        ('row_delete', 'Row Delete'),
+        ('column_create', 'Column Create'),
+        ('column_update', 'Column Update'),
+        ('column_delete', 'Column Delete'),
+        ('bulk_write', 'Bulk Write'),
+    ]
+    KINDS = [
+        ('edit', 'Edit'),
+        ('undo', 'Undo'),
+        ('redo', 'Redo'),
+        ('restore', 'Restore'),
+        ('import', 'Import'),
+    ]
+
+    user_list = models.ForeignKey(UserList, on_delete=models.CASCADE, related_name='changes')
+    version = models.PositiveIntegerField(help_text="List version produced by the action this change belongs to")
+    kind = models.CharField(max_length=20, choices=KINDS, default='edit')
+    reverts_version = models.PositiveIntegerField(null=True, blank=True, help_text="Version undone or redone by this change")
+    action = models.CharField(max_length=20, choices=ACTIONS)
+    row_id = models.BigIntegerField(null=True, blank=True)
+    column = models.CharField(max_length=255, blank=True, help_text="Row data key for cell updates")
+    old_value = models.JSONField(null=True, blank=True)
+    new_value = models.JSONField(null=True, blank=True)
+    actor = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['version', 'pk']
+        indexes = [models.Index(fields=['user_list', 'version'])]
+
+
+class ListSnapshot(models.Model):
+    """Compacted copy of a list's columns and rows at a given version, in one or more chunks"""
+    user_list = models.ForeignKey(UserList, on_delete=models.CASCADE, related_name='snapshots')
+    version = models.PositiveIntegerField()
+    chunk = models.PositiveIntegerField(default=0, help_text="Position of this part of the rows; columns are stored with chunk 0")
+    columns = models.JSONField()
+    rows = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-version', 'chunk']
+
+
+class ImportJob(models.Model):
+    """Import of run data into a list, processed in the background by the import worker"""
+    STATUSES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    user_list = models.ForeignKey(UserList, on_delete=models.CASCADE, related_name='import_jobs')
+    run_ids = models.JSONField(default=list, help_text="Runs whose extracted entities are imported, in order")
+    mode = models.CharField(max_length=20, default='upsert', help_text="How rows matching an existing dedupe key are handled")
+    status = models.CharField(max_length=20, choices=STATUSES, default='pending', db_index=True)
+    total_rows = models.PositiveIntegerField(default=0)
+    processed_rows = models.PositiveIntegerField(default=0, help_text="Entities written so far; an interrupted job resumes after them")
+    rows_per_second = models.FloatField(default=0)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+
+class ImportMapping(models.Model):
+    """Saved mapping of extracted fields to list columns, reused by every import into the list"""
+    user_list = models.OneToOneField(UserList, on_delete=models.CASCADE, related_name='import_mapping')
+    fields = models.JSONField(default=dict, blank=True, help_text="Source field -> {'column': column name, 'type': optional coercion type}")
+    ignored = models.JSONField(default=list, blank=True, help_text="Source fields that are never imported")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class ExportJob(models.Model):
+    """Export of a list or run written to a file in the background by the export worker"""
+    STATUSES = ImportJob.STATUSES
+    FORMATS = [
+        ('csv', 'CSV'),
+        ('json', 'JSON'),
+        ('ndjson', 'NDJSON'),
+        ('sqlite', 'SQLite'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    user_list = models.ForeignKey(UserList, on_delete=models.CASCADE, null=True, blank=True, related_name='export_jobs')
+    run = models.ForeignKey(Run, on_delete=models.CASCADE, null=True, blank=True, related_name='export_jobs')
+    source = models.CharField(max_length=20, default='extracted', help_text="Run payload exported: extracted, scraped, posts or snapshot")
+    export_format = models.CharField(max_length=10, choices=FORMATS, default='csv')
+    compress = models.BooleanField(default=False, help_text="Write the file gzip-compressed")
+    status = models.CharField(max_length=20, choices=STATUSES, default='pending', db_index=True)
+    bytes_written = models.BigIntegerField(default=0)
+    file_name = models.CharField(max_length=255, blank=True, help_text="Name of the finished file in EXPORT_FILES_DIR")
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
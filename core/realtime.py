@@ -0,0 +1,219 @@
+"""
+Realtime list updates over WebSockets.
+
+Grids connect to ``/ws/lists/<pk>/`` and receive the changes other users
+make to the list. Changes are published by the list journal via Postgres
+NOTIFY (see ``core.services.list_events``), so every ASGI process sees every
+change regardless of which process handled the write.
+
+Handshakes are only accepted from pages served by this site: the Origin
+header must name one of ``ALLOWED_HOSTS``, as with Channels'
+``AllowedHostsOriginValidator``, and the session must belong to the list's
+owner.
+
+Each process keeps one LISTEN connection shared by all of its sockets. Events
+for a socket are buffered for ``BATCH_WINDOW`` seconds and sent as one
+message, with repeated edits of the same cell coalesced to the latest value.
+"""
+
+import asyncio
+import json
+import logging
+import re
+from collections import defaultdict
+from types import SimpleNamespace
+from urllib.parse import urlparse
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http.cookie import parse_cookie
+from django.http.request import validate_host
+
+from .services.list_events import CHANNEL
+
+try:
+    import psycopg
+except ImportError:
+    psycopg = None
+
+logger = logging.getLogger(__name__)
+
+LIST_SOCKET_PATH = re.compile(r'^/ws/lists/(?P<pk>\d+)/$')
+
+# Seconds to collect events before sending them to a socket
+BATCH_WINDOW = getattr(settings, 'REALTIME_BATCH_WINDOW', 0.1)
+
+# Seconds to wait before reconnecting a dropped LISTEN connection
+RECONNECT_DELAY = 2
+
+
+class ListEventHub:
+    """Fans out list events from one LISTEN connection to subscribed sockets"""
+
+    def __init__(self):
+        self.subscribers = defaultdict(set)
+        self.listener = None
+
+    def subscribe(self, list_id, queue):
+        self.subscribers[list_id].add(queue)
+        if self.listener is None or self.listener.done():
+            self.listener = asyncio.get_running_loop().create_task(self.listen())
+
+    def unsubscribe(self, list_id, queue):
+        queues = self.subscribers.get(list_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.subscribers[list_id]
+
+    def dispatch(self, payload):
+        try:
+            event = json.loads(payload)
+        except json.JSONDecodeError:
+            logger.warning(f"Ignoring malformed list event: {payload[:200]}")
+            return
+        for queue in self.subscribers.get(event.get('list'), ()):
+            queue.put_nowait(event)
+
+    def connection_params(self):
+        settings_dict = connections['default'].settings_dict
+        params = {
+            'dbname': settings_dict['NAME'],
+            'user': settings_dict['USER'],
+            'password': settings_dict['PASSWORD'],
+            'host': settings_dict['HOST'],
+            'port': settings_dict['PORT'],
+            **settings_dict.get('OPTIONS', {}),
+        }
+        return {key: value for key, value in params.items() if value}
+
+    async def listen(self):
+        """Forward notifications until no sockets are subscribed"""
+        while self.subscribers:
+            try:
+                conn = await psycopg.AsyncConnection.connect(autocommit=True, **self.connection_params())
+                async with conn:
+                    await conn.execute(f'LISTEN {CHANNEL}')
+                    logger.info("Listening for list events")
+                    async for notify in conn.notifies():
+                        self.dispatch(notify.payload)
+                        if not self.subscribers:
+                            break
+            except Exception as e:
+                logger.error(f"List event listener failed: {e}")
+                await asyncio.sleep(RECONNECT_DELAY)
+
+
+hub = ListEventHub()
+
+
+def coalesce(events):
+    """Merge buffered events into one message for a socket.
+
+    Repeated updates of the same cell keep only the latest value. Truncated
+    events are passed on as a flag; the client then reads the history endpoint.
+    """
+    deltas = {}
+    for event in events:
+        for position, delta in enumerate(event.get('deltas', ())):
+            if delta['action'] == 'cell_update':
+                key = ('cell', delta['row_id'], delta['column'])
+                deltas.pop(key, None)
+            else:
+                key = (event['version'], position)
+            deltas[key] = delta
+    return {
+        'type': 'changes',
+        'from_version': min(event['version'] for event in events),
+        'version': max(event['version'] for event in events),
+        'truncated': any(event.get('truncated') for event in events),
+        'deltas': list(deltas.values()),
+    }
+
+
+def origin_allowed(scope):
+    """Whether the socket's Origin header names one of the ALLOWED_HOSTS.
+
+    Browsers send the session cookie with cross-site WebSocket handshakes, so
+    without this check any page could open a socket as the visiting user.
+    """
+    origin = dict(scope.get('headers', ())).get(b'origin')
+    if not origin:
+        return False
+    try:
+        hostname = urlparse(origin.decode('latin-1')).hostname
+    except ValueError:
+        return False
+    if not hostname:
+        return False
+    if ':' in hostname:
+        hostname = f'[{hostname}]'
+
+    allowed_hosts = settings.ALLOWED_HOSTS
+    if settings.DEBUG and not allowed_hosts:
+        allowed_hosts = ['.localhost', '127.0.0.1', '[::1]']
+    return validate_host(hostname, allowed_hosts)
+
+
+@sync_to_async
+def authorize(scope, list_id):
+    """Whether the session in the socket's cookies belongs to the list's owner"""
+    from importlib import import_module
+    from django.contrib.auth import get_user
+    from .models import UserList
+
+    cookies = {}
+    for name, value in scope.get('headers', ()):
+        if name == b'cookie':
+            cookies = parse_cookie(value.decode('latin-1'))
+            break
+    session_key = cookies.get(settings.SESSION_COOKIE_NAME)
+    if not session_key:
+        return False
+
+    engine = import_module(settings.SESSION_ENGINE)
+    user = get_user(SimpleNamespace(session=engine.SessionStore(session_key)))
+    if not user.is_authenticated:
+        return False
+    return UserList.objects.filter(pk=list_id, user=user).exists()
+
+
+async def send_batches(send, queue):
+    while True:
+        events = [await queue.get()]
+        await asyncio.sleep(BATCH_WINDOW)
+        while not queue.empty():
+            events.append(queue.get_nowait())
+        await send({'type': 'websocket.send', 'text': json.dumps(coalesce(events), default=str)})
+
+
+async def list_socket(scope, receive, send):
+    """ASGI application for one list WebSocket"""
+    match = LIST_SOCKET_PATH.match(scope['path'])
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    if match is None or psycopg is None or not origin_allowed(scope):
+        await send({'type': 'websocket.close', 'code': 4403})
+        return
+    if not await authorize(scope, int(match['pk'])):
+        await send({'type': 'websocket.close', 'code': 4403})
+        return
+
+    list_id = int(match['pk'])
+    queue = asyncio.Queue()
+    await send({'type': 'websocket.accept'})
+    hub.subscribe(list_id, queue)
+    sender = asyncio.get_running_loop().create_task(send_batches(send, queue))
+    try:
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                break
+            if message.get('text') == 'ping':
+                await send({'type': 'websocket.send', 'text': json.dumps({'type': 'pong'})})
+    finally:
+        hub.unsubscribe(list_id, queue)
+        sender.cancel()
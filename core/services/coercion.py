@@ -0,0 +1,244 @@
+"""
+Column type coercion shared by every list write path.
+
+A converter is built once per column from its ``column_type`` and ``options``
+and then applied to every value written to that column. Values that cannot be
+converted are kept as they were and reported as a ``CoercionFailure``.
+"""
+
+import json
+from collections import Counter, namedtuple
+from datetime import datetime
+
+DATE_FORMATS = [
+    '%Y-%m-%d',
+    '%m/%d/%Y',
+    '%d/%m/%Y',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%dT%H:%M:%S',
+    '%Y-%m-%dT%H:%M:%SZ',
+    '%b %d, %Y',
+    '%d %b %Y',
+]
+
+TRUE_VALUES = {'true', '1', 'yes', 'on'}
+
+# Failures kept per column as samples; the rest are only counted
+MAX_FAILURE_SAMPLES = 10
+
+CoercionFailure = namedtuple('CoercionFailure', ['column', 'value', 'error'])
+
+
+class CoercionError(ValueError):
+    """Raised by a converter when a value does not fit the column type"""
+
+
+def blank_value(column_type):
+    """Value stored in a column of this type when no value is given"""
+    if column_type == 'boolean':
+        return False
+    if column_type == 'multi_select':
+        return []
+    return None
+
+
+def _number_converter(options):
+    def to_number(value):
+        try:
+            return float(value)
+        except (ValueError, TypeError):
+            raise CoercionError(f'Not a number: {value!r}')
+    return to_number
+
+
+def _boolean_converter(options):
+    def to_boolean(value):
+        if isinstance(value, bool):
+            return value
+        return str(value).strip().lower() in TRUE_VALUES
+    return to_boolean
+
+
+def _date_converter(options):
+    # Formats are always tried in the order of DATE_FORMATS, so an ambiguous
+    # value such as 03/04/2024 parses the same way in every row and thread
+    def to_date(value):
+        if not isinstance(value, str):
+            raise CoercionError(f'Not a date: {value!r}')
+        return parse_date(value)
+    return to_date
+
+
+def parse_date(value):
+    """ISO date of a text in one of ``DATE_FORMATS``; raises CoercionError otherwise"""
+    text = value.strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    raise CoercionError(f'Not a date: {value!r}')
+
+
+def _url_converter(options):
+    def to_url(value):
+        value = str(value).strip()
+        if not value.startswith(('http://', 'https://')):
+            return f'https://{value}'
+        return value
+    return to_url
+
+
+def _select_converter(options):
+    # Match option spellings case-insensitively so "active" is stored as "Active"
+    canonical = {str(option).lower(): option for option in options or []}
+
+    def to_select(value):
+        value = str(value).strip()
+        return canonical.get(value.lower(), value)
+    return to_select
+
+
+def _multi_select_converter(options):
+    to_select = _select_converter(options)
+
+    def to_multi_select(value):
+        if isinstance(value, (list, tuple)):
+            tags = value
+        else:
+            tags = str(value).split(',')
+        return [to_select(tag) for tag in tags if str(tag).strip()]
+    return to_multi_select
+
+
+def _json_converter(options):
+    def to_json(value):
+        if not isinstance(value, str):
+            return value
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            raise CoercionError(f'Not valid JSON: {value!r}')
+    return to_json
+
+
+def _text_converter(options):
+    def to_text(value):
+        return value if isinstance(value, (str, int, float, bool, dict, list)) else str(value)
+    return to_text
+
+
+CONVERTER_FACTORIES = {
+    'number': _number_converter,
+    'boolean': _boolean_converter,
+    'date': _date_converter,
+    'url': _url_converter,
+    'select': _select_converter,
+    'multi_select': _multi_select_converter,
+    'json': _json_converter,
+    'text': _text_converter,
+}
+
+
+def build_converter(column_type, options=None):
+    """Build a converter function for a column type.
+
+    Blank values (None or '') convert to the type's blank value. Values that do
+    not fit the type raise CoercionError.
+    """
+    convert = CONVERTER_FACTORIES.get(column_type, _text_converter)(options)
+
+    def converter(value):
+        if value is None or value == '':
+            return blank_value(column_type)
+        return convert(value)
+    return converter
+
+
+class RowCoercer:
+    """
+    Coerces row data against a fixed set of list columns.
+
+    Converters are built once when the coercer is created, so a coercer should
+    be created once per request or import and reused for every row. Input keys
+    are looked up with ``key`` ('name' or 'pk'); output rows are always keyed
+    by column name. Failures are counted per column in ``failure_counts`` and
+    the first ``MAX_FAILURE_SAMPLES`` of each column are kept in ``failures``.
+    """
+
+    def __init__(self, columns, key='name'):
+        self.columns = {}
+        self.converters = {}
+        for column in columns:
+            lookup = getattr(column, key)
+            self.columns[lookup] = column
+            self.converters[lookup] = build_converter(column.column_type, column.options)
+        self.failures = []
+        self.failure_counts = Counter()
+
+    @property
+    def failure_count(self):
+        """Total number of values that could not be converted"""
+        return sum(self.failure_counts.values())
+
+    def _record_failure(self, column_name, value, error):
+        self.failure_counts[column_name] += 1
+        if self.failure_counts[column_name] <= MAX_FAILURE_SAMPLES:
+            self.failures.append(CoercionFailure(column_name, value, str(error)))
+
+    def __contains__(self, key):
+        return key in self.converters
+
+    def coerce(self, key, value):
+        """Coerce a single value, keeping it unchanged if it does not fit"""
+        try:
+            return self.converters[key](value)
+        except CoercionError as e:
+            self._record_failure(self.columns[key].name, value, e)
+            return value
+
+    def coerce_values(self, key, values):
+        """Coerce a batch of values for one column"""
+        converter = self.converters[key]
+        column_name = self.columns[key].name
+        coerced = []
+        for value in values:
+            try:
+                coerced.append(converter(value))
+            except CoercionError as e:
+                self._record_failure(column_name, value, e)
+                coerced.append(value)
+        return coerced
+
+    def coerce_row(self, data, fill_blanks=False):
+        """Coerce a row dict, dropping keys that match no column.
+
+        With ``fill_blanks`` columns missing from ``data`` are added with the
+        column type's blank value.
+        """
+        row = {}
+        for key, column in self.columns.items():
+            if key in data:
+                row[column.name] = self.coerce(key, data[key])
+            elif fill_blanks:
+                row[column.name] = blank_value(column.column_type)
+        return row
+
+    def coerce_rows(self, rows, fill_blanks=False):
+        """Coerce a batch of row dicts"""
+        return [self.coerce_row(data, fill_blanks=fill_blanks) for data in rows]
+
+    def blank_row(self):
+        """Row with the blank value for every column"""
+        return {column.name: blank_value(column.column_type) for column in self.columns.values()}
+
+    def failure_report(self, limit=10):
+        """Summary of coercion failures suitable for a JSON response"""
+        return {
+            'count': self.failure_count,
+            'columns': dict(self.failure_counts),
+            'samples': [
+                {'column': failure.column, 'value': failure.value, 'error': failure.error}
+                for failure in self.failures[:limit]
+            ],
+        }
@@ -0,0 +1,54 @@
+"""
+Value patterns for list column types.
+
+Patterns are written in the regex subset shared by Python's ``re`` module and
+PostgreSQL's ``~*`` operator, so one definition validates values in the
+database and classifies them in Python. Match them case-insensitively.
+"""
+
+import re
+
+NUMBER_PATTERN = r'^\s*[-+]?([0-9]+(\.[0-9]*)?|\.[0-9]+)([eE][-+]?[0-9]+)?\s*$'
+
+BOOLEAN_PATTERN = r'^\s*(true|false|yes|no|1|0)\s*$'
+
+_MONTH = r'(0?[1-9]|1[0-2])'
+_DAY = r'(0?[1-9]|[12][0-9]|3[01])'
+_MONTH_NAME = r'(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)'
+_TIME = r'([01]?[0-9]|2[0-3]):[0-5][0-9]:[0-5][0-9]'
+
+# Covers the date formats parsed by column coercion: ISO dates and datetimes,
+# m/d/Y and d/m/Y, "Jan 05, 2024" and "05 Jan 2024". Months and days are
+# range-checked; whether a day exists in its month is left to the parser.
+DATE_PATTERN = (
+    r'^\s*('
+    rf'[0-9]{{4}}-{_MONTH}-{_DAY}( {_TIME}|T{_TIME}Z?)?'
+    rf'|({_MONTH}/{_DAY}|{_DAY}/{_MONTH})/[0-9]{{4}}'
+    rf'|{_MONTH_NAME} {_DAY}, [0-9]{{4}}'
+    rf'|{_DAY} {_MONTH_NAME} [0-9]{{4}}'
+    r')\s*$'
+)
+
+# Dates matching DATE_PATTERN that may still not exist: days 29 to 31, which
+# some months lack, and year 0
+UNCHECKED_DATE_PATTERN = r'(^|[^0-9])(29|30|31|0000)([^0-9]|$)'
+
+# Dates as stored by column coercion. Only these are cast to dates in SQL,
+# since Postgres would read m/d/Y and d/m/Y ambiguously.
+ISO_DATE_PATTERN = r'^\s*[0-9]{4}-[0-9]{2}-[0-9]{2}'
+
+URL_PATTERN = r'^\s*[a-z][a-z0-9+.-]*://[^/\s?#]+'
+
+# Column types whose values must match a pattern. Other types (text, json,
+# select, multi_select) accept any value.
+TYPE_PATTERNS = {
+    'number': NUMBER_PATTERN,
+    'boolean': BOOLEAN_PATTERN,
+    'date': DATE_PATTERN,
+    'url': URL_PATTERN,
+}
+
+COMPILED_TYPE_PATTERNS = {
+    column_type: re.compile(pattern, re.IGNORECASE)
+    for column_type, pattern in TYPE_PATTERNS.items()
+}
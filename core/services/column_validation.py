@@ -0,0 +1,95 @@
+import logging
+from django.db.models import Count, Q
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.functions import Trim
+from ..models import ListRow
+from .coercion import CoercionError, parse_date
+from .column_types import TYPE_PATTERNS, UNCHECKED_DATE_PATTERN
+from .type_inference import infer_type
+
+logger = logging.getLogger(__name__)
+
+# Number of rows checked when a caller asks for the fast, sampled validation
+TYPE_CHANGE_SAMPLE_SIZE = 1000
+
+
+def column_values(list_obj, column, sample_size=None):
+    """Queryset of the trimmed, non-empty text values stored for a column.
+
+    With ``sample_size`` only that many rows of the list are considered.
+    """
+    rows = ListRow.objects.filter(user_list=list_obj)
+    if sample_size:
+        rows = ListRow.objects.filter(pk__in=rows.order_by().values('pk')[:sample_size])
+
+    return (
+        rows.order_by()
+        .annotate(value=Trim(KeyTextTransform(column.name, 'data')))
+        .exclude(value__isnull=True)
+        .exclude(value='')
+    )
+
+
+def unparsable_dates(values, pattern):
+    """Values matching the date pattern that the coercer still cannot parse.
+
+    Only values with a day the pattern cannot rule out are read, and parsed
+    with the coercer's own ``parse_date``.
+    """
+    unchecked = values.filter(value__iregex=pattern, value__regex=UNCHECKED_DATE_PATTERN)
+    conflicts = []
+    for value in unchecked.values_list('value', flat=True).iterator():
+        try:
+            parse_date(value)
+        except CoercionError:
+            conflicts.append(value)
+    return conflicts
+
+
+def check_type_change(list_obj, column, new_type, sample_size=None):
+    """Check in the database whether a column's values fit ``new_type``.
+
+    Values are matched against the type pattern with a single aggregate query,
+    followed by a LIMIT query for a few conflicting values when there are any.
+    Dates the pattern cannot fully check are parsed as the coercer would.
+    """
+    values = column_values(list_obj, column, sample_size)
+    pattern = TYPE_PATTERNS.get(new_type)
+
+    if pattern is None:
+        counts = values.aggregate(total=Count('pk'))
+        counts['invalid'] = 0
+    else:
+        counts = values.aggregate(
+            total=Count('pk'),
+            invalid=Count('pk', filter=~Q(value__iregex=pattern)),
+        )
+    unparsable = unparsable_dates(values, pattern) if new_type == 'date' else []
+    counts['invalid'] += len(unparsable)
+
+    result = {
+        'checked_count': counts['total'],
+        'conflict_count': counts['invalid'],
+        'sampled': bool(sample_size),
+        'sample_conflicts': [],
+    }
+
+    if not counts['total']:
+        result.update({'allowed': True, 'message': 'Column is empty - any type allowed'})
+        return result
+
+    if counts['invalid']:
+        conflicts = unparsable[:3] + list(values.exclude(value__iregex=pattern).values_list('value', flat=True)[:3])
+        scope = 'sampled values' if sample_size else 'values'
+        # Suggest the type the stored values do fit
+        stored = values.values_list('value', flat=True)[:TYPE_CHANGE_SAMPLE_SIZE]
+        result.update({
+            'allowed': False,
+            'message': f'Cannot change to {new_type}: {counts["invalid"]} {scope} would be incompatible',
+            'sample_conflicts': conflicts[:3],
+            'suggested_type': infer_type(stored.iterator()),
+        })
+        return result
+
+    result.update({'allowed': True, 'message': 'Type change is safe'})
+    return result
@@ -0,0 +1,180 @@
+"""
+Negotiated compression of HTTP responses.
+
+``negotiate`` picks the encoding to use from a request's Accept-Encoding
+header: zstd, then brotli, then gzip, where zstd and brotli are only offered
+when their optional packages (``zstandard`` and ``brotli``, the
+``compression`` extra) are installed.
+Encoders are incremental, so streamed exports are compressed chunk by chunk
+and keep streaming, and cached export files can be compressed once and
+served precompressed afterwards.
+"""
+
+import zlib
+from django.conf import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Responses with fewer bytes than this are sent uncompressed
+COMPRESSION_MIN_SIZE = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+
+# Content types worth compressing; a trailing slash matches a whole family
+COMPRESSIBLE_TYPES = (
+    'text/',
+    'application/json',
+    'application/x-ndjson',
+    'application/javascript',
+    'image/svg+xml',
+    'application/vnd.apache.arrow.file',
+    'application/vnd.sqlite3',
+)
+
+# Encodings in order of preference when the client accepts several equally
+ENCODINGS = ('zstd', 'br', 'gzip')
+
+# File name suffixes of precompressed files
+SUFFIXES = {'zstd': 'zst', 'br': 'br', 'gzip': 'gz'}
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ZSTD_LEVEL = 3
+
+
+class GzipEncoder:
+    def __init__(self):
+        self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class ZstdEncoder:
+    def __init__(self):
+        self.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+ENCODERS = {'zstd': ZstdEncoder, 'br': BrotliEncoder, 'gzip': GzipEncoder}
+
+
+def available_encodings():
+    """Encodings the installed packages support, in order of preference"""
+    installed = {'zstd': zstandard is not None, 'br': brotli is not None, 'gzip': True}
+    return [encoding for encoding in ENCODINGS if installed[encoding]]
+
+
+def negotiate(accept_encoding):
+    """Encoding to use for an Accept-Encoding header, or None to send identity"""
+    weights = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name] = weight
+
+    best, best_weight = None, 0.0
+    for encoding in available_encodings():
+        weight = weights.get(encoding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def parse_media_type(content_type):
+    return (content_type or '').split(';')[0].strip().lower()
+
+
+def is_html(content_type):
+    return parse_media_type(content_type) == 'text/html'
+
+
+def is_compressible(content_type):
+    media_type = parse_media_type(content_type)
+    return any(
+        media_type.startswith(candidate) if candidate.endswith('/') else media_type == candidate
+        for candidate in COMPRESSIBLE_TYPES
+    )
+
+
+def compress_bytes(encoding, data):
+    encoder = ENCODERS[encoding]()
+    return encoder.compress(data) + encoder.finish()
+
+
+def compress_chunks(encoding, chunks, flush=True):
+    """Compress an iterable of byte chunks incrementally.
+
+    With ``flush`` every chunk is sent as soon as it is compressed, for
+    responses generated piece by piece; without it the encoder decides.
+    """
+    encoder = ENCODERS[encoding]()
+    for chunk in chunks:
+        data = encoder.compress(chunk)
+        if flush:
+            data += encoder.flush()
+        if data:
+            yield data
+    yield encoder.finish()
+
+
+async def acompress_chunks(encoding, chunks, flush=True):
+    """``compress_chunks`` for an async iterable"""
+    encoder = ENCODERS[encoding]()
+    async for chunk in chunks:
+        data = encoder.compress(chunk)
+        if flush:
+            data += encoder.flush()
+        if data:
+            yield data
+    yield encoder.finish()
+
+
+def compress_file(encoding, source, target, block_size=256 * 1024):
+    """Write the compressed content of the open file ``source`` to ``target``"""
+    blocks = iter(lambda: source.read(block_size), b'')
+    for data in compress_chunks(encoding, blocks, flush=False):
+        target.write(data)
@@ -0,0 +1,239 @@
+"""
+Version keys and on-disk cache for exports.
+
+Every export is identified by an ``ExportKey``: an ETag computed from the
+state of the exported data (a list's version, row count, latest row update
+and columns; a run's extracted or scraped payload, hashed by Postgres) and,
+for lists, a Last-Modified time. Computing a key costs a couple of small
+queries instead of reading and serializing the data.
+
+Rendered exports are stored under ``EXPORT_CACHE_DIR`` named by their key.
+Text exports are written to the cache while they stream to the client and
+only published once complete; a newer file for the same export replaces the
+older ones. Compressed copies of a cached file are made the first time a
+client accepts an encoding and are served as they are from then on.
+
+The cache holds at most ``EXPORT_CACHE_MAX_BYTES``. Serving a file marks it
+as used by touching its modification time; whenever a file is added, the
+least recently used files are deleted until the cache fits again.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from collections import namedtuple
+from pathlib import Path
+from django.conf import settings
+from django.db.models import Count, Max, TextField
+from django.db.models.functions import Cast, MD5
+from ..models import Run
+from .compression import SUFFIXES, compress_file
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CACHE_DIR = Path(getattr(settings, 'EXPORT_CACHE_DIR', Path(tempfile.gettempdir()) / 'vibe-export-cache'))
+
+# Total size of the cached files, compressed copies included
+EXPORT_CACHE_MAX_BYTES = getattr(settings, 'EXPORT_CACHE_MAX_BYTES', 2 * 1024 ** 3)
+
+# Bump when the content of an export format changes to stop serving old files
+EXPORT_CACHE_VERSION = 3
+
+# Run fields each kind of run export is made from: extracted entities, the
+# raw scraped data, the scraped posts flattened to a table and a snapshot of both
+RUN_SOURCE_FIELDS = {
+    'extracted': ('extracted',),
+    'scraped': ('scraped',),
+    'posts': ('scraped',),
+    'snapshot': ('extracted', 'scraped'),
+}
+
+ExportKey = namedtuple('ExportKey', ['prefix', 'etag', 'last_modified', 'extension'])
+
+
+def _digest(state):
+    return hashlib.md5(json.dumps(state, default=str).encode('utf-8')).hexdigest()
+
+
+def list_export_key(list_obj, extension, query=None):
+    """Key of a list export; changes with any change to the list's rows or columns.
+
+    Exports filtered or sorted by a ``query`` are cached separately from the full export.
+    """
+    rows = list_obj.rows.aggregate(count=Count('pk'), modified=Max('updated_at'))
+    changed = list_obj.changes.aggregate(latest=Max('created_at'))['latest']
+    columns = list(list_obj.columns.order_by('order').values_list('name', 'column_type', 'required'))
+    etag = _digest([
+        EXPORT_CACHE_VERSION, extension, list_obj.version, rows['count'], rows['modified'],
+        list_obj.name, list_obj.description, columns, query or None,
+    ])
+    last_modified = max(value for value in (list_obj.created_at, rows['modified'], changed) if value)
+    prefix = f'list-{list_obj.pk}'
+    if query:
+        prefix += '_' + _digest(query)[:12]
+    return ExportKey(prefix, etag, last_modified, extension)
+
+
+def run_export_key(run, source, extension, columns=None):
+    """Key of a run export of ``source``, one of ``RUN_SOURCE_FIELDS``.
+
+    Exports of a selection of ``columns`` are cached separately from the full export.
+    """
+    fingerprints = (
+        Run.objects.filter(pk=run.pk)
+        .values_list(*(MD5(Cast(field, TextField())) for field in RUN_SOURCE_FIELDS[source]))
+        .get()
+    )
+    etag = _digest([EXPORT_CACHE_VERSION, extension, run.pk, run.created_at, columns or None, *fingerprints])
+    prefix = f'run-{run.pk}-{source}'
+    if columns:
+        prefix += '_' + _digest(columns)[:12]
+    return ExportKey(prefix, etag, None, extension)
+
+
+def cache_path(key):
+    return EXPORT_CACHE_DIR / f'{key.prefix}-{key.etag}.{key.extension}'
+
+
+def _open_used(path):
+    """Open a cached file for reading and mark it as recently used"""
+    file = open(path, 'rb')
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        # Evicted since it was opened; the open file stays readable
+        pass
+    return file
+
+
+def cached_file(key):
+    """Open cached export for a key, or None"""
+    try:
+        return _open_used(cache_path(key))
+    except FileNotFoundError:
+        return None
+
+
+def compressed_file(key, encoding):
+    """Open the cached export compressed with ``encoding``, or None if it is not cached.
+
+    The compressed copy is written next to the cached file on first use.
+    """
+    path = cache_path(key)
+    variant = path.with_name(f'{path.name}.{SUFFIXES[encoding]}')
+    try:
+        return _open_used(variant)
+    except FileNotFoundError:
+        pass
+    try:
+        source = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+
+    output, part_name = _part_file()
+    try:
+        with source, output:
+            compress_file(encoding, source, output)
+        os.replace(part_name, variant)
+    except BaseException:
+        Path(part_name).unlink(missing_ok=True)
+        raise
+    evict(keep=variant)
+    return open(variant, 'rb')
+
+
+def _part_file():
+    EXPORT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    descriptor, name = tempfile.mkstemp(dir=EXPORT_CACHE_DIR, suffix='.part')
+    return os.fdopen(descriptor, 'wb'), name
+
+
+def _publish(part_name, key):
+    """Move a finished file into place and drop older versions of the export"""
+    path = cache_path(key)
+    os.replace(part_name, path)
+    for stale in EXPORT_CACHE_DIR.glob(f'{key.prefix}-*.{key.extension}*'):
+        # Compressed copies of the current file stay
+        if stale != path and not stale.name.startswith(path.name + '.'):
+            stale.unlink(missing_ok=True)
+    evict(keep=path)
+
+
+def evict(keep=None):
+    """Delete the least recently used cached files until the cache fits.
+
+    ``keep``, the file just added, and files being written are left alone.
+    Files still open for a download stay readable after they are deleted.
+    """
+    files = []
+    total = 0
+    for path in EXPORT_CACHE_DIR.iterdir():
+        if path.suffix == '.part':
+            continue
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        total += stat.st_size
+        if path != keep:
+            files.append((stat.st_mtime, stat.st_size, path))
+    if total <= EXPORT_CACHE_MAX_BYTES:
+        return
+
+    for _, size, path in sorted(files, key=lambda item: item[0]):
+        path.unlink(missing_ok=True)
+        total -= size
+        if total <= EXPORT_CACHE_MAX_BYTES:
+            break
+
+
+def tee_to_cache(chunks, key):
+    """Yield encoded chunks while writing them to the cache.
+
+    The file is published only when every chunk was sent; an interrupted
+    download leaves nothing behind.
+    """
+    output, part_name = _part_file()
+    published = False
+    try:
+        with output:
+            for chunk in chunks:
+                data = chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+                output.write(data)
+                yield data
+        _publish(part_name, key)
+        published = True
+    finally:
+        if not published:
+            Path(part_name).unlink(missing_ok=True)
+
+
+def write_to_cache(write, key):
+    """Write an export with ``write(file)`` into the cache and open it for reading"""
+    output, part_name = _part_file()
+    try:
+        with output:
+            write(output)
+        _publish(part_name, key)
+    except BaseException:
+        Path(part_name).unlink(missing_ok=True)
+        raise
+    return open(cache_path(key), 'rb')
+
+
+def build_in_cache(build, key):
+    """Build an export with ``build(path)`` into the cache and open it for reading.
+
+    For exports written by libraries that need a file name rather than a file.
+    """
+    output, part_name = _part_file()
+    output.close()
+    try:
+        build(part_name)
+        _publish(part_name, key)
+    except BaseException:
+        Path(part_name).unlink(missing_ok=True)
+        raise
+    return open(cache_path(key), 'rb')
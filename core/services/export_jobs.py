@@ -0,0 +1,225 @@
+"""
+Background export jobs.
+
+Exports too large for a request are queued as ``ExportJob`` rows. The
+``run_export_worker`` management command claims them and writes the export
+chunk by chunk, optionally gzip-compressed, to ``EXPORT_FILES_DIR``, or
+builds a SQLite snapshot there. The file gets its final name only once it is
+complete and is then downloaded through an endpoint that honours HTTP Range
+requests, so an interrupted download resumes where it stopped. Finished
+files are removed after ``EXPORT_FILE_TTL``.
+"""
+
+import gzip
+import logging
+import os
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from ..models import ExportJob
+from .exports import (
+    json_stream, list_csv_stream, list_json_document, list_json_rows, ndjson_stream,
+    post_records, posts_csv_stream, run_csv_stream, scraped_records, write_list_sqlite, write_run_sqlite,
+)
+from .run_profile import get_profile, parse_extracted_data
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FILES_DIR = Path(getattr(settings, 'EXPORT_FILES_DIR', settings.BASE_DIR / 'exports'))
+
+# Running jobs not updated for this long are assumed abandoned and restarted
+STALE_AFTER = timedelta(seconds=getattr(settings, 'EXPORT_JOB_STALE_SECONDS', 600))
+
+# Finished export files are deleted after this long
+EXPORT_FILE_TTL = timedelta(seconds=getattr(settings, 'EXPORT_FILE_TTL_SECONDS', 24 * 3600))
+
+# Progress is saved after every this many bytes
+PROGRESS_BYTES = 8 * 1024 * 1024
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'sqlite': 'application/vnd.sqlite3',
+}
+
+
+def enqueue_export(user, export_format, user_list=None, run=None, source='extracted', compress=False):
+    """Create a pending export job for a list or a run, raising ValueError for bad options"""
+    if export_format not in CONTENT_TYPES:
+        raise ValueError(f'Unknown export format: {export_format}')
+    if run is not None and source not in ('extracted', 'scraped', 'posts'):
+        raise ValueError(f'Unknown run data: {source}')
+    if run is not None and source == 'scraped' and export_format == 'csv':
+        raise ValueError('Scraped data can be exported as JSON or NDJSON only')
+    if run is not None and source == 'posts' and export_format == 'json':
+        raise ValueError('Scraped posts can be exported as CSV or NDJSON only')
+    if export_format == 'sqlite':
+        if compress:
+            raise ValueError('SQLite exports are not compressed')
+        # A run snapshot holds both its entities and its scraped posts
+        source = 'snapshot' if run is not None else source
+    return ExportJob.objects.create(
+        user=user, user_list=user_list, run=run, source=source,
+        export_format=export_format, compress=compress,
+    )
+
+
+def claim_next_job():
+    """Mark the oldest pending or abandoned job as running and return it"""
+    stale = timezone.now() - STALE_AFTER
+    with transaction.atomic():
+        job = (
+            ExportJob.objects.select_for_update(skip_locked=True)
+            .filter(Q(status='pending') | Q(status='running', updated_at__lt=stale))
+            .order_by('created_at')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = 'running'
+        job.started_at = timezone.now()
+        job.bytes_written = 0
+        job.save(update_fields=['status', 'started_at', 'bytes_written', 'updated_at'])
+    return job
+
+
+def export_name(job):
+    """Download file name of a job's export"""
+    if job.user_list_id:
+        base = job.user_list.name
+    else:
+        base = f'run_{job.run_id}_{job.source}'
+    name = f'{base}.{job.export_format}'
+    return f'{name}.gz' if job.compress else name
+
+
+def export_chunks(job):
+    """Text chunks of a job's export"""
+    if job.user_list_id:
+        list_obj = job.user_list
+        if job.export_format == 'csv':
+            return list_csv_stream(list_obj)
+        if job.export_format == 'ndjson':
+            return ndjson_stream(list_json_rows(list_obj))
+        return json_stream(list_json_document(list_obj))
+
+    run = job.run
+    if job.source == 'posts':
+        if job.export_format == 'csv':
+            return posts_csv_stream(run.scraped)
+        return ndjson_stream(post_records(run.scraped))
+    if job.source == 'scraped':
+        if job.export_format == 'ndjson':
+            return ndjson_stream(scraped_records(run.scraped))
+        return json_stream({'run_id': run.pk, 'created_at': run.created_at.isoformat(), 'scraped_data': run.scraped})
+
+    entities = parse_extracted_data(run.extracted)
+    if not entities:
+        raise ValueError('No extracted data available for export')
+    if job.export_format == 'csv':
+        fields = [field['name'] for field in get_profile(run)['fields']]
+        return run_csv_stream(entities, fields)
+    if job.export_format == 'ndjson':
+        return ndjson_stream(entities)
+    return json_stream({'run_id': run.pk, 'created_at': run.created_at.isoformat(), 'entities': entities})
+
+
+def job_path(job):
+    return EXPORT_FILES_DIR / job.file_name
+
+
+def write_text(job, descriptor):
+    """Write a text export to an open file descriptor, saving progress as it grows"""
+    with os.fdopen(descriptor, 'wb') as raw:
+        output = gzip.GzipFile(fileobj=raw, mode='wb') if job.compress else raw
+        reported = 0
+        for chunk in export_chunks(job):
+            output.write(chunk.encode('utf-8'))
+            job.bytes_written = raw.tell()
+            if job.bytes_written - reported >= PROGRESS_BYTES:
+                reported = job.bytes_written
+                job.save(update_fields=['bytes_written', 'updated_at'])
+        if job.compress:
+            output.close()
+        job.bytes_written = raw.tell()
+
+
+def write_sqlite(job, path):
+    """Build a SQLite snapshot of the job's list or run at ``path``"""
+    if job.user_list_id:
+        write_list_sqlite(job.user_list, path)
+    else:
+        entities = parse_extracted_data(job.run.extracted)
+        write_run_sqlite(job.run, entities, get_profile(job.run), path)
+    job.bytes_written = os.path.getsize(path)
+
+
+def run_job(job):
+    """Write a claimed job's export to its file"""
+    EXPORT_FILES_DIR.mkdir(parents=True, exist_ok=True)
+    descriptor, part_name = tempfile.mkstemp(dir=EXPORT_FILES_DIR, suffix='.part')
+    try:
+        if job.export_format == 'sqlite':
+            os.close(descriptor)
+            write_sqlite(job, part_name)
+        else:
+            write_text(job, descriptor)
+
+        job.file_name = f'export-{job.pk}.{job.export_format}' + ('.gz' if job.compress else '')
+        os.replace(part_name, job_path(job))
+    except Exception as e:
+        Path(part_name).unlink(missing_ok=True)
+        logger.exception(f"Export job {job.pk} failed")
+        job.status = 'failed'
+        job.error = str(e)
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at', 'updated_at'])
+        return job
+
+    job.status = 'completed'
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'bytes_written', 'file_name', 'finished_at', 'updated_at'])
+    return job
+
+
+def purge_expired():
+    """Delete export files older than ``EXPORT_FILE_TTL``; returns the number deleted"""
+    expired = ExportJob.objects.filter(status='completed', finished_at__lt=timezone.now() - EXPORT_FILE_TTL).exclude(file_name='')
+    count = 0
+    for job in expired:
+        job_path(job).unlink(missing_ok=True)
+        job.file_name = ''
+        job.save(update_fields=['file_name', 'updated_at'])
+        count += 1
+    return count
+
+
+def read_range(path, start, end, block_size=64 * 1024):
+    """Yield bytes ``start`` to ``end`` (inclusive) of a file"""
+    remaining = end - start + 1
+    with open(path, 'rb') as source:
+        source.seek(start)
+        while remaining > 0:
+            block = source.read(min(block_size, remaining))
+            if not block:
+                return
+            remaining -= len(block)
+            yield block
+
+
+def job_status(job):
+    """State of an export job for the status endpoint"""
+    return {
+        'id': job.pk,
+        'status': job.status,
+        'format': job.export_format,
+        'compress': job.compress,
+        'bytes_written': job.bytes_written,
+        'error': job.error,
+        'download_url': f"/exports/{job.pk}/download/" if job.status == 'completed' and job.file_name else None,
+    }
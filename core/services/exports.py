@@ -0,0 +1,589 @@
+"""
+Streaming exports of lists and runs.
+
+Exports are produced as generators of text chunks for ``StreamingHttpResponse``.
+List rows are read from the database with ``.iterator()`` in chunks of
+``EXPORT_CHUNK_SIZE`` and written through an incremental csv writer, so a
+worker holds one chunk at a time and the first bytes leave before the last
+row is read.
+
+Run CSV exports take their header from the run's schema profile, which lists
+every field of every entity in first-seen order, so entities with different
+fields lose nothing and the rows still stream in a single pass. A subset and
+order of the fields can be selected.
+
+JSON exports come in two forms: NDJSON, one record per line, and a JSON
+document encoded incrementally by ``json_stream``, which writes the outer
+objects and arrays piece by piece and each record with ``json.dumps``.
+
+Scraped posts are exported as a table with the same columns for every
+platform: ``POST_FIELDS`` maps each column to where the platform's scraper
+keeps the value, so captions, engagement counts, URLs and timestamps come out
+of the nested Instagram, TikTok and YouTube items without further scripts.
+
+Parquet and Arrow IPC exports need pyarrow, a main dependency; installs
+without it answer those formats with 501. They are typed by the list's
+column types, or by the run's schema profile, and written in record batches
+of ``COLUMNAR_BATCH_ROWS`` rows to a file that is then streamed.
+
+SQLite snapshots are self-contained database files typed the same way, for
+ad-hoc queries offline: a list becomes a ``rows`` table indexed on its dedupe
+columns, a run an ``entities`` and a ``posts`` table. Rows are inserted with
+``executemany`` in batches of ``EXPORT_CHUNK_SIZE``.
+"""
+
+import csv
+import io
+import json
+import sqlite3
+from datetime import date
+from types import GeneratorType
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from .coercion import TRUE_VALUES
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Rows fetched from the database and written to the response per chunk
+EXPORT_CHUNK_SIZE = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+
+# Bytes of JSON text collected before a chunk is sent
+JSON_CHUNK_BYTES = 64 * 1024
+
+# Nesting depth up to which json_stream writes containers piece by piece
+JSON_STREAM_DEPTH = 3
+
+JSON_INDENT = '  '
+
+# Rows per Parquet row group and Arrow record batch
+COLUMNAR_BATCH_ROWS = getattr(settings, 'COLUMNAR_EXPORT_BATCH_ROWS', 50000)
+
+COLUMNAR_FORMATS = {
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.file', 'arrow'),
+}
+
+
+def csv_stream(header, rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield CSV text for a header and an iterable of rows, a chunk at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for index, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if index % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def list_cell(value):
+    """Text of a list value in a CSV cell"""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+
+def list_csv_rows(list_obj, columns, rows=None):
+    """CSV rows of a list, read from the database in chunks"""
+    names = [column.name for column in columns]
+    rows = (list_obj.rows.all() if rows is None else rows).values_list('pk', 'data', 'created_at').iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    for pk, data, created_at in rows:
+        data = data or {}
+        yield [pk, *(list_cell(data.get(name, '')) for name in names), created_at.isoformat()]
+
+
+def list_csv_stream(list_obj, rows=None):
+    """CSV export of a list: ID, one column per list column, Created At.
+
+    ``rows`` is a queryset of the list's rows to export, all of them by default.
+    """
+    columns = list(list_obj.columns.all().order_by('order'))
+    header = ['ID'] + [column.name for column in columns] + ['Created At']
+    return csv_stream(header, list_csv_rows(list_obj, columns, rows))
+
+
+def entity_cell(value):
+    """Text of an extracted value in a CSV cell"""
+    if isinstance(value, list):
+        return ', '.join(str(item) for item in value)
+    if isinstance(value, dict):
+        return json.dumps(value)
+    return str(value)
+
+
+def select_fields(names, selected=None):
+    """Field names to export: ``selected`` in its order, or all of ``names``.
+
+    Raises ValueError naming any selected field that does not exist.
+    """
+    if not selected:
+        return list(names)
+    unknown = [name for name in selected if name not in names]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return list(dict.fromkeys(selected))
+
+
+def run_csv_stream(entities, headers):
+    """CSV export of run entities with ``headers`` as columns"""
+    rows = (
+        [entity_cell(entity.get(header, '')) for header in headers]
+        for entity in entities if isinstance(entity, dict)
+    )
+    return csv_stream(headers, rows)
+
+
+# -------------------------------------------------------------------------
+# JSON and NDJSON
+# -------------------------------------------------------------------------
+def buffered(pieces, size=JSON_CHUNK_BYTES):
+    """Join small text pieces into chunks of about ``size`` characters"""
+    chunk = []
+    length = 0
+    for piece in pieces:
+        chunk.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield ''.join(chunk)
+            chunk = []
+            length = 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+def dumps(value, level=0):
+    """``json.dumps`` with two-space indent, nested at ``level``"""
+    text = json.dumps(value, indent=2, cls=DjangoJSONEncoder)
+    return text.replace('\n', '\n' + JSON_INDENT * level) if level else text
+
+
+def _json_pieces(value, level):
+    if level >= JSON_STREAM_DEPTH or not isinstance(value, (dict, list, GeneratorType)):
+        yield dumps(value, level)
+        return
+
+    inner = JSON_INDENT * (level + 1)
+    if isinstance(value, dict):
+        opening, closing = '{', '}'
+        items = ((f'{inner}{json.dumps(key)}: ', item) for key, item in value.items())
+    else:
+        opening, closing = '[', ']'
+        items = ((inner, item) for item in value)
+
+    empty = True
+    for prefix, item in items:
+        yield (opening + '\n' if empty else ',\n') + prefix
+        empty = False
+        yield from _json_pieces(item, level + 1)
+    yield opening + closing if empty else '\n' + JSON_INDENT * level + closing
+
+
+def json_stream(value):
+    """Yield the indented JSON text of ``value`` in chunks.
+
+    Dicts, lists and generators down to ``JSON_STREAM_DEPTH`` are written
+    incrementally; a generator is encoded as an array and consumed lazily.
+    """
+    return buffered(_json_pieces(value, 0))
+
+
+def ndjson_stream(records):
+    """Yield records as newline-delimited JSON"""
+    return buffered(json.dumps(record, cls=DjangoJSONEncoder) + '\n' for record in records)
+
+
+def list_json_rows(list_obj, rows=None):
+    """Rows of a list as export records, read from the database in chunks"""
+    rows = (list_obj.rows.all() if rows is None else rows).values_list('pk', 'data', 'created_at', 'updated_at').iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    for pk, data, created_at, updated_at in rows:
+        yield {'id': pk, 'data': data, 'created_at': created_at.isoformat(), 'updated_at': updated_at.isoformat()}
+
+
+def list_json_document(list_obj, rows=None):
+    """JSON export of a list with its columns; rows are a generator"""
+    return {
+        'list': {
+            'id': list_obj.pk,
+            'name': list_obj.name,
+            'description': list_obj.description,
+            'created_at': list_obj.created_at.isoformat()
+        },
+        'columns': [
+            {'name': column.name, 'type': column.column_type, 'required': column.required}
+            for column in list_obj.columns.all().order_by('order')
+        ],
+        'rows': list_json_rows(list_obj, rows),
+    }
+
+
+def scraped_records(scraped):
+    """Scraped items one by one, tagged with their platform when grouped by platform"""
+    if isinstance(scraped, dict):
+        for platform, items in scraped.items():
+            if isinstance(items, list):
+                for item in items:
+                    yield {'platform': platform, 'data': item}
+            else:
+                yield {'platform': platform, 'data': items}
+    elif isinstance(scraped, list):
+        yield from scraped
+    else:
+        yield scraped
+
+
+# -------------------------------------------------------------------------
+# Scraped posts
+# -------------------------------------------------------------------------
+POST_COLUMNS = (
+    'platform', 'id', 'url', 'author', 'timestamp', 'title', 'caption',
+    'likes', 'comments', 'views', 'shares', 'hashtags', 'media_url', 'duration',
+)
+
+# Dotted paths of the post columns in the items of each platform's scraper
+# (Apify's Instagram Scraper, TikTok Data Extractor and YouTube Scraper, see
+# n8n/v2/interfaces). A path step applied to a list is applied to each of its
+# items. Bump EXPORT_CACHE_VERSION in export_cache when changing a path.
+POST_FIELDS = {
+    'instagram': {
+        'id': 'id',
+        'url': 'url',
+        'author': 'ownerUsername',
+        'timestamp': 'timestamp',
+        'caption': 'caption',
+        'likes': 'likesCount',
+        'comments': 'commentsCount',
+        'views': 'videoViewCount',
+        'hashtags': 'hashtags',
+        'media_url': 'displayUrl',
+        'duration': 'videoDuration',
+    },
+    'tiktok': {
+        'id': 'id',
+        'url': 'webVideoUrl',
+        'author': 'authorMeta.name',
+        'timestamp': 'createTimeISO',
+        'caption': 'text',
+        'likes': 'diggCount',
+        'comments': 'commentCount',
+        'views': 'playCount',
+        'shares': 'shareCount',
+        'hashtags': 'hashtags.name',
+        'media_url': 'videoMeta.coverUrl',
+        'duration': 'videoMeta.duration',
+    },
+    'youtube': {
+        'id': 'id',
+        'url': 'url',
+        'author': 'channelName',
+        'timestamp': 'date',
+        'title': 'title',
+        'caption': 'text',
+        'likes': 'likes',
+        'comments': 'commentsCount',
+        'views': 'viewCount',
+        'hashtags': 'hashtags',
+        'media_url': 'thumbnailUrl',
+        'duration': 'duration',
+    },
+}
+
+
+def lookup(item, path):
+    """Value at a dotted path of a scraped item, None where it is missing"""
+    value = item
+    for step in path.split('.'):
+        if isinstance(value, dict):
+            value = value.get(step)
+        elif isinstance(value, list):
+            value = [element.get(step) for element in value if isinstance(element, dict)]
+        else:
+            return None
+    return value
+
+
+def scraped_items(scraped):
+    """(platform, item) pairs of a run's scraped data"""
+    if isinstance(scraped, dict):
+        records = scraped_records(scraped)
+    else:
+        # Legacy runs keep a flat list of items, possibly tagged with their platform
+        records = (
+            {'platform': item.get('platform', ''), 'data': item}
+            for item in scraped_records(scraped) if isinstance(item, dict)
+        )
+    for record in records:
+        if isinstance(record['data'], dict):
+            yield record['platform'], record['data']
+
+
+def post_records(scraped, columns=POST_COLUMNS):
+    """Scraped items flattened to the post ``columns``.
+
+    Items of platforms without a field map are read by column name.
+    """
+    for platform, item in scraped_items(scraped):
+        paths = POST_FIELDS.get(platform)
+        record = {}
+        for column in columns:
+            if column == 'platform':
+                record[column] = platform
+            elif paths is None:
+                record[column] = item.get(column)
+            else:
+                record[column] = lookup(item, paths[column]) if column in paths else None
+        yield record
+
+
+def posts_csv_stream(scraped, columns=POST_COLUMNS):
+    """CSV export of scraped posts with the given columns"""
+    rows = (
+        ['' if record[column] is None else entity_cell(record[column]) for column in columns]
+        for record in post_records(scraped, columns)
+    )
+    return csv_stream(columns, rows)
+
+
+# -------------------------------------------------------------------------
+# Parquet and Arrow
+# -------------------------------------------------------------------------
+def _to_float(value):
+    if value is None or value == '' or isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_int(value):
+    number = _to_float(value)
+    return None if number is None else int(number)
+
+
+def _to_bool(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in TRUE_VALUES
+
+
+def _to_date(value):
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def _to_text(value):
+    if value is None:
+        return None
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+
+def _to_tags(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, list):
+        return [str(tag) for tag in value]
+    return [tag.strip() for tag in str(value).split(',') if tag.strip()]
+
+
+def arrow_type(column_type):
+    """Arrow type and value converter for a column type"""
+    if column_type == 'integer':
+        return pyarrow.int64(), _to_int
+    if column_type == 'number':
+        return pyarrow.float64(), _to_float
+    if column_type == 'boolean':
+        return pyarrow.bool_(), _to_bool
+    if column_type == 'date':
+        return pyarrow.date32(), _to_date
+    if column_type == 'multi_select':
+        return pyarrow.list_(pyarrow.string()), _to_tags
+    # Text, URLs, selects and JSON (as JSON text)
+    return pyarrow.string(), _to_text
+
+
+def columnar_available():
+    return pyarrow is not None
+
+
+def write_columnar(file_format, fields, records, sink):
+    """Write records to ``sink`` as Parquet or Arrow IPC in bounded batches.
+
+    ``fields`` are (name, column type) pairs; records are dicts keyed by name.
+    Values that do not fit their column's type are written as nulls.
+    """
+    types = [(name, *arrow_type(column_type)) for name, column_type in fields]
+    schema = pyarrow.schema([(name, arrow) for name, arrow, _ in types])
+    if file_format == 'parquet':
+        writer = pyarrow.parquet.ParquetWriter(sink, schema, compression='zstd')
+    else:
+        writer = pyarrow.ipc.new_file(sink, schema)
+    try:
+        batch = {name: [] for name, _, _ in types}
+        size = 0
+        for record in records:
+            for name, _, convert in types:
+                batch[name].append(convert(record.get(name)))
+            size += 1
+            if size == COLUMNAR_BATCH_ROWS:
+                writer.write_batch(pyarrow.record_batch(batch, schema=schema))
+                batch = {name: [] for name, _, _ in types}
+                size = 0
+        if size:
+            writer.write_batch(pyarrow.record_batch(batch, schema=schema))
+    finally:
+        writer.close()
+
+
+def write_list_columnar(list_obj, file_format, sink):
+    """Write a list as Parquet or Arrow, typed by its column types"""
+    columns = list(list_obj.columns.all().order_by('order'))
+    fields = [('ID', 'integer'), *((column.name, column.column_type) for column in columns), ('Created At', 'text')]
+    rows = list_obj.rows.values_list('pk', 'data', 'created_at').iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    records = ({**(data or {}), 'ID': pk, 'Created At': created_at.isoformat()} for pk, data, created_at in rows)
+    write_columnar(file_format, fields, records, sink)
+
+
+def write_run_columnar(entities, profile, file_format, sink):
+    """Write run entities as Parquet or Arrow, typed by the run's schema profile"""
+    fields = [(field['name'], field['type']) for field in profile['fields']]
+    records = (entity for entity in entities if isinstance(entity, dict))
+    write_columnar(file_format, fields, records, sink)
+
+
+# -------------------------------------------------------------------------
+# SQLite
+# -------------------------------------------------------------------------
+# Post columns stored as numbers in SQLite snapshots; the others are text
+POST_COLUMN_TYPES = {'likes': 'integer', 'comments': 'integer', 'views': 'integer', 'shares': 'integer'}
+
+
+def _to_iso_date(value):
+    converted = _to_date(value) if value not in (None, '') else None
+    return converted.isoformat() if converted else None
+
+
+def _to_tag_text(value):
+    tags = _to_tags(value)
+    return None if tags is None else json.dumps(tags)
+
+
+def sqlite_type(column_type):
+    """SQLite column type and value converter for a column type"""
+    if column_type == 'integer':
+        return 'INTEGER', _to_int
+    if column_type == 'number':
+        return 'REAL', _to_float
+    if column_type == 'boolean':
+        return 'INTEGER', _to_bool
+    if column_type == 'date':
+        return 'TEXT', _to_iso_date
+    if column_type == 'multi_select':
+        return 'TEXT', _to_tag_text
+    return 'TEXT', _to_text
+
+
+def quote_name(name):
+    """SQLite identifier for a table or column name"""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def sqlite_database(path):
+    """Connection to a new SQLite file, set up for a one-off bulk load"""
+    connection = sqlite3.connect(path)
+    connection.execute('PRAGMA journal_mode = OFF')
+    connection.execute('PRAGMA synchronous = OFF')
+    return connection
+
+
+def unique_names(names):
+    """Names made distinct ignoring case, as SQLite compares them, by numbering repeats"""
+    seen = set()
+    unique = []
+    for name in names:
+        candidate, number = name, 1
+        while candidate.lower() in seen:
+            number += 1
+            candidate = f'{name}_{number}'
+        seen.add(candidate.lower())
+        unique.append(candidate)
+    return unique
+
+
+def write_sqlite_table(connection, table, fields, records, indexes=()):
+    """Create ``table`` and insert records in batches.
+
+    ``fields`` are (name, column type) pairs and records dicts keyed by name;
+    ``indexes`` are tuples of field names, indexed after the inserts. Fields
+    whose names differ only in case, like a list column ``id`` next to the
+    ``ID`` of the row, get numbered column names.
+    """
+    names = unique_names([name for name, _ in fields])
+    columns = dict(zip((name for name, _ in fields), names))
+    types = [(name, *sqlite_type(column_type)) for name, column_type in fields]
+    definitions = ', '.join(f'{quote_name(column)} {sql_type}' for column, (_, sql_type, _) in zip(names, types))
+    connection.execute(f'CREATE TABLE {quote_name(table)} ({definitions})')
+
+    insert = f"INSERT INTO {quote_name(table)} VALUES ({', '.join('?' * len(types))})"
+    batch = []
+    for record in records:
+        batch.append(tuple(convert(record.get(name)) for name, _, convert in types))
+        if len(batch) == EXPORT_CHUNK_SIZE:
+            connection.executemany(insert, batch)
+            batch = []
+    if batch:
+        connection.executemany(insert, batch)
+
+    for number, index in enumerate(indexes, 1):
+        indexed = ', '.join(quote_name(columns[name]) for name in index)
+        connection.execute(f'CREATE INDEX {quote_name(f"{table}_index_{number}")} ON {quote_name(table)} ({indexed})')
+
+
+def write_list_sqlite(list_obj, path):
+    """Write a list to a SQLite file: its rows, typed by column, and its columns"""
+    columns = list(list_obj.columns.all().order_by('order'))
+    names = [column.name for column in columns]
+    with sqlite_database(path) as connection:
+        write_sqlite_table(connection, 'list', [('id', 'integer'), ('name', 'text'), ('description', 'text')], [
+            {'id': list_obj.pk, 'name': list_obj.name, 'description': list_obj.description},
+        ])
+        write_sqlite_table(
+            connection, 'columns', [('name', 'text'), ('type', 'text'), ('required', 'boolean')],
+            ({'name': column.name, 'type': column.column_type, 'required': column.required} for column in columns),
+        )
+        fields = [('ID', 'integer'), *((column.name, column.column_type) for column in columns), ('Created At', 'text')]
+        rows = list_obj.rows.values_list('pk', 'data', 'created_at').iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        records = ({**(data or {}), 'ID': pk, 'Created At': created_at.isoformat()} for pk, data, created_at in rows)
+        indexes = [('ID',)]
+        key_columns = tuple(name for name in list_obj.dedupe_columns or [] if name in names)
+        if key_columns:
+            indexes.append(key_columns)
+        write_sqlite_table(connection, 'rows', fields, records, indexes)
+    connection.close()
+
+
+def write_run_sqlite(run, entities, profile, path):
+    """Write a run to a SQLite file: entities typed by its schema profile and scraped posts"""
+    with sqlite_database(path) as connection:
+        write_sqlite_table(connection, 'run', [('id', 'integer'), ('created_at', 'text')], [
+            {'id': run.pk, 'created_at': run.created_at.isoformat()},
+        ])
+        fields = [(field['name'], field['type']) for field in profile['fields']]
+        if fields:
+            write_sqlite_table(connection, 'entities', fields, (entity for entity in entities if isinstance(entity, dict)))
+        post_fields = [(column, POST_COLUMN_TYPES.get(column, 'text')) for column in POST_COLUMNS]
+        write_sqlite_table(connection, 'posts', post_fields, post_records(run.scraped), indexes=[('platform', 'id')])
+    connection.close()
+
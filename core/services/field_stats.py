@@ -0,0 +1,227 @@
+"""
+Single-pass data quality statistics for extracted fields.
+
+``FieldStats`` sees every value of a field once and keeps a fixed amount of
+state however many values there are: counts per type, numeric and length
+ranges, a length histogram, a small exact set of distinct values and a
+HyperLogLog sketch estimating the distinct count beyond it. Statistics of
+several runs merge without revisiting their values, and serialize to JSON so
+they can be stored in a run's schema profile.
+"""
+
+import base64
+import hashlib
+import json
+import math
+from django.conf import settings
+from .type_inference import candidate_types, TypeTally, DEFAULT_THRESHOLDS
+
+# HyperLogLog precision: 2**p registers, standard error about 1.04 / sqrt(2**p)
+HLL_PRECISION = 10
+
+# Distinct values kept exactly; fields with at most this many suggest a select column
+DISTINCT_VALUES_KEPT = getattr(settings, 'FIELD_STATS_DISTINCT_VALUES', 20)
+
+# Upper bounds of the value length histogram buckets; the last bucket is open
+LENGTH_BUCKETS = (10, 50, 100, 500, 1000)
+
+# Column types whose conversion fails for values of another type; other
+# types convert or keep any value
+STRICT_TYPES = ('number', 'date', 'json')
+
+# A select column is suggested when each distinct value repeats this often on average
+SELECT_MIN_REPEAT = 3
+
+
+class HyperLogLog:
+    """Distinct count estimator with 2**precision one-byte registers"""
+
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.size)
+
+    def add(self, key):
+        digest = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+        index = digest >> (64 - self.precision)
+        rest = digest & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        return self
+
+    def estimate(self):
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        raw = alpha * self.size ** 2 / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * self.size and zeros:
+            # Linear counting is more accurate for small cardinalities
+            return round(self.size * math.log(self.size / zeros))
+        return round(raw)
+
+    def to_json(self):
+        return base64.b64encode(bytes(self.registers)).decode('ascii')
+
+    @classmethod
+    def from_json(cls, data):
+        registers = base64.b64decode(data)
+        return cls(int(math.log2(len(registers))), registers)
+
+
+def value_key(value):
+    """Canonical text of a value for distinct counting"""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, sort_keys=True, default=str)
+    return str(value)
+
+
+def length_bucket(length):
+    """Label of the histogram bucket for a value length"""
+    lower = 0
+    for upper in LENGTH_BUCKETS:
+        if length < upper:
+            return f'{lower}-{upper - 1}'
+        lower = upper
+    return f'{lower}+'
+
+
+class FieldStats:
+    """Running statistics of one field's values"""
+
+    def __init__(self):
+        self.total = 0
+        self.empty = 0
+        self.type_counts = dict.fromkeys(DEFAULT_THRESHOLDS, 0)
+        self.min_number = self.max_number = None
+        self.min_length = self.max_length = None
+        self.length_histogram = {}
+        self.distinct_values = set()
+        self.distinct_overflow = False
+        self.sketch = HyperLogLog()
+
+    def add(self, value):
+        self.total += 1
+        if value is None or value == '':
+            self.empty += 1
+            return
+
+        types = candidate_types(value)
+        for column_type in types:
+            self.type_counts[column_type] += 1
+        if 'number' in types and not isinstance(value, bool):
+            self.add_number(value)
+
+        key = value_key(value)
+        length = len(key)
+        self.min_length = length if self.min_length is None else min(self.min_length, length)
+        self.max_length = length if self.max_length is None else max(self.max_length, length)
+        bucket = length_bucket(length)
+        self.length_histogram[bucket] = self.length_histogram.get(bucket, 0) + 1
+
+        self.sketch.add(key)
+        if not self.distinct_overflow and key not in self.distinct_values:
+            if len(self.distinct_values) < DISTINCT_VALUES_KEPT:
+                self.distinct_values.add(key)
+            else:
+                self.distinct_overflow = True
+                self.distinct_values.clear()
+
+    def add_number(self, value):
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            return
+        if not math.isfinite(number):
+            return
+        self.min_number = number if self.min_number is None else min(self.min_number, number)
+        self.max_number = number if self.max_number is None else max(self.max_number, number)
+
+    @property
+    def filled(self):
+        return self.total - self.empty
+
+    def distinct_count(self):
+        """Exact distinct count for few values, HyperLogLog estimate otherwise"""
+        if not self.distinct_overflow:
+            return len(self.distinct_values)
+        return max(self.sketch.estimate(), DISTINCT_VALUES_KEPT + 1)
+
+    def tally(self):
+        """Type tally of all values seen, for type inference"""
+        tally = TypeTally()
+        tally.total = self.filled
+        tally.counts.update(self.type_counts)
+        return tally
+
+    def to_json(self):
+        return {
+            'total': self.total,
+            'empty': self.empty,
+            'type_counts': self.type_counts,
+            'min_number': self.min_number,
+            'max_number': self.max_number,
+            'min_length': self.min_length,
+            'max_length': self.max_length,
+            'length_histogram': self.length_histogram,
+            'distinct_values': None if self.distinct_overflow else sorted(self.distinct_values),
+            'distinct_count': self.distinct_count(),
+            'sketch': self.sketch.to_json(),
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        stats = cls()
+        stats.total = data['total']
+        stats.empty = data['empty']
+        stats.type_counts.update(data['type_counts'])
+        stats.min_number, stats.max_number = data['min_number'], data['max_number']
+        stats.min_length, stats.max_length = data['min_length'], data['max_length']
+        stats.length_histogram = dict(data['length_histogram'])
+        stats.distinct_overflow = data['distinct_values'] is None
+        stats.distinct_values = set(data['distinct_values'] or ())
+        stats.sketch = HyperLogLog.from_json(data['sketch'])
+        return stats
+
+    def merge(self, other):
+        """Combine with the statistics of another set of values"""
+        self.total += other.total
+        self.empty += other.empty
+        for column_type, count in other.type_counts.items():
+            self.type_counts[column_type] = self.type_counts.get(column_type, 0) + count
+        for name, pick in (('min_number', min), ('max_number', max), ('min_length', min), ('max_length', max)):
+            values = [value for value in (getattr(self, name), getattr(other, name)) if value is not None]
+            setattr(self, name, pick(values) if values else None)
+        for bucket, count in other.length_histogram.items():
+            self.length_histogram[bucket] = self.length_histogram.get(bucket, 0) + count
+        self.sketch.merge(other.sketch)
+        values = self.distinct_values | other.distinct_values
+        if self.distinct_overflow or other.distinct_overflow or len(values) > DISTINCT_VALUES_KEPT:
+            self.distinct_overflow = True
+            self.distinct_values = set()
+        else:
+            self.distinct_values = values
+        return self
+
+
+def select_suggestion(stats):
+    """Options for a select column if a field holds a few repeated values, else None"""
+    values = stats.get('distinct_values')
+    if not values or len(values) < 2 or stats['total'] - stats['empty'] < SELECT_MIN_REPEAT * len(values):
+        return None
+    return values
+
+
+def unfit_count(stats, column_type):
+    """Non-empty values that a column of ``column_type`` cannot convert"""
+    if column_type not in STRICT_TYPES:
+        return 0
+    return stats['total'] - stats['empty'] - stats['type_counts'].get(column_type, 0)
+
+
+def stats_summary(stats):
+    """Statistics of a field without the sketch, for API responses"""
+    return {key: value for key, value in stats.items() if key != 'sketch'}
+
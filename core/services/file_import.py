@@ -0,0 +1,120 @@
+"""
+Streaming import of uploaded CSV and XLSX files into user lists.
+
+Files are read row by row from the upload (Django spools large uploads to a
+temporary file), so memory stays constant however long the file is. Column
+types are inferred from the first ``FILE_INFERENCE_ROWS`` rows only; those
+rows are buffered and then written together with the rest of the stream.
+Columns are matched through the list's import mapping, so a spreadsheet
+uploaded again reuses the mapping of the first upload.
+"""
+
+import csv
+import io
+import os
+import zipfile
+from datetime import date, datetime, time
+from itertools import chain, islice
+from django.conf import settings
+from .import_mappings import mapping_coercer, prepare_mapping
+from .list_import import import_entities
+from .run_profile import build_profile
+
+try:
+    import openpyxl
+    from openpyxl.utils.exceptions import InvalidFileException
+except ImportError:
+    openpyxl = None
+    InvalidFileException = None
+
+# Leading rows used to infer the types of new columns
+FILE_INFERENCE_ROWS = getattr(settings, 'FILE_IMPORT_INFERENCE_ROWS', 1000)
+
+CSV_EXTENSIONS = ('.csv', '.tsv', '.txt')
+XLSX_EXTENSIONS = ('.xlsx',)
+
+
+def header_names(values):
+    """Stripped header cells; blank headers become None and are skipped"""
+    return [str(value).strip() if value is not None and str(value).strip() else None for value in values]
+
+
+def csv_entities(upload):
+    """Yield the rows of an uploaded CSV file as dicts keyed by header"""
+    text = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+    sample = text.read(8192)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t|')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(text, dialect)
+    try:
+        headers = header_names(next(reader, []))
+        for values in reader:
+            if any(values):
+                yield {name: value for name, value in zip(headers, values) if name}
+    except csv.Error as e:
+        raise ValueError(f'Malformed CSV at line {reader.line_num}: {e}')
+    # Leave the upload open for Django to clean up
+    text.detach()
+
+
+def cell_value(value):
+    """JSON-serializable value of a spreadsheet cell"""
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    return value
+
+
+def xlsx_entities(upload):
+    """Yield the rows of the first sheet of an uploaded XLSX file"""
+    if openpyxl is None:
+        raise ValueError('XLSX upload requires openpyxl; upload a CSV file instead')
+    try:
+        workbook = openpyxl.load_workbook(upload, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, InvalidFileException, KeyError) as e:
+        raise ValueError(f'{upload.name} is not a valid XLSX file: {e}')
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        headers = header_names(next(rows, ()))
+        for values in rows:
+            if any(value is not None for value in values):
+                yield {name: cell_value(value) for name, value in zip(headers, values) if name}
+    except zipfile.BadZipFile as e:
+        raise ValueError(f'{upload.name} is not a valid XLSX file: {e}')
+    finally:
+        workbook.close()
+
+
+def file_entities(upload):
+    """Row stream for an uploaded file, chosen by its extension"""
+    extension = os.path.splitext(upload.name or '')[1].lower()
+    if extension in CSV_EXTENSIONS:
+        return csv_entities(upload)
+    if extension in XLSX_EXTENSIONS:
+        return xlsx_entities(upload)
+    raise ValueError(f'Unsupported file type "{extension}"; upload a CSV or XLSX file')
+
+
+def import_file(target_list, upload, actor=None, mode='upsert'):
+    """Import an uploaded file into a list. Returns the import stats."""
+    entities = file_entities(upload)
+    try:
+        head = list(islice(entities, FILE_INFERENCE_ROWS))
+    except UnicodeDecodeError as e:
+        raise ValueError(f'{upload.name} is not UTF-8 encoded: {e}')
+    if not head:
+        raise ValueError(f'{upload.name} contains no rows')
+
+    mapping, new_columns = prepare_mapping(target_list, build_profile(head))
+    stats = import_entities(
+        target_list,
+        chain(head, entities),
+        actor=actor,
+        coercer=mapping_coercer(mapping, target_list),
+        detail={'file': upload.name},
+        mode=mode,
+    )
+    stats['new_columns'] = len(new_columns)
+    return stats
@@ -0,0 +1,163 @@
+"""
+Background import jobs.
+
+Web requests only enqueue an ``ImportJob``; the ``run_import_worker``
+management command claims pending jobs and imports them batch by batch. Each
+batch commits together with the job's progress, so the status endpoint can
+report rows processed, throughput and ETA while the import runs, and a job
+whose worker died is picked up again after ``STALE_AFTER`` and resumes after
+its last committed batch.
+"""
+
+import hashlib
+import json
+import logging
+from datetime import timedelta
+from functools import partial
+from itertools import chain
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from ..models import ImportJob, Run
+from .import_mappings import mapping_coercer, prepare_mapping
+from .list_import import import_entities
+from .run_profile import get_profile, merge_profiles, parse_extracted_data
+
+logger = logging.getLogger(__name__)
+
+# Running jobs not updated for this long are assumed abandoned and resumed
+STALE_AFTER = timedelta(seconds=getattr(settings, 'IMPORT_JOB_STALE_SECONDS', 600))
+
+
+def enqueue_import(user, target_list, run_ids, mode='upsert'):
+    """Create a pending import job for the given runs.
+
+    Runs are only profiled by the worker, which also sets ``total_rows``.
+    """
+    return ImportJob.objects.create(
+        user=user,
+        user_list=target_list,
+        run_ids=list(run_ids),
+        mode=mode,
+    )
+
+
+def claim_next_job():
+    """Mark the oldest pending or abandoned job as running and return it"""
+    stale = timezone.now() - STALE_AFTER
+    with transaction.atomic():
+        job = (
+            ImportJob.objects.select_for_update(skip_locked=True)
+            .filter(Q(status='pending') | Q(status='running', updated_at__lt=stale))
+            .order_by('created_at')
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = 'running'
+        job.started_at = job.started_at or timezone.now()
+        job.save(update_fields=['status', 'started_at', 'updated_at'])
+    return job
+
+
+def unique_entities(entities, offset, duplicates):
+    """Entities after ``offset`` that are not exact copies of an earlier entity.
+
+    Entities before ``offset`` were written by an earlier attempt of the job;
+    they are only hashed, so their copies are still recognized. Copies found
+    after the offset are counted in ``duplicates['count']``.
+    """
+    seen = set()
+    for index, entity in enumerate(entities):
+        digest = hashlib.md5(json.dumps(entity, sort_keys=True, default=str).encode('utf-8')).digest()
+        if digest in seen:
+            if index >= offset:
+                duplicates['count'] += 1
+            continue
+        seen.add(digest)
+        if index >= offset:
+            yield entity
+
+
+def record_progress(job, offset, previous, duplicates, stats):
+    """Store a job's progress; called inside each batch's transaction"""
+    processed = stats['imported_rows'] + stats['updated_rows'] + stats['skipped_rows'] + duplicates['count']
+    job.processed_rows = offset + processed
+    job.rows_per_second = stats['rows_per_second']
+    job.result = {
+        key: previous.get(key, 0) + stats[key]
+        for key in ('imported_rows', 'updated_rows', 'skipped_rows')
+    }
+    job.result['duplicate_rows'] = previous.get('duplicate_rows', 0) + duplicates['count']
+    job.save(update_fields=['processed_rows', 'rows_per_second', 'result', 'updated_at'])
+
+
+def run_job(job):
+    """Import a claimed job's runs into its list"""
+    runs = {run.pk: run for run in Run.objects.filter(pk__in=job.run_ids)}
+    runs = [runs[run_id] for run_id in job.run_ids if run_id in runs]
+    target_list = job.user_list
+
+    # Only fields the list's saved mapping has not seen are analyzed
+    profile = merge_profiles([get_profile(run) for run in runs])
+    mapping, new_columns = prepare_mapping(target_list, profile)
+    job.total_rows = profile['entity_count']
+    job.save(update_fields=['total_rows', 'updated_at'])
+
+    # Entities are read in run order, so a resumed job skips what it already
+    # wrote. Exact copies (the same post in several runs) are dropped.
+    offset = job.processed_rows
+    previous = dict(job.result or {})
+    duplicates = {'count': 0}
+    entities = chain.from_iterable(parse_extracted_data(run.extracted) for run in runs)
+
+    try:
+        stats = import_entities(
+            target_list,
+            unique_entities(entities, offset, duplicates),
+            actor=job.user,
+            coercer=mapping_coercer(mapping, target_list),
+            detail={'run_ids': job.run_ids, 'import_job': job.pk},
+            mode=job.mode,
+            atomic=False,
+            progress=partial(record_progress, job, offset, previous, duplicates),
+        )
+    except Exception as e:
+        logger.exception(f"Import job {job.pk} failed")
+        job.status = 'failed'
+        job.error = str(e)
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at', 'updated_at'])
+        return job
+
+    # Copies after the last batch are not included in its progress
+    record_progress(job, offset, previous, duplicates, stats)
+    job.status = 'completed'
+    job.result = {
+        **(job.result or {}),
+        'new_columns': len(new_columns),
+        'coercion_errors': stats['coercion_errors'],
+    }
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'result', 'finished_at', 'updated_at'])
+    return job
+
+
+def job_status(job):
+    """Progress of a job for the status endpoint"""
+    remaining = max(job.total_rows - job.processed_rows, 0)
+    eta = None
+    if job.status == 'running' and job.rows_per_second:
+        eta = round(remaining / job.rows_per_second, 1)
+    return {
+        'id': job.pk,
+        'status': job.status,
+        'total_rows': job.total_rows,
+        'processed_rows': job.processed_rows,
+        'rows_per_second': job.rows_per_second,
+        'eta_seconds': eta,
+        'result': job.result,
+        'error': job.error,
+        'list_url': f"/lists/{job.user_list_id}/",
+    }
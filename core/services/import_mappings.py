@@ -0,0 +1,136 @@
+"""
+Saved import mappings.
+
+The first import into a list analyzes the extracted fields against the list's
+columns once and saves the result as the list's ``ImportMapping``: each source
+field maps to a target column with an optional coercion type, and ignored
+fields are never imported. Later imports compile the saved mapping into a
+``RowCoercer`` and skip type and conflict analysis entirely. Only fields the
+mapping has never seen are analyzed, get a column when needed, and are added
+to the mapping.
+
+Renaming a column retargets the rules that point at it. Rules left pointing
+at a column that no longer exists are stale: the mapping API lists them, and
+the next import drops them so their fields are analyzed again like new ones.
+"""
+
+import logging
+from django.db import transaction
+from ..models import ImportMapping, ListColumn
+from .coercion import CONVERTER_FACTORIES, RowCoercer
+from .list_import import create_columns
+from .run_profile import analyze_profile
+
+logger = logging.getLogger(__name__)
+
+
+def unmapped_fields(mapping, profile):
+    """Profile fields the mapping neither maps nor ignores"""
+    known = set(mapping.fields) | set(mapping.ignored)
+    return [field for field in profile['fields'] if field['name'] not in known]
+
+
+def stale_fields(mapping, columns):
+    """Source fields whose rule points at a column not in ``columns``"""
+    return [source for source, rule in mapping.fields.items() if rule.get('column') not in columns]
+
+
+def retarget_rules(target_list, old_name, new_name):
+    """Point the rules of a list's mapping at a renamed column"""
+    mapping = ImportMapping.objects.filter(user_list=target_list).first()
+    if mapping is None:
+        return
+    renamed = [source for source, rule in mapping.fields.items() if rule.get('column') == old_name]
+    for source in renamed:
+        mapping.fields[source]['column'] = new_name
+    if renamed:
+        mapping.save()
+
+
+def prepare_mapping(target_list, profile):
+    """Mapping of a list that covers every field of ``profile``.
+
+    Creates the mapping on the first import and extends it with fields it has
+    not seen before, creating columns for them. Returns the mapping and the
+    column definitions that were created.
+    """
+    mapping = ImportMapping.objects.filter(user_list=target_list).first() or ImportMapping(user_list=target_list)
+    stale = stale_fields(mapping, set(target_list.columns.values_list('name', flat=True)))
+    if stale:
+        for source in stale:
+            del mapping.fields[source]
+        mapping.save()
+        logger.info(f"Dropped {len(stale)} mapping rules for deleted columns of list {target_list.pk}: {stale}")
+    unmapped = unmapped_fields(mapping, profile)
+    if mapping.pk is not None and not unmapped:
+        return mapping, []
+
+    analysis = analyze_profile({**profile, 'fields': unmapped}, target_list)
+    with transaction.atomic():
+        create_columns(target_list, analysis['new_columns'])
+        # Conflicting fields are still mapped; their values that do not fit
+        # the column are kept unconverted and reported by the import
+        for field in unmapped:
+            mapping.fields[field['name']] = {'column': field['name']}
+        mapping.save()
+    logger.info(f"Mapped {len(unmapped)} new fields for imports into list {target_list.pk}")
+    return mapping, analysis['new_columns']
+
+
+def mapped_analysis(profile, target_list):
+    """Import analysis that only examines fields the list's mapping has not seen"""
+    mapping = ImportMapping.objects.filter(user_list=target_list).first()
+    if mapping is None:
+        return analyze_profile(profile, target_list)
+    analysis = analyze_profile({**profile, 'fields': unmapped_fields(mapping, profile)}, target_list)
+    analysis['existing_columns_match'] += [
+        field['name'] for field in profile['fields'] if field['name'] in mapping.fields
+    ]
+    analysis['ignored_fields'] = [field['name'] for field in profile['fields'] if field['name'] in mapping.ignored]
+    analysis['extracted_fields_count'] = len(profile['fields'])
+    return analysis
+
+
+def validate_mapping(target_list, fields, ignored):
+    """Check a mapping edited by the user, raising ValueError when invalid"""
+    if not isinstance(fields, dict) or not isinstance(ignored, list):
+        raise ValueError('fields must be an object and ignored a list')
+    columns = set(target_list.columns.values_list('name', flat=True))
+    for source, rule in fields.items():
+        if not isinstance(rule, dict) or rule.get('column') not in columns:
+            raise ValueError(f'Field "{source}" must map to an existing column')
+        if rule.get('type') is not None and rule['type'] not in CONVERTER_FACTORIES:
+            raise ValueError(f'Unknown coercion type for field "{source}": {rule["type"]}')
+
+
+def mapping_coercer(mapping, target_list):
+    """Compile a mapping into a coercer that reads entities by source field.
+
+    A rule's ``type`` overrides the target column's type. Rules pointing at
+    columns that no longer exist, which ``prepare_mapping`` drops, are skipped.
+    """
+    columns = {column.name: column for column in target_list.columns.all()}
+    mapped = []
+    for source, rule in mapping.fields.items():
+        column = columns.get(rule.get('column'))
+        if column is None or source in mapping.ignored:
+            continue
+        mapped_column = ListColumn(
+            name=column.name,
+            column_type=rule.get('type') or column.column_type,
+            options=column.options,
+        )
+        mapped_column.source = source
+        mapped.append(mapped_column)
+    return RowCoercer(mapped, key='source')
+
+
+def mapping_state(mapping):
+    """Serializable mapping for the API"""
+    columns = set(mapping.user_list.columns.values_list('name', flat=True))
+    return {
+        'fields': mapping.fields,
+        'ignored': mapping.ignored,
+        'stale_fields': stale_fields(mapping, columns),
+        'updated_at': mapping.updated_at.isoformat() if mapping.updated_at else None,
+    }
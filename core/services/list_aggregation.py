@@ -0,0 +1,142 @@
+"""
+Group-by aggregation over list rows, executed in the database.
+
+Row values are read from ``ListRow.data`` and cast according to the column
+type. Values that do not match the shared value patterns are ignored; those
+that match but are out of range, such as ``1e999`` or ``2024-13-45``, go
+through cast functions that return NULL (migration 0029), so they are
+ignored too instead of failing the query. Results are
+cached per list version: any change to the list makes old entries unreachable.
+"""
+
+import hashlib
+import json
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import (
+    Avg, BooleanField, Case, Count, DateField, F, FloatField, Func, Max, Min, Sum, TextField, Value, When,
+)
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.functions import Cast, Lower, NullIf, Substr, Trim
+from .column_types import NUMBER_PATTERN, BOOLEAN_PATTERN, ISO_DATE_PATTERN
+
+# Seconds to keep aggregation results for a list version
+CACHE_TIMEOUT = getattr(settings, 'LIST_AGGREGATE_CACHE_TIMEOUT', 3600)
+
+MAX_GROUPS = 1000
+
+OPERATIONS = {
+    'count': lambda expression: Count(expression),
+    'distinct': lambda expression: Count(expression, distinct=True),
+    'sum': Sum,
+    'avg': Avg,
+    'min': Min,
+    'max': Max,
+}
+
+# Operations that only make sense on numbers
+NUMERIC_OPERATIONS = ('sum', 'avg')
+
+
+class SafeFloat(Func):
+    """Text cast to a float, NULL when out of range"""
+    function = 'core_safe_float'
+    output_field = FloatField()
+
+
+class SafeDate(Func):
+    """Text cast to a date, NULL when not a valid date"""
+    function = 'core_safe_date'
+    output_field = DateField()
+
+
+def text_value(column):
+    """Trimmed text of a column's value, NULL when missing or blank"""
+    return NullIf(Trim(KeyTextTransform(column.name, 'data')), Value(''), output_field=TextField())
+
+
+def typed_value(column, alias, column_type=None):
+    """Value of a column cast to its type, NULL when the value does not fit.
+
+    ``alias`` must name an annotation holding ``text_value(column)``;
+    ``column_type`` casts to another type than the column's own.
+    """
+    column_type = column_type or column.column_type
+    if column_type == 'number':
+        return Case(When(**{f'{alias}__iregex': NUMBER_PATTERN, 'then': SafeFloat(F(alias))}))
+    if column_type == 'boolean':
+        return Case(When(**{f'{alias}__iregex': BOOLEAN_PATTERN, 'then': Cast(Lower(F(alias)), BooleanField())}))
+    if column_type == 'date':
+        return Case(When(**{f'{alias}__regex': ISO_DATE_PATTERN, 'then': SafeDate(Substr(F(alias), 1, 10))}))
+    return F(alias)
+
+
+def parse_metric(spec):
+    """Split an ``op:column`` metric spec"""
+    op, _, column = spec.partition(':')
+    return op.strip().lower(), column.strip()
+
+
+def aggregate_list(list_obj, group_by=(), metrics=(), limit=MAX_GROUPS):
+    """Aggregate a list's rows, grouped by the values of ``group_by`` columns.
+
+    ``metrics`` are ``(op, column name)`` pairs with op one of count, distinct,
+    sum, avg, min or max; all of them only consider values that fit the column
+    type. Every group also carries its row count. Raises
+    ValueError for unknown columns or operations.
+    """
+    columns = {column.name: column for column in list_obj.columns.all()}
+    for name in list(group_by) + [name for _, name in metrics]:
+        if name not in columns:
+            raise ValueError(f'Unknown column: {name}')
+    for op, name in metrics:
+        if op not in OPERATIONS:
+            raise ValueError(f'Unknown operation: {op}')
+        if op in NUMERIC_OPERATIONS and columns[name].column_type != 'number':
+            raise ValueError(f'{op} requires a number column, {name} is {columns[name].column_type}')
+
+    # Each referenced column is extracted once under a short alias, since
+    # column names are not valid SQL aliases
+    names = list(dict.fromkeys(list(group_by) + [name for _, name in metrics]))
+    aliases = {name: f'c{index}' for index, name in enumerate(names)}
+    rows = list_obj.rows.order_by().annotate(**{
+        aliases[name]: text_value(columns[name]) for name in names
+    })
+
+    group_aliases = [aliases[name] for name in group_by]
+    if group_aliases:
+        rows = rows.values(*group_aliases)
+
+    annotations = {'row_count': Count('pk')}
+    for index, (op, name) in enumerate(metrics):
+        annotations[f'm{index}'] = OPERATIONS[op](typed_value(columns[name], aliases[name]))
+
+    if not group_aliases:
+        results = [rows.aggregate(**annotations)]
+        total_groups = 1
+    else:
+        grouped = rows.annotate(**annotations).order_by('-row_count', *group_aliases)
+        total_groups = grouped.count()
+        results = list(grouped[:limit])
+
+    groups = []
+    for result in results:
+        groups.append({
+            'key': {name: result[aliases[name]] for name in group_by},
+            'count': result['row_count'],
+            'metrics': {
+                f'{op}:{name}': result[f'm{index}'] for index, (op, name) in enumerate(metrics)
+            },
+        })
+    return {'groups': groups, 'total_groups': total_groups, 'truncated': total_groups > len(groups)}
+
+
+def cached_aggregate(list_obj, group_by=(), metrics=(), limit=MAX_GROUPS):
+    """``aggregate_list`` with results cached for the list's current version"""
+    spec = json.dumps([list(group_by), [list(metric) for metric in metrics], limit])
+    key = f'list-aggregate:{list_obj.pk}:{list_obj.version}:{hashlib.md5(spec.encode()).hexdigest()}'
+    result = cache.get(key)
+    if result is None:
+        result = aggregate_list(list_obj, group_by, metrics, limit)
+        cache.set(key, result, CACHE_TIMEOUT)
+    return result
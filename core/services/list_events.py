@@ -0,0 +1,61 @@
+"""
+Publishes list changes to realtime subscribers.
+
+Journaled changes are sent as small deltas over Postgres NOTIFY once the
+transaction that made them commits. ``core.realtime`` listens on the same
+channel in every ASGI process and forwards the deltas to connected grids.
+"""
+
+import json
+import logging
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'list_events'
+
+# Postgres rejects NOTIFY payloads of 8000 bytes or more. Larger events are sent
+# as a version marker and clients fetch the changes from the history endpoint.
+MAX_PAYLOAD_BYTES = 7900
+
+
+def change_delta(change):
+    """Compact delta sent to grids for one journaled change"""
+    if change.new_value is not None:
+        value = change.new_value
+    elif isinstance(change.old_value, dict) and 'id' in change.old_value:
+        value = {'id': change.old_value['id']}
+    else:
+        value = None
+    return {
+        'action': change.action,
+        'row_id': change.row_id,
+        'column': change.column,
+        'value': value,
+    }
+
+
+def build_event(list_id, version, kind, changes):
+    """Serialized event for one list version, truncated if too large"""
+    event = {
+        'list': list_id,
+        'version': version,
+        'kind': kind,
+        'deltas': [change_delta(change) for change in changes],
+    }
+    payload = json.dumps(event, separators=(',', ':'), default=str)
+    if len(payload.encode('utf-8')) > MAX_PAYLOAD_BYTES:
+        payload = json.dumps({'list': list_id, 'version': version, 'kind': kind, 'truncated': True})
+    return payload
+
+
+def publish_changes(list_id, version, kind, changes):
+    """Notify realtime subscribers of a committed list version"""
+    if connection.vendor != 'postgresql':
+        return
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, build_event(list_id, version, kind, changes)])
+    except Exception as e:
+        # Broadcasting is best effort; the change itself is already committed
+        logger.warning(f"Failed to publish changes for list {list_id} version {version}: {e}")
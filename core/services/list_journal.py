@@ -0,0 +1,466 @@
+"""
+Append-only change journal for user lists.
+
+Every mutation made through the list views is recorded as ``ListChange`` rows
+that share the list version produced by the action. Periodic ``ListSnapshot``
+rows compact the journal, so undo/redo and "restore as of time T" only replay
+the short tail of changes after the nearest snapshot. Snapshots are stored in
+chunks of rows and only the most recent ``SNAPSHOT_KEEP`` are kept.
+
+Writes that bypass the journal (bulk imports, restores) must call
+``checkpoint`` afterwards. It records a barrier change, which stops undo from
+crossing the write. Replay cannot cross it either, so the next journaled
+change first snapshots the list as the write left it; back-to-back imports
+share that one snapshot.
+"""
+
+import logging
+from contextlib import contextmanager
+from functools import partial
+from itertools import count, islice
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils.dateparse import parse_datetime
+from ..models import UserList, ListColumn, ListRow, ListChange, ListSnapshot
+from .list_events import publish_changes
+
+logger = logging.getLogger(__name__)
+
+# Number of list versions between two automatic snapshots
+SNAPSHOT_INTERVAL = getattr(settings, 'LIST_SNAPSHOT_INTERVAL', 200)
+
+# Rows stored per snapshot chunk
+SNAPSHOT_CHUNK_SIZE = getattr(settings, 'LIST_SNAPSHOT_CHUNK_SIZE', 5000)
+
+# Snapshots kept per list; restores cannot reach back past the oldest
+SNAPSHOT_KEEP = getattr(settings, 'LIST_SNAPSHOT_KEEP', 20)
+
+# Kinds of change groups that undo and redo never cross
+BARRIER_KINDS = ('restore', 'import')
+
+COLUMN_FIELDS = ['name', 'column_type', 'description', 'required', 'order', 'options']
+
+INVERSE_ACTIONS = {
+    'cell_update': 'cell_update',
+    'row_create': 'row_delete',
+    'row_delete': 'row_create',
+    'column_create': 'column_delete',
+    'column_update': 'column_update',
+    'column_delete': 'column_create',
+}
+
+
+def column_state(column):
+    """Serializable state of a column as stored in the journal"""
+    state = {field: getattr(column, field) for field in COLUMN_FIELDS}
+    state['id'] = column.pk
+    return state
+
+
+def row_state(row):
+    """Serializable state of a row as stored in the journal"""
+    state = {'id': row.pk, 'data': row.data or {}}
+    if row.key_hash:
+        state['key'] = row.key_hash
+    if row.created_at:
+        state['created_at'] = row.created_at.isoformat()
+    return state
+
+
+def rows_from_states(list_obj, states):
+    """Recreate rows from their journaled states, keeping their creation times.
+
+    ``auto_now_add`` stamps new rows with the current time, so journaled
+    creation times are written back with a second update. States journaled
+    before creation times were recorded keep the new time.
+    """
+    rows = [
+        ListRow(pk=state['id'], user_list=list_obj, data=state['data'], key_hash=state.get('key'))
+        for state in states
+    ]
+    ListRow.objects.bulk_create(rows, batch_size=1000)
+    dated = []
+    for row, state in zip(rows, states):
+        if state.get('created_at'):
+            row.created_at = parse_datetime(state['created_at'])
+            dated.append(row)
+    ListRow.objects.bulk_update(dated, ['created_at'], batch_size=1000)
+    return rows
+
+
+class ChangeSet:
+    """
+    Changes made by one user action. All changes share one list version.
+
+    Use through ``record_changes`` rather than directly.
+    """
+
+    def __init__(self, list_obj, actor=None, kind='edit', reverts_version=None):
+        self.list_obj = list_obj
+        self.actor = actor if actor is not None and actor.is_authenticated else None
+        self.kind = kind
+        self.reverts_version = reverts_version
+        self.changes = []
+        self.version = None
+
+    def add(self, action, row_id=None, column='', old_value=None, new_value=None):
+        self.changes.append(ListChange(
+            user_list=self.list_obj,
+            kind=self.kind,
+            reverts_version=self.reverts_version,
+            action=action,
+            row_id=row_id,
+            column=column,
+            old_value=old_value,
+            new_value=new_value,
+            actor=self.actor,
+        ))
+
+    def cell(self, row_id, column, old_value, new_value):
+        if old_value != new_value:
+            self.add('cell_update', row_id=row_id, column=column, old_value=old_value, new_value=new_value)
+
+    def row_created(self, row):
+        self.add('row_create', row_id=row.pk, new_value=row_state(row))
+
+    def row_deleted(self, row):
+        self.add('row_delete', row_id=row.pk, old_value=row_state(row))
+
+    def column_created(self, column):
+        self.add('column_create', new_value=column_state(column))
+
+    def column_updated(self, old_state, column):
+        new_state = column_state(column)
+        if old_state != new_state:
+            self.add('column_update', old_value=old_state, new_value=new_state)
+
+    def column_deleted(self, column):
+        self.add('column_delete', old_value=column_state(column))
+
+    def save(self):
+        """Assign the next list version and write the changes"""
+        if not self.changes:
+            return None
+
+        self.version = bump_version(self.list_obj)
+        for change in self.changes:
+            change.version = self.version
+        ListChange.objects.bulk_create(self.changes)
+        transaction.on_commit(partial(
+            publish_changes, self.list_obj.pk, self.version, self.kind, self.changes,
+        ))
+
+        latest = self.list_obj.snapshots.values_list('version', flat=True).first()
+        if latest is None or self.version - latest >= SNAPSHOT_INTERVAL:
+            take_snapshot(self.list_obj)
+        return self.version
+
+
+@contextmanager
+def record_changes(list_obj, actor=None, kind='edit', reverts_version=None):
+    """
+    Journal the mutations made inside the block as one list version.
+
+    The block runs in a transaction. A snapshot is taken before the first
+    journaled change of a list, and before the first one after a checkpoint,
+    so its history can be replayed.
+    """
+    with transaction.atomic():
+        if needs_snapshot(list_obj):
+            take_snapshot(list_obj)
+        changes = ChangeSet(list_obj, actor=actor, kind=kind, reverts_version=reverts_version)
+        yield changes
+        changes.save()
+
+
+def bump_version(list_obj):
+    """Increment the list version and return the new value.
+
+    The row lock taken by the update serializes concurrent writers until the
+    surrounding transaction commits.
+    """
+    UserList.objects.filter(pk=list_obj.pk).update(version=F('version') + 1)
+    list_obj.version = UserList.objects.values_list('version', flat=True).get(pk=list_obj.pk)
+    return list_obj.version
+
+
+def needs_snapshot(list_obj):
+    """Whether the list has no snapshot to replay from, or a checkpoint after its latest"""
+    latest = list_obj.snapshots.values_list('version', flat=True).first()
+    if latest is None:
+        return True
+    return list_obj.changes.filter(action='bulk_write', version__gt=latest).exists()
+
+
+def take_snapshot(list_obj):
+    """Store the current columns and rows of a list at its current version.
+
+    Rows are read and written ``SNAPSHOT_CHUNK_SIZE`` at a time, one
+    ``ListSnapshot`` per chunk. Returns the first chunk, which holds the
+    columns.
+    """
+    with transaction.atomic():
+        # Locking the list keeps writers out until the snapshot is complete
+        version = UserList.objects.select_for_update().values_list('version', flat=True).get(pk=list_obj.pk)
+        columns = [column_state(column) for column in list_obj.columns.all()]
+        rows = (
+            row_state(row)
+            for row in list_obj.rows.order_by('pk').only('pk', 'user_list', 'data', 'key_hash', 'created_at')
+            .iterator(chunk_size=SNAPSHOT_CHUNK_SIZE)
+        )
+        snapshot = None
+        for chunk in count():
+            batch = list(islice(rows, SNAPSHOT_CHUNK_SIZE))
+            part = ListSnapshot.objects.create(
+                user_list=list_obj,
+                version=version,
+                chunk=chunk,
+                columns=columns if chunk == 0 else [],
+                rows=batch,
+            )
+            snapshot = snapshot or part
+            if len(batch) < SNAPSHOT_CHUNK_SIZE:
+                break
+        prune_snapshots(list_obj)
+    return snapshot
+
+
+def snapshot_rows(snapshot):
+    """Yield the row states of all chunks of a snapshot, one chunk at a time"""
+    chunks = ListSnapshot.objects.filter(user_list_id=snapshot.user_list_id, version=snapshot.version)
+    for rows in chunks.order_by('chunk').values_list('rows', flat=True).iterator(chunk_size=1):
+        yield from rows
+
+
+def prune_snapshots(list_obj):
+    """Delete snapshots older than the ``SNAPSHOT_KEEP`` most recent ones"""
+    versions = list_obj.snapshots.filter(chunk=0).values_list('version', flat=True)
+    oldest_kept = versions[SNAPSHOT_KEEP - 1:SNAPSHOT_KEEP].first()
+    if oldest_kept is not None:
+        list_obj.snapshots.filter(version__lt=oldest_kept).delete()
+
+
+def checkpoint(list_obj, actor=None, kind='import', detail=None):
+    """Record a write that bypassed the journal"""
+    with transaction.atomic():
+        changes = ChangeSet(list_obj, actor=actor, kind=kind)
+        changes.add('bulk_write', new_value=detail or {})
+        changes.save()
+    return changes.version
+
+
+# -------------------------------------------------------------------------
+# Applying changes
+# -------------------------------------------------------------------------
+def inverse(change):
+    """Action, old and new value that revert a change"""
+    return INVERSE_ACTIONS[change.action], change.new_value, change.old_value
+
+
+def rename_row_data(list_obj, old_name, new_name):
+    """Move the values of a renamed column to its new name in every row.
+
+    Part of the column rename itself, so it is not journaled row by row;
+    replaying the ``column_update`` repeats it.
+    """
+    if old_name == new_name:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {ListRow._meta.db_table} '
+            f'SET data = (data - %s) || jsonb_build_object(%s::text, data -> %s) '
+            f'WHERE user_list_id = %s AND data ? %s',
+            [old_name, new_name, old_name, list_obj.pk, old_name],
+        )
+
+
+def apply_change(list_obj, changes, action, row_id, column, old_value, new_value):
+    """Apply one change to the database and journal it in ``changes``"""
+    if action == 'cell_update':
+        row = ListRow.objects.filter(pk=row_id, user_list=list_obj).first()
+        if row is None:
+            return
+        data = row.data or {}
+        changes.cell(row.pk, column, data.get(column), new_value)
+        data[column] = new_value
+        row.data = data
+        row.save(update_fields=['data', 'updated_at'])
+    elif action == 'row_create':
+        row, = rows_from_states(list_obj, [new_value])
+        changes.row_created(row)
+    elif action == 'row_delete':
+        row = ListRow.objects.filter(pk=old_value['id'], user_list=list_obj).first()
+        if row is not None:
+            changes.row_deleted(row)
+            row.delete()
+    elif action == 'column_create':
+        fields = {field: new_value[field] for field in COLUMN_FIELDS}
+        column = ListColumn.objects.create(pk=new_value['id'], user_list=list_obj, **fields)
+        changes.column_created(column)
+    elif action == 'column_update':
+        column = ListColumn.objects.filter(pk=new_value['id'], user_list=list_obj).first()
+        if column is not None:
+            old_state = column_state(column)
+            for field in COLUMN_FIELDS:
+                setattr(column, field, new_value[field])
+            column.save()
+            changes.column_updated(old_state, column)
+            if column.name != old_state['name']:
+                # Imported here: list_import records its writes through this module
+                from .list_import import rename_dedupe_column
+                rename_row_data(list_obj, old_state['name'], column.name)
+                rename_dedupe_column(list_obj, old_state['name'], column.name)
+    elif action == 'column_delete':
+        column = ListColumn.objects.filter(pk=old_value['id'], user_list=list_obj).first()
+        if column is not None:
+            changes.column_deleted(column)
+            column.delete()
+
+
+def apply_to_state(state, change):
+    """Apply a journaled change to an in-memory ``{'columns', 'rows'}`` state"""
+    columns, rows = state['columns'], state['rows']
+    action, old_value, new_value = change.action, change.old_value, change.new_value
+    if action == 'cell_update' and change.row_id in rows:
+        rows[change.row_id]['data'][change.column] = new_value
+    elif action == 'row_create':
+        rows[new_value['id']] = {**new_value, 'data': dict(new_value['data'])}
+    elif action == 'row_delete':
+        rows.pop(old_value['id'], None)
+    elif action in ('column_create', 'column_update'):
+        if action == 'column_update' and old_value['name'] != new_value['name']:
+            for row in rows.values():
+                if old_value['name'] in row['data']:
+                    row['data'][new_value['name']] = row['data'].pop(old_value['name'])
+        columns[new_value['id']] = dict(new_value)
+    elif action == 'column_delete':
+        columns.pop(old_value['id'], None)
+
+
+# -------------------------------------------------------------------------
+# Undo, redo and restore
+# -------------------------------------------------------------------------
+def _version_groups(list_obj):
+    """Yield (version, kind, reverts_version) for each action, newest first"""
+    seen = set()
+    queryset = (
+        list_obj.changes.order_by('-version')
+        .values_list('version', 'kind', 'reverts_version')
+    )
+    for version, kind, reverts_version in queryset.iterator(chunk_size=200):
+        if version not in seen:
+            seen.add(version)
+            yield version, kind, reverts_version
+
+
+def undo_target(list_obj):
+    """Version of the most recent action that can be undone, or None"""
+    reverted = set()
+    for version, kind, reverts_version in _version_groups(list_obj):
+        if version in reverted:
+            continue
+        if kind in BARRIER_KINDS:
+            return None
+        if kind == 'undo':
+            reverted.add(reverts_version)
+            continue
+        return version
+    return None
+
+
+def redo_target(list_obj):
+    """Version of the most recent undo that can be redone, or None.
+
+    Any new edit after an undo discards the redo history.
+    """
+    reverted = set()
+    for version, kind, reverts_version in _version_groups(list_obj):
+        if version in reverted:
+            continue
+        if kind == 'undo':
+            return version
+        if kind == 'redo':
+            reverted.add(reverts_version)
+            continue
+        return None
+    return None
+
+
+def _revert(list_obj, target, actor, kind):
+    with record_changes(list_obj, actor=actor, kind=kind, reverts_version=target) as changes:
+        for change in reversed(list(list_obj.changes.filter(version=target))):
+            action, old_value, new_value = inverse(change)
+            apply_change(list_obj, changes, action, change.row_id, change.column, old_value, new_value)
+    return changes.version
+
+
+def undo(list_obj, actor=None):
+    """Revert the most recent undoable action. Returns the new version or None."""
+    target = undo_target(list_obj)
+    if target is None:
+        return None
+    return _revert(list_obj, target, actor, 'undo')
+
+
+def redo(list_obj, actor=None):
+    """Re-apply the most recently undone action. Returns the new version or None."""
+    target = redo_target(list_obj)
+    if target is None:
+        return None
+    return _revert(list_obj, target, actor, 'redo')
+
+
+def state_at(list_obj, at):
+    """Columns and rows of a list as of datetime ``at``, or None if unknown.
+
+    Starts from the newest snapshot taken at or before the last change made by
+    ``at`` and replays the journal tail up to that change. Returns None when
+    the tail crosses a checkpoint, whose rows the journal does not hold.
+    """
+    last_version = (
+        list_obj.changes.filter(created_at__lte=at)
+        .order_by('-version').values_list('version', flat=True).first()
+    )
+    snapshots = list_obj.snapshots.all()
+    if last_version is not None:
+        snapshots = snapshots.filter(version__lte=last_version)
+    else:
+        snapshots = snapshots.filter(created_at__lte=at)
+    snapshot = snapshots.first()
+    if snapshot is None:
+        return None
+
+    if last_version is not None:
+        tail = list_obj.changes.filter(version__gt=snapshot.version, version__lte=last_version)
+        if tail.filter(action='bulk_write').exists():
+            return None
+
+    state = {
+        'columns': {column['id']: column for column in snapshot.columns},
+        'rows': {row['id']: row for row in snapshot_rows(snapshot)},
+    }
+    if last_version is not None:
+        for change in tail.iterator(chunk_size=500):
+            apply_to_state(state, change)
+    return state
+
+
+def restore(list_obj, at, actor=None):
+    """Replace a list's columns and rows with its state as of ``at``.
+
+    Returns the new version, or None if no history reaches back that far.
+    """
+    state = state_at(list_obj, at)
+    if state is None:
+        return None
+
+    with transaction.atomic():
+        list_obj.rows.all().delete()
+        list_obj.columns.all().delete()
+        ListColumn.objects.bulk_create([
+            ListColumn(pk=column['id'], user_list=list_obj, **{field: column[field] for field in COLUMN_FIELDS})
+            for column in state['columns'].values()
+        ])
+        rows_from_states(list_obj, list(state['rows'].values()))
+        return checkpoint(list_obj, actor=actor, kind='restore', detail={'restored_to': at.isoformat()})
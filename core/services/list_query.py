@@ -0,0 +1,198 @@
+"""
+Filtering and sorting of list rows in the database.
+
+The list grid describes what it shows with AG Grid's filter model,
+``{colId: {filterType, type, filter, ...}}``, and sort model,
+``[{colId, sort}]``. ``query_rows`` translates both into a queryset over
+``ListRow.data`` so exports read only the matching rows, in the grid's order,
+straight from the database. Columns are referred to by id, as the grid does,
+or by name.
+
+Text filters compare the trimmed text case-insensitively, like the grid.
+Number and date filters compare values cast as in ``list_aggregation``;
+values that do not fit never match. Filtered and sorted queries are run once
+before they are returned, so a query the database rejects fails while the
+export can still answer with an error, not halfway through a download.
+"""
+
+import json
+from datetime import date
+from django.db import DataError, transaction
+from django.db.models import F, Q
+from .list_aggregation import text_value, typed_value
+
+TEXT_LOOKUPS = {
+    'contains': 'icontains',
+    'equals': 'iexact',
+    'startsWith': 'istartswith',
+    'endsWith': 'iendswith',
+}
+
+# Negated text filters, which like the grid also match blank values
+NEGATED_TEXT_LOOKUPS = {
+    'notContains': 'icontains',
+    'notEqual': 'iexact',
+}
+
+COMPARISON_LOOKUPS = {
+    'equals': 'exact',
+    'lessThan': 'lt',
+    'lessThanOrEqual': 'lte',
+    'greaterThan': 'gt',
+    'greaterThanOrEqual': 'gte',
+}
+
+# Types whose values are sorted after casting rather than as text
+TYPED_SORTS = ('number', 'date', 'boolean')
+
+
+def parse_query(filter_text=None, sort_text=None):
+    """Filter and sort models from their JSON text; raises ValueError if malformed"""
+    filter_model = json.loads(filter_text) if filter_text else {}
+    sort_model = json.loads(sort_text) if sort_text else []
+    if not isinstance(filter_model, dict) or not all(isinstance(model, dict) for model in filter_model.values()):
+        raise ValueError('filter must be a JSON object of column filters')
+    if not isinstance(sort_model, list) or not all(isinstance(item, dict) for item in sort_model):
+        raise ValueError('sort must be a JSON array of {colId, sort} objects')
+    return filter_model, sort_model
+
+
+class RowQuery:
+    """Annotations and conditions of a filtered, sorted query over a list's rows"""
+
+    def __init__(self, list_obj):
+        self.list_obj = list_obj
+        self.columns = list(list_obj.columns.all())
+        self.text_annotations = {}
+        self.typed_annotations = {}
+
+    def column(self, col_id):
+        for column in self.columns:
+            if str(column.pk) == str(col_id) or column.name == col_id:
+                return column
+        raise ValueError(f'Unknown column: {col_id}')
+
+    def text(self, column):
+        """Alias of the column's trimmed text"""
+        alias = f't{column.pk}'
+        self.text_annotations[alias] = text_value(column)
+        return alias
+
+    def typed(self, column, column_type):
+        """Alias of the column's value cast to ``column_type``"""
+        alias = f'{column_type[0]}{column.pk}'
+        self.typed_annotations[alias] = typed_value(column, self.text(column), column_type)
+        return alias
+
+    def condition(self, column, model):
+        """Q object for one column filter, possibly combining several conditions"""
+        parts = model.get('conditions') or [model[key] for key in ('condition1', 'condition2') if model.get(key)]
+        if parts:
+            combined = None
+            for part in parts:
+                condition = self.condition(column, {'filterType': model.get('filterType'), **part})
+                if combined is None:
+                    combined = condition
+                elif model.get('operator', 'AND').upper() == 'OR':
+                    combined |= condition
+                else:
+                    combined &= condition
+            return combined
+
+        filter_type = model.get('filterType', 'text')
+        kind = model.get('type')
+        if filter_type == 'set':
+            values = ['true' if value is True else 'false' if value is False else value for value in model.get('values', [])]
+            alias = self.text(column)
+            matches = Q(**{f'{alias}__in': [str(value) for value in values if value is not None]})
+            return matches | Q(**{f'{alias}__isnull': True}) if None in values else matches
+        if kind in ('blank', 'notBlank'):
+            return Q(**{f'{self.text(column)}__isnull': kind == 'blank'})
+        try:
+            if filter_type == 'number':
+                return self.comparison(self.typed(column, 'number'), kind, float(model['filter']), model.get('filterTo'), float)
+            if filter_type == 'date':
+                return self.comparison(self.typed(column, 'date'), kind, parse_date(model['dateFrom']), model.get('dateTo'), parse_date)
+            value = str(model['filter'])
+        except (KeyError, TypeError) as e:
+            raise ValueError(f'Incomplete {filter_type} filter on {column.name}') from e
+
+        alias = self.text(column)
+        if kind in NEGATED_TEXT_LOOKUPS:
+            return Q(**{f'{alias}__isnull': True}) | ~Q(**{f'{alias}__{NEGATED_TEXT_LOOKUPS[kind]}': value})
+        if kind not in TEXT_LOOKUPS:
+            raise ValueError(f'Unknown text filter: {kind}')
+        return Q(**{f'{alias}__{TEXT_LOOKUPS[kind]}': value})
+
+    def comparison(self, alias, kind, value, value_to, convert):
+        if kind == 'inRange':
+            if value_to is None:
+                raise ValueError('inRange filters need an upper bound')
+            return Q(**{f'{alias}__gt': value, f'{alias}__lt': convert(value_to)})
+        if kind == 'notEqual':
+            return Q(**{f'{alias}__isnull': True}) | ~Q(**{f'{alias}__exact': value})
+        if kind not in COMPARISON_LOOKUPS:
+            raise ValueError(f'Unknown comparison filter: {kind}')
+        return Q(**{f'{alias}__{COMPARISON_LOOKUPS[kind]}': value})
+
+    def ordering(self, sort_model):
+        """Order expressions for a sort model; blanks sort last"""
+        order = []
+        for item in sort_model:
+            column = self.column(item.get('colId'))
+            if column.column_type in TYPED_SORTS:
+                alias = self.typed(column, column.column_type)
+            else:
+                alias = self.text(column)
+            direction = item.get('sort') or 'asc'
+            if direction not in ('asc', 'desc'):
+                raise ValueError(f'Unknown sort direction: {direction}')
+            order.append(F(alias).desc(nulls_last=True) if direction == 'desc' else F(alias).asc(nulls_last=True))
+        return order
+
+
+def parse_date(value):
+    """Date of a grid date filter value, ``YYYY-MM-DD`` optionally followed by a time"""
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError as e:
+        raise ValueError(f'Invalid date: {value}') from e
+
+
+def query_rows(list_obj, filter_model=None, sort_model=None):
+    """Rows of a list matching a grid filter model, in sort model order.
+
+    Without a sort model rows keep their default order. Raises ValueError
+    for unknown columns or filter types, or when the database cannot apply
+    the query to the list's values.
+    """
+    if not filter_model and not sort_model:
+        return list_obj.rows.all()
+
+    query = RowQuery(list_obj)
+    condition = Q()
+    for col_id, model in (filter_model or {}).items():
+        condition &= query.condition(query.column(col_id), model)
+    ordering = query.ordering(sort_model or [])
+
+    rows = list_obj.rows.annotate(**query.text_annotations)
+    if query.typed_annotations:
+        rows = rows.annotate(**query.typed_annotations)
+    rows = rows.filter(condition)
+    if ordering:
+        rows = rows.order_by(*ordering, '-created_at')
+    check_rows(rows)
+    return rows
+
+
+def check_rows(rows):
+    """Fetch the first row, raising ValueError if the database rejects the query.
+
+    Rows are always sorted, so Postgres evaluates the filter and sort of
+    every row before it returns the first one.
+    """
+    try:
+        with transaction.atomic():
+            list(rows.values_list('pk', flat=True)[:1])
+    except DataError as e:
+        raise ValueError(f'The filter or sort cannot be applied to this list: {e}') from e
@@ -0,0 +1,231 @@
+"""
+Schema profile of a run's extracted entities.
+
+The profile lists every extracted field with its column type (inferred from
+all of the field's values), sample values, null rate and data quality
+statistics over every value. It is computed in one pass over the entities,
+stored on the run and reused by the import dialog and the import itself. The stored profile carries an MD5 fingerprint of ``Run.extracted`` computed by Postgres,
+so a changed extraction is detected without loading or parsing it.
+"""
+
+import json
+from django.db.models import TextField
+from django.db.models.functions import Cast, MD5
+from ..models import Run
+from .field_stats import FieldStats, select_suggestion, stats_summary, unfit_count
+from .type_inference import TypeTally, INFERENCE_SAMPLE_SIZE
+
+# Bump when the profile format or type inference changes to rebuild stored profiles
+PROFILE_VERSION = 3
+
+# Sample values kept per field for display
+SAMPLE_SIZE = 3
+
+
+def parse_extracted_data(extracted_json):
+    """Parse extracted data from various formats into a list of entities"""
+    if not extracted_json:
+        return []
+
+    # Handle different data structures
+    if isinstance(extracted_json, str):
+        try:
+            extracted_data = json.loads(extracted_json)
+        except json.JSONDecodeError:
+            return []
+    else:
+        extracted_data = extracted_json
+
+    # Extract entities from different possible structures
+    entities = []
+
+    if isinstance(extracted_data, dict):
+        # Check for common result keys
+        for result_key in ['result', 'results', 'output', 'data']:
+            if result_key in extracted_data:
+                result_data = extracted_data[result_key]
+                if isinstance(result_data, list):
+                    entities = result_data
+                    break
+                elif isinstance(result_data, dict) and 'results' in result_data:
+                    entities = result_data['results']
+                    break
+                elif isinstance(result_data, dict) and 'result' in result_data:
+                    entities = result_data['result']
+                    break
+
+        # If no standard structure found, treat the dict itself as an entity
+        if not entities:
+            entities = [extracted_data]
+    elif isinstance(extracted_data, list):
+        entities = extracted_data
+
+    return entities
+
+
+def build_profile(entities):
+    """Profile entities in a single pass"""
+    fields = {}
+    entity_count = 0
+    for entity in entities:
+        entity_count += 1
+        if not isinstance(entity, dict):
+            continue
+        for name, value in entity.items():
+            field = fields.get(name)
+            if field is None:
+                field = fields[name] = {'name': name, 'samples': [], 'types': TypeTally(), 'stats': FieldStats()}
+            field['stats'].add(value)
+            if value is None or value == '':
+                continue
+            if len(field['samples']) < SAMPLE_SIZE:
+                field['samples'].append(value)
+            if INFERENCE_SAMPLE_SIZE is not None and field['stats'].filled <= INFERENCE_SAMPLE_SIZE:
+                field['types'].add(value)
+
+    profile_fields = []
+    for field in fields.values():
+        stats = field['stats']
+        tally = stats.tally() if INFERENCE_SAMPLE_SIZE is None else field['types']
+        profile_fields.append(profile_field(field['name'], tally.best_type(), field['samples'], stats, entity_count))
+    return {'version': PROFILE_VERSION, 'entity_count': entity_count, 'fields': profile_fields}
+
+
+def profile_field(name, column_type, samples, stats, entity_count):
+    """Profile entry of one field"""
+    return {
+        'name': name,
+        'type': column_type,
+        'sample_values': samples,
+        'count': stats.filled,
+        'null_rate': round(1 - stats.filled / entity_count, 4) if entity_count else 0,
+        'stats': stats.to_json(),
+    }
+
+
+def extracted_fingerprint(run):
+    """MD5 of a run's extracted data, computed by the database"""
+    return (
+        Run.objects.filter(pk=run.pk)
+        .annotate(fingerprint=MD5(Cast('extracted', TextField())))
+        .values_list('fingerprint', flat=True)
+        .get()
+    )
+
+
+def get_profile(run):
+    """Stored schema profile of a run, rebuilt if the extraction changed"""
+    fingerprint = extracted_fingerprint(run)
+    profile = run.schema_profile
+    if profile and profile.get('version') == PROFILE_VERSION and profile.get('fingerprint') == fingerprint:
+        return profile
+
+    profile = build_profile(parse_extracted_data(run.extracted))
+    profile['fingerprint'] = fingerprint
+    Run.objects.filter(pk=run.pk).update(schema_profile=profile)
+    run.schema_profile = profile
+    return profile
+
+
+def merge_profiles(profiles):
+    """Combine the profiles of several runs without re-reading their entities"""
+    if len(profiles) == 1:
+        return profiles[0]
+
+    fields = {}
+    entity_count = 0
+    for profile in profiles:
+        entity_count += profile['entity_count']
+        for field in profile['fields']:
+            merged = fields.get(field['name'])
+            if merged is None:
+                merged = fields[field['name']] = {'samples': [], 'stats': FieldStats()}
+            merged['stats'].merge(FieldStats.from_json(field['stats']))
+            merged['samples'] = (merged['samples'] + field['sample_values'])[:SAMPLE_SIZE]
+
+    # Types are inferred again from the merged tallies of all values
+    profile_fields = [
+        profile_field(name, merged['stats'].tally().best_type(), merged['samples'], merged['stats'], entity_count)
+        for name, merged in fields.items()
+    ]
+    return {'version': PROFILE_VERSION, 'entity_count': entity_count, 'fields': profile_fields}
+
+
+def column_definition(field):
+    """Suggested column for a profiled field, with its statistics"""
+    column = {
+        'name': field['name'],
+        'type': field['type'],
+        'sample_values': field['sample_values'],
+        'null_rate': field['null_rate'],
+        'stats': stats_summary(field['stats']),
+    }
+    if field['type'] == 'text':
+        options = select_suggestion(field['stats'])
+        if options:
+            column['suggested_type'] = 'select'
+            column['suggested_options'] = options
+    return column
+
+
+def profile_columns(profile):
+    """Column definitions for every field of a profile"""
+    return [column_definition(field) for field in profile['fields']]
+
+
+def is_type_compatible(detected_type, existing_type):
+    """Check if detected type is compatible with existing column type"""
+    compatibility_map = {
+        'text': ['text', 'url', 'json'],
+        'number': ['number', 'text'],
+        'date': ['date', 'text'],
+        'boolean': ['boolean', 'text'],
+        'url': ['url', 'text'],
+        'json': ['json', 'text']
+    }
+
+    return existing_type in compatibility_map.get(detected_type, ['text'])
+
+
+def analyze_import_impact(run, target_list):
+    """Analyze what will happen when importing extracted data to a list"""
+    return analyze_profile(get_profile(run), target_list)
+
+
+def analyze_profile(profile, target_list):
+    """Analyze what will happen when importing profiled entities to a list"""
+    existing_columns = {col.name: col for col in target_list.columns.all()}
+    existing_rows_count = target_list.rows.count()
+
+    # Categorize changes
+    new_columns = []
+    existing_columns_match = []
+    conflicts = []
+
+    for field in profile['fields']:
+        if field['name'] in existing_columns:
+            # Check for type compatibility of the field and of every value
+            existing_col = existing_columns[field['name']]
+            unfit = unfit_count(field['stats'], existing_col.column_type)
+            if is_type_compatible(field['type'], existing_col.column_type) and not unfit:
+                existing_columns_match.append(field['name'])
+            else:
+                conflicts.append({
+                    'field': field['name'],
+                    'existing_type': existing_col.column_type,
+                    'detected_type': field['type'],
+                    'incompatible_count': unfit,
+                    'sample_values': field['sample_values']
+                })
+        else:
+            new_columns.append(column_definition(field))
+
+    return {
+        'new_rows_count': profile['entity_count'],
+        'existing_rows_count': existing_rows_count,
+        'new_columns': new_columns,
+        'existing_columns_match': existing_columns_match,
+        'conflicts': conflicts,
+        'is_empty_list': existing_rows_count == 0,
+        'extracted_fields_count': len(profile['fields'])
+    }
@@ -0,0 +1,95 @@
+"""
+Column type inference for extracted and stored values.
+
+Each value is classified once against the shared value patterns and counted
+for every type it could belong to. A type is chosen from those tallies, so
+inference is a single pass however many candidate types there are.
+"""
+
+from django.conf import settings
+from .column_types import COMPILED_TYPE_PATTERNS
+
+# Minimum share of non-empty values that must fit a type, tried in this order.
+# Booleans need every value to fit; the first type over its threshold wins.
+DEFAULT_THRESHOLDS = {
+    'boolean': 1.0,
+    'number': 0.8,
+    'url': 0.5,
+    'date': 0.5,
+    'json': 0.3,
+}
+DEFAULT_THRESHOLDS.update(getattr(settings, 'TYPE_INFERENCE_THRESHOLDS', {}))
+
+# Values inspected per column; None inspects all of them
+INFERENCE_SAMPLE_SIZE = getattr(settings, 'TYPE_INFERENCE_SAMPLE_SIZE', None)
+
+BOOLEAN_RE = COMPILED_TYPE_PATTERNS['boolean']
+NUMBER_RE = COMPILED_TYPE_PATTERNS['number']
+URL_RE = COMPILED_TYPE_PATTERNS['url']
+DATE_RE = COMPILED_TYPE_PATTERNS['date']
+
+
+def candidate_types(value):
+    """Types a single non-empty value could belong to"""
+    if isinstance(value, bool):
+        return ('boolean',)
+    if isinstance(value, (int, float)):
+        return ('boolean', 'number') if value in (0, 1) else ('number',)
+    if isinstance(value, (dict, list)):
+        return ('json',)
+
+    text = str(value)
+    if BOOLEAN_RE.match(text):
+        # "1" and "0" are also numbers
+        return ('boolean', 'number') if text.strip() in ('1', '0') else ('boolean',)
+    if NUMBER_RE.match(text):
+        return ('number',)
+    if URL_RE.match(text):
+        return ('url',)
+    if DATE_RE.match(text):
+        return ('date',)
+    return ()
+
+
+class TypeTally:
+    """Running counts of the types seen in one column"""
+
+    def __init__(self):
+        self.total = 0
+        self.counts = dict.fromkeys(DEFAULT_THRESHOLDS, 0)
+
+    def add(self, value):
+        if value is None or value == '':
+            return
+        self.total += 1
+        for column_type in candidate_types(value):
+            self.counts[column_type] += 1
+
+    def update(self, values, sample_size=INFERENCE_SAMPLE_SIZE):
+        for index, value in enumerate(values):
+            if sample_size is not None and index >= sample_size:
+                break
+            self.add(value)
+        return self
+
+    def shares(self):
+        """Share of non-empty values that fit each type"""
+        if not self.total:
+            return {column_type: 0.0 for column_type in self.counts}
+        return {column_type: count / self.total for column_type, count in self.counts.items()}
+
+    def best_type(self, thresholds=None):
+        """Most specific type the tallied values fit, 'text' if none"""
+        if not self.total:
+            return 'text'
+        thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+        shares = self.shares()
+        for column_type, threshold in thresholds.items():
+            if shares.get(column_type, 0) >= threshold:
+                return column_type
+        return 'text'
+
+
+def infer_type(values, sample_size=INFERENCE_SAMPLE_SIZE, thresholds=None):
+    """Infer the column type of a sequence of values"""
+    return TypeTally().update(values, sample_size).best_type(thresholds)
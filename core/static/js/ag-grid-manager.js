@@ -23,6 +23,7 @@ class AgGridManager {
         const gridOptions = {
             columnDefs: processedColumns,
             rowData: processedRows,
+            getRowId: params => String(params.data.id),
             rowSelection: {
                 mode: 'multiRow',
                 checkboxes: true, // Use built-in checkboxes
@@ -61,6 +62,9 @@ class AgGridManager {
         // Update UI
         this.updateRowCount();
         this.updateFooterInfo();
+
+        // Receive changes made by other users
+        this.connectRealtime();
     }
 
     processColumns(columns) {
@@ -254,6 +258,19 @@ class AgGridManager {
             });
         }
 
+        // Upload file button
+        const uploadBtn = document.getElementById('upload-file-btn');
+        const uploadInput = document.getElementById('upload-file-input');
+        if (uploadBtn && uploadInput) {
+            uploadBtn.addEventListener('click', () => uploadInput.click());
+            uploadInput.addEventListener('change', () => {
+                if (uploadInput.files.length) {
+                    this.uploadFile(uploadInput.files[0], uploadBtn);
+                    uploadInput.value = '';
+                }
+            });
+        }
+
         // Export CSV button
         const exportBtn = document.getElementById('export-csv-btn');
         if (exportBtn) {
@@ -362,37 +379,52 @@ class AgGridManager {
         }
     }
 
-    exportToCsv() {
-        // Simple CSV export with all data and headers
-        const dataToExport = this.data.rows;
-        const columnDefs = this.gridApi.getColumnDefs();
-        
-        // Build CSV content
-        let csvContent = '';
-        
-        // Add headers
-        const headers = columnDefs.map(col => col.headerName || col.field || '');
-        csvContent += headers.map(header => `"${header}"`).join(',') + '\n';
-        
-        // Add data rows
-        dataToExport.forEach(row => {
-            const rowData = columnDefs.map(col => {
-                const value = row[col.field] || '';
-                return `"${value.toString().replace(/"/g, '""')}"`;
-            });
-            csvContent += rowData.join(',') + '\n';
+    uploadFile(file, button) {
+        const formData = new FormData();
+        formData.append('file', file);
+        button.disabled = true;
+
+        fetch(`/lists/${this.data.listId}/upload/`, {
+            method: 'POST',
+            headers: {
+                'X-CSRFToken': this.getCsrfToken()
+            },
+            body: formData
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (data.success) {
+                // Uploaded rows and columns arrive with the page
+                window.location.reload();
+            } else {
+                alert('Upload failed: ' + data.error);
+            }
+        })
+        .catch(error => {
+            console.error('Error uploading file:', error);
+            alert('Error uploading file');
+        })
+        .finally(() => {
+            button.disabled = false;
         });
-        
-        // Create and download file
-        const blob = new Blob([csvContent], { type: 'text/csv;charset=utf-8;' });
-        const link = document.createElement('a');
-        const url = URL.createObjectURL(blob);
-        link.setAttribute('href', url);
-        link.setAttribute('download', `table-export-${new Date().toISOString().split('T')[0]}.csv`);
-        link.style.visibility = 'hidden';
-        document.body.appendChild(link);
-        link.click();
-        document.body.removeChild(link);
+    }
+
+    exportToCsv() {
+        // The server exports the rows the grid shows, filtered and sorted the same way
+        const params = new URLSearchParams();
+        const filterModel = this.gridApi.getFilterModel();
+        if (Object.keys(filterModel).length) {
+            params.set('filter', JSON.stringify(filterModel));
+        }
+        const sortModel = this.gridApi.getColumnState()
+            .filter(column => column.sort)
+            .sort((a, b) => (a.sortIndex ?? 0) - (b.sortIndex ?? 0))
+            .map(column => ({ colId: column.colId, sort: column.sort }));
+        if (sortModel.length) {
+            params.set('sort', JSON.stringify(sortModel));
+        }
+        const query = params.toString();
+        window.location.href = `/lists/${this.data.listId}/export/csv/${query ? '?' + query : ''}`;
     }
 
     openTableSettings() {
@@ -400,6 +432,91 @@ class AgGridManager {
         document.getElementById('table-settings-modal').classList.remove('hidden');
     }
 
+    // Realtime updates
+    connectRealtime() {
+        if (!window.WebSocket) return;
+        const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+        const socket = new WebSocket(`${scheme}://${window.location.host}/ws/lists/${this.data.listId}/`);
+        socket.onmessage = (event) => this.onRealtimeMessage(JSON.parse(event.data));
+        socket.onclose = (event) => {
+            // 4403: not allowed or realtime not available on this server
+            if (event.code === 4403) return;
+            this.realtimeRetry = Math.min((this.realtimeRetry || 1000) * 2, 30000);
+            setTimeout(() => this.connectRealtime(), this.realtimeRetry);
+        };
+        socket.onopen = () => {
+            this.realtimeRetry = 0;
+            // Catch up on changes missed while disconnected
+            this.fetchChangesSince(this.data.version);
+        };
+        this.socket = socket;
+    }
+
+    onRealtimeMessage(message) {
+        if (message.type !== 'changes' || message.version <= this.data.version) return;
+        if (message.truncated || message.from_version > this.data.version + 1) {
+            this.fetchChangesSince(this.data.version);
+            return;
+        }
+        this.applyDeltas(message.deltas);
+        this.data.version = message.version;
+    }
+
+    fetchChangesSince(version) {
+        fetch(`/lists/${this.data.listId}/history/?since=${version}`)
+            .then(response => response.json())
+            .then(data => {
+                if (!data.success || data.version <= this.data.version) return;
+                const deltas = data.changes
+                    .filter(change => change.version > this.data.version)
+                    .map(change => ({
+                        action: change.action,
+                        row_id: change.row_id,
+                        column: change.column,
+                        value: change.new_value !== null ? change.new_value : (change.old_value && { id: change.old_value.id })
+                    }));
+                this.applyDeltas(deltas);
+                this.data.version = data.version;
+            })
+            .catch(error => console.error('Error fetching list changes:', error));
+    }
+
+    applyDeltas(deltas) {
+        // Column changes and bulk writes alter the grid layout; reload instead
+        if (deltas.some(delta => delta.action.startsWith('column_') || delta.action === 'bulk_write')) {
+            window.location.reload();
+            return;
+        }
+
+        const fields = {};
+        this.data.columns.forEach(col => { fields[col.name] = col.field; });
+        const add = [], remove = [];
+
+        deltas.forEach(delta => {
+            if (delta.action === 'cell_update') {
+                const node = this.gridApi.getRowNode(String(delta.row_id));
+                const field = fields[delta.column];
+                if (node && field) node.setDataValue(field, delta.value);
+            } else if (delta.action === 'row_create') {
+                const row = { id: delta.value.id };
+                this.data.columns.forEach(col => {
+                    row[col.field] = delta.value.data[col.name] ?? delta.value.data[col.field] ?? '';
+                });
+                add.push(row);
+                this.data.rows.push(row);
+            } else if (delta.action === 'row_delete') {
+                remove.push({ id: delta.value.id });
+                this.data.rows = this.data.rows.filter(row => row.id !== delta.value.id);
+            }
+        });
+
+        if (add.length || remove.length) {
+            this.gridApi.applyTransaction({ add, remove });
+            this.updateRowCount();
+            this.updateFooterInfo();
+        }
+    }
+
     // Utility methods
     getCsrfToken() {
         const cookies = document.cookie.split(';');
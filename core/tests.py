@@ -1,12 +1,62 @@
+import csv
+import gzip
+import io
 import json
 import logging
-from django.test import TestCase, override_settings
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+from contextlib import closing
+from datetime import timedelta
+from pathlib import Path
+from unittest import skipUnless
+from django.test import RequestFactory, TestCase, override_settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import HttpResponse
 from django.contrib.auth import get_user_model
 from unittest.mock import patch, MagicMock
 import requests
-from core.models import Run
+from core.models import Run, UserList, ListColumn, ListRow, ImportJob, ImportMapping
+from core.services.coercion import MAX_FAILURE_SAMPLES, RowCoercer, build_converter
+from core.services.column_validation import check_type_change
+from core.services.list_aggregation import aggregate_list, cached_aggregate
+from core.services.list_import import import_entities, set_dedupe_columns
+from core import auth_backends
+from core.services import export_cache, export_jobs, import_jobs, import_mappings
+from core.services.compression import compress_file, negotiate
+from core.services.field_stats import FieldStats
+from core.services.run_profile import analyze_profile, build_profile, get_profile, merge_profiles
+from core.services.type_inference import TypeTally, infer_type
+from core.services import list_journal, list_events
+from core.middleware import CompressionMiddleware
+from core.realtime import coalesce, origin_allowed
 from core.views import build_source_config, trigger_run
 
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 User = get_user_model()
 logger = logging.getLogger(__name__)
 
@@ -486,4 +536,1110 @@ class YouTubeSourceTestCase(TestCase):
                 # Verify cost control
                 self.assertEqual(config['maxResults'], 1)
                 self.assertEqual(config['maxResultsShorts'], 0)
-                self.assertEqual(config['maxResultStreams'], 0)
\ No newline at end of file
+                self.assertEqual(config['maxResultStreams'], 0)
+
+class ColumnTypeValidationTestCase(TestCase):
+    """Test database-side validation of column type changes"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='lists', password='testpass123')
+        self.user_list = UserList.objects.create(user=self.user, name='Cafes')
+        self.column = ListColumn.objects.create(user_list=self.user_list, name='rating', column_type='text')
+        for value in ['4.5', ' 3 ', '', None, 'five', '1e3']:
+            ListRow.objects.create(user_list=self.user_list, data={'rating': value})
+        ListRow.objects.create(user_list=self.user_list, data={'other': 'x'})
+
+    def test_number_change_reports_conflicts(self):
+        """Test that non-numeric values are counted and sampled"""
+        result = check_type_change(self.user_list, self.column, 'number')
+
+        self.assertFalse(result['allowed'])
+        self.assertEqual(result['checked_count'], 4)
+        self.assertEqual(result['conflict_count'], 1)
+        self.assertEqual(result['sample_conflicts'], ['five'])
+        self.assertEqual(result['suggested_type'], 'text')
+
+    def test_text_change_is_always_safe(self):
+        """Test that types without a pattern accept any value"""
+        result = check_type_change(self.user_list, self.column, 'json')
+
+        self.assertTrue(result['allowed'])
+        self.assertEqual(result['conflict_count'], 0)
+
+    def test_date_change_agrees_with_coercion(self):
+        """Test that dates the coercer cannot parse are reported as conflicts"""
+        column = ListColumn.objects.create(user_list=self.user_list, name='opened', column_type='text')
+        values = ['2024-01-31', '13/04/2024', '29/02/2024', '2024-13-45', '31/02/2024', '2023-02-29']
+        for value in values:
+            ListRow.objects.create(user_list=self.user_list, data={'opened': value})
+
+        result = check_type_change(self.user_list, column, 'date')
+
+        self.assertFalse(result['allowed'])
+        self.assertEqual(result['conflict_count'], 3)
+        self.assertEqual(sorted(result['sample_conflicts']), ['2023-02-29', '2024-13-45', '31/02/2024'])
+        for value in set(values) - set(result['sample_conflicts']):
+            build_converter('date')(value)
+
+    def test_sampled_validation_limits_rows(self):
+        """Test that the sampled mode only checks a subset of rows"""
+        result = check_type_change(self.user_list, self.column, 'number', sample_size=2)
+
+        self.assertTrue(result['sampled'])
+        self.assertLessEqual(result['checked_count'], 2)
+
+
+class ColumnCoercionTestCase(TestCase):
+    """Test the shared column type coercion engine"""
+
+    def test_converters_by_type(self):
+        """Test conversion of values for each column type"""
+        self.assertEqual(build_converter('number')('4.5'), 4.5)
+        self.assertTrue(build_converter('boolean')('Yes'))
+        self.assertFalse(build_converter('boolean')(''))
+        self.assertEqual(build_converter('date')('03/15/2024'), '2024-03-15')
+        self.assertEqual(build_converter('url')('example.com'), 'https://example.com')
+        self.assertEqual(build_converter('multi_select')('a, b,'), ['a', 'b'])
+        self.assertEqual(build_converter('select', ['Active'])('active'), 'Active')
+        self.assertEqual(build_converter('json')('{"a": 1}'), {'a': 1})
+
+    def test_ambiguous_dates_parse_the_same_in_every_row(self):
+        """Test that a day-first row does not change how later rows parse"""
+        convert = build_converter('date')
+
+        self.assertEqual(convert('13/04/2024'), '2024-04-13')
+        self.assertEqual(convert('03/04/2024'), '2024-03-04')
+
+    def test_row_coercer_reports_failures(self):
+        """Test that unconvertible values are kept and reported"""
+        columns = [
+            ListColumn(name='rating', column_type='number'),
+            ListColumn(name='opened', column_type='date'),
+        ]
+        coercer = RowCoercer(columns)
+
+        rows = coercer.coerce_rows([
+            {'rating': '4', 'opened': '2024-01-02', 'ignored': 'x'},
+            {'rating': 'great', 'opened': '2024-01-03'},
+        ])
+
+        self.assertEqual(rows[0], {'rating': 4.0, 'opened': '2024-01-02'})
+        self.assertEqual(rows[1]['rating'], 'great')
+        self.assertEqual(coercer.failure_report()['count'], 1)
+        self.assertEqual(coercer.failures[0].column, 'rating')
+
+    def test_row_coercer_keeps_only_sample_failures(self):
+        """Test that failures are counted per column but only sampled"""
+        coercer = RowCoercer([ListColumn(name='rating', column_type='number')])
+
+        coercer.coerce_values('rating', ['bad'] * (MAX_FAILURE_SAMPLES + 5))
+
+        self.assertEqual(len(coercer.failures), MAX_FAILURE_SAMPLES)
+        report = coercer.failure_report()
+        self.assertEqual(report['count'], MAX_FAILURE_SAMPLES + 5)
+        self.assertEqual(report['columns'], {'rating': MAX_FAILURE_SAMPLES + 5})
+
+
+class ListJournalTestCase(TestCase):
+    """Test the list change journal, undo/redo and restore"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='journal', password='testpass123')
+        self.user_list = UserList.objects.create(user=self.user, name='Bars')
+        self.row = ListRow.objects.create(user_list=self.user_list, data={'city': 'Paris'})
+
+    def set_city(self, value):
+        with list_journal.record_changes(self.user_list, self.user) as changes:
+            changes.cell(self.row.pk, 'city', self.row.data['city'], value)
+            self.row.data = {**self.row.data, 'city': value}
+            self.row.save()
+
+    def test_changes_bump_version(self):
+        """Test that each action produces one list version"""
+        self.set_city('Lyon')
+        self.set_city('Nice')
+
+        self.user_list.refresh_from_db()
+        self.assertEqual(self.user_list.version, 2)
+        self.assertEqual(self.user_list.changes.count(), 2)
+        self.assertEqual(self.user_list.snapshots.first().rows, [
+            {'id': self.row.pk, 'data': {'city': 'Paris'}, 'created_at': self.row.created_at.isoformat()},
+        ])
+
+    def test_undo_and_redo(self):
+        """Test that undo and redo walk the journal in both directions"""
+        self.set_city('Lyon')
+        self.set_city('Nice')
+
+        list_journal.undo(self.user_list, self.user)
+        list_journal.undo(self.user_list, self.user)
+        self.row.refresh_from_db()
+        self.assertEqual(self.row.data['city'], 'Paris')
+        self.assertIsNone(list_journal.undo(self.user_list, self.user))
+
+        list_journal.redo(self.user_list, self.user)
+        self.row.refresh_from_db()
+        self.assertEqual(self.row.data['city'], 'Lyon')
+
+        self.set_city('Rome')
+        self.assertIsNone(list_journal.redo(self.user_list, self.user))
+
+    def test_undo_row_delete_restores_row(self):
+        """Test that undoing a row deletion recreates the row"""
+        with list_journal.record_changes(self.user_list, self.user) as changes:
+            changes.row_deleted(self.row)
+            self.row.delete()
+
+        list_journal.undo(self.user_list, self.user)
+
+        self.assertEqual(self.user_list.rows.get().data, {'city': 'Paris'})
+
+    def test_undo_rename_moves_values_back(self):
+        """Test that undoing a column rename moves the row values back to the old name"""
+        column = ListColumn.objects.create(user_list=self.user_list, name='city', column_type='text', order=0)
+        self.client.force_login(self.user)
+        self.client.post(f'/lists/{self.user_list.pk}/columns/{column.pk}/update/', {'name': 'town'})
+        self.row.refresh_from_db()
+        self.assertEqual(self.row.data, {'town': 'Paris'})
+
+        list_journal.undo(self.user_list, self.user)
+        self.row.refresh_from_db()
+        self.assertEqual(self.row.data, {'city': 'Paris'})
+
+    def test_restore_replays_from_snapshot(self):
+        """Test restoring a list as of a point in time"""
+        self.set_city('Lyon')
+        at = self.user_list.changes.get().created_at
+        self.set_city('Nice')
+        ListRow.objects.create(user_list=self.user_list, data={'city': 'Oslo'})
+        list_journal.checkpoint(self.user_list, self.user)
+
+        list_journal.restore(self.user_list, at, self.user)
+
+        self.assertEqual([row.data for row in self.user_list.rows.all()], [{'city': 'Lyon'}])
+        self.assertIsNone(list_journal.undo(self.user_list, self.user))
+
+    def test_restore_and_undo_keep_creation_times(self):
+        """Test that recreated rows keep the time they were first created"""
+        created_at = self.row.created_at - timedelta(days=30)
+        ListRow.objects.filter(pk=self.row.pk).update(created_at=created_at)
+        self.row.refresh_from_db()
+        with list_journal.record_changes(self.user_list, self.user) as changes:
+            changes.row_deleted(self.row)
+            self.row.delete()
+
+        list_journal.undo(self.user_list, self.user)
+        self.assertEqual(self.user_list.rows.get().created_at, created_at)
+
+        at = self.user_list.changes.order_by('version').last().created_at
+        ListRow.objects.create(user_list=self.user_list, data={'city': 'Oslo'})
+        list_journal.checkpoint(self.user_list, self.user)
+        list_journal.restore(self.user_list, at, self.user)
+        self.assertEqual(self.user_list.rows.get().created_at, created_at)
+
+
+    @patch('core.services.list_journal.SNAPSHOT_KEEP', 2)
+    @patch('core.services.list_journal.SNAPSHOT_CHUNK_SIZE', 2)
+    def test_snapshots_after_checkpoints_chunked_and_pruned(self):
+        """Test that checkpoints defer the snapshot to the next edit, in chunks, keeping the newest"""
+        self.set_city('Lyon')
+        for city in ('Oslo', 'Rome'):
+            ListRow.objects.create(user_list=self.user_list, data={'city': city})
+            list_journal.checkpoint(self.user_list, self.user)
+        self.assertEqual(list(self.user_list.snapshots.values_list('version', 'chunk')), [(0, 0)])
+        at = self.user_list.changes.order_by('version').last().created_at
+
+        self.set_city('Nice')
+        self.assertEqual(list(self.user_list.snapshots.values_list('version', 'chunk')), [(3, 0), (3, 1), (0, 0)])
+        state = list_journal.state_at(self.user_list, at)
+        self.assertEqual(sorted(row['data']['city'] for row in state['rows'].values()), ['Lyon', 'Oslo', 'Rome'])
+
+        ListRow.objects.create(user_list=self.user_list, data={'city': 'Bonn'})
+        list_journal.checkpoint(self.user_list, self.user)
+        self.set_city('Pisa')
+        self.assertEqual(list(self.user_list.snapshots.values_list('version', 'chunk')), [(5, 0), (5, 1), (5, 2), (3, 0), (3, 1)])
+
+
+class ListEventsTestCase(TestCase):
+    """Test realtime list events"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='events', password='testpass123')
+        self.user_list = UserList.objects.create(user=self.user, name='Cafes')
+        self.row = ListRow.objects.create(user_list=self.user_list, data={'city': 'Paris'})
+
+    def test_changes_published_on_commit(self):
+        """Test that journaled changes are published once the transaction commits"""
+        with patch('core.services.list_journal.publish_changes') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                with list_journal.record_changes(self.user_list, self.user) as changes:
+                    changes.cell(self.row.pk, 'city', 'Paris', 'Lyon')
+                publish.assert_not_called()
+
+        list_id, version, kind, published = publish.call_args[0]
+        self.assertEqual((list_id, version, kind), (self.user_list.pk, 1, 'edit'))
+        self.assertEqual(list_events.change_delta(published[0])['value'], 'Lyon')
+
+    @override_settings(ALLOWED_HOSTS=['app.example.com', '.example.org'])
+    def test_socket_origin_must_be_allowed(self):
+        """Test that WebSocket handshakes are only accepted from allowed hosts"""
+        def scope(origin):
+            return {'headers': [(b'cookie', b'sessionid=x')] + ([(b'origin', origin)] if origin else [])}
+
+        self.assertTrue(origin_allowed(scope(b'https://app.example.com')))
+        self.assertTrue(origin_allowed(scope(b'https://eu.example.org:8443')))
+        self.assertFalse(origin_allowed(scope(b'https://evil.example.net')))
+        self.assertFalse(origin_allowed(scope(b'null')))
+        self.assertFalse(origin_allowed(scope(None)))
+
+    def test_large_events_are_truncated(self):
+        """Test that events over the NOTIFY limit only carry the version"""
+        with list_journal.record_changes(self.user_list, self.user) as changes:
+            changes.cell(self.row.pk, 'city', 'Paris', 'x' * 10000)
+
+        event = json.loads(list_events.build_event(self.user_list.pk, 1, 'edit', changes.changes))
+        self.assertTrue(event['truncated'])
+        self.assertNotIn('deltas', event)
+
+    def test_coalesce_keeps_latest_cell_value(self):
+        """Test that batched events keep only the latest value per cell"""
+        cell = {'action': 'cell_update', 'row_id': 1, 'column': 'city'}
+        message = coalesce([
+            {'list': 1, 'version': 3, 'deltas': [{**cell, 'value': 'Lyon'}]},
+            {'list': 1, 'version': 4, 'deltas': [{'action': 'row_delete', 'row_id': 2, 'column': '', 'value': {'id': 2}}]},
+            {'list': 1, 'version': 5, 'deltas': [{**cell, 'value': 'Nice'}]},
+        ])
+
+        self.assertEqual((message['from_version'], message['version']), (3, 5))
+        self.assertEqual([delta['value'] for delta in message['deltas']], [{'id': 2}, 'Nice'])
+
+
+class ListAggregationTestCase(TestCase):
+    """Test list aggregation"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='aggregate', password='testpass123')
+        self.user_list = UserList.objects.create(user=self.user, name='Venues')
+        ListColumn.objects.create(user_list=self.user_list, name='City', column_type='text', order=0)
+        ListColumn.objects.create(user_list=self.user_list, name='Followers', column_type='number', order=1)
+        for city, followers in [('Paris', '100'), ('Paris', 250), ('Lyon', '50'), ('Lyon', 'n/a')]:
+            ListRow.objects.create(user_list=self.user_list, data={'City': city, 'Followers': followers})
+
+    def test_group_by_with_typed_metrics(self):
+        """Test that numeric metrics skip values that are not numbers"""
+        result = aggregate_list(self.user_list, ['City'], [('sum', 'Followers'), ('count', 'Followers')])
+
+        groups = {group['key']['City']: group for group in result['groups']}
+        self.assertEqual(groups['Paris']['metrics']['sum:Followers'], 350)
+        self.assertEqual(groups['Lyon']['metrics']['sum:Followers'], 50)
+        self.assertEqual(groups['Lyon']['count'], 2)
+        self.assertEqual(result['total_groups'], 2)
+
+    def test_out_of_range_values_ignored(self):
+        """Test that values matching a type pattern but out of range do not fail the query"""
+        ListColumn.objects.create(user_list=self.user_list, name='Opened', column_type='date', order=2)
+        ListRow.objects.create(user_list=self.user_list, data={'City': 'Nice', 'Followers': '1e999', 'Opened': '2024-13-45'})
+        ListRow.objects.create(user_list=self.user_list, data={'City': 'Nice', 'Followers': '5', 'Opened': '2024-02-30'})
+        ListRow.objects.create(user_list=self.user_list, data={'City': 'Nice', 'Followers': '7', 'Opened': '2024-03-01'})
+
+        result = aggregate_list(self.user_list, ['City'], [('sum', 'Followers'), ('min', 'Opened'), ('count', 'Opened')])
+
+        nice = next(group for group in result['groups'] if group['key']['City'] == 'Nice')
+        self.assertEqual(nice['metrics']['sum:Followers'], 12)
+        self.assertEqual(nice['metrics']['count:Opened'], 1)
+
+    def test_invalid_metric(self):
+        """Test that numeric operations are rejected for text columns"""
+        with self.assertRaises(ValueError):
+            aggregate_list(self.user_list, [], [('avg', 'City')])
+
+    def test_results_cached_per_version(self):
+        """Test that a new list version bypasses cached results"""
+        metrics = [('distinct', 'City')]
+        self.assertEqual(cached_aggregate(self.user_list, [], metrics)['groups'][0]['metrics']['distinct:City'], 2)
+
+        with list_journal.record_changes(self.user_list, self.user) as changes:
+            row = ListRow.objects.create(user_list=self.user_list, data={'City': 'Nice'})
+            changes.row_created(row)
+        self.assertEqual(cached_aggregate(self.user_list, [], metrics)['groups'][0]['metrics']['distinct:City'], 3)
+
+
+class ListImportTestCase(TestCase):
+    """Test batched entity import"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='importer', password='testpass123')
+        self.user_list = UserList.objects.create(user=self.user, name='Imported')
+        ListColumn.objects.create(user_list=self.user_list, name='name', column_type='text', order=0)
+
+    def test_import_in_batches(self):
+        """Test that entities are written in batches with progress reports"""
+        entities = ({'name': f'Cafe {i}', 'rating': str(i % 5), 'extra': 'x'} for i in range(25))
+        reports = []
+
+        stats = import_entities(
+            self.user_list, entities, actor=self.user,
+            new_columns=[{'name': 'rating', 'type': 'number'}],
+            batch_size=10, progress=reports.append
+        )
+
+        self.assertEqual(stats['imported_rows'], 25)
+        self.assertEqual([report['imported_rows'] for report in reports], [10, 20, 25])
+        self.assertEqual(self.user_list.columns.get(name='rating').order, 1)
+        row = self.user_list.rows.order_by('pk').last()
+        self.assertEqual(row.data, {'name': 'Cafe 24', 'rating': 4.0})
+        self.assertEqual(self.user_list.changes.get().action, 'bulk_write')
+
+    def test_failed_import_rolls_back(self):
+        """Test that a failing import leaves the list untouched"""
+        def entities():
+            yield {'name': 'Kept?'}
+            raise RuntimeError('source failed')
+
+        with self.assertRaises(RuntimeError):
+            import_entities(self.user_list, entities(), batch_size=1, new_columns=[{'name': 'city', 'type': 'text'}])
+
+        self.assertEqual(self.user_list.rows.count(), 0)
+        self.assertEqual(self.user_list.columns.count(), 1)
+
+    def test_upsert_on_dedupe_key(self):
+        """Test that re-importing keyed records updates instead of appending"""
+        ListRow.objects.create(user_list=self.user_list, data={'name': 'Cafe'})
+        ListRow.objects.create(user_list=self.user_list, data={'name': 'cafe '})
+        self.assertEqual(set_dedupe_columns(self.user_list, ['name']), {'keyed_rows': 1, 'duplicate_rows': 1})
+
+        ListColumn.objects.create(user_list=self.user_list, name='city', column_type='text', order=1)
+        entities = [{'name': 'Cafe', 'city': 'Paris'}, {'name': 'Bar', 'city': 'Lyon'}, {'name': 'Bar', 'city': 'Nice'}]
+        stats = import_entities(self.user_list, entities)
+        self.assertEqual((stats['imported_rows'], stats['updated_rows'], stats['skipped_rows']), (1, 1, 1))
+
+        stats = import_entities(self.user_list, entities, mode='skip')
+        self.assertEqual((stats['imported_rows'], stats['updated_rows'], stats['skipped_rows']), (0, 0, 3))
+
+        self.assertEqual(self.user_list.rows.count(), 3)
+        cities = {row.data['name']: row.data.get('city') for row in self.user_list.rows.exclude(key_hash=None)}
+        self.assertEqual(cities, {'Cafe': 'Paris', 'Bar': 'Nice'})
+
+    def test_upsert_after_dedupe_column_renamed(self):
+        """Test that renaming a dedupe column moves its values and keeps rows keyed"""
+        self.client.force_login(self.user)
+        set_dedupe_columns(self.user_list, ['name'])
+        import_entities(self.user_list, [{'name': 'Cafe', 'city': 'Paris'}], new_columns=[{'name': 'city', 'type': 'text'}])
+        column = self.user_list.columns.get(name='name')
+
+        self.client.post(f'/lists/{self.user_list.pk}/columns/{column.pk}/update/', {'name': 'Venue'})
+        self.user_list.refresh_from_db()
+        self.assertEqual(self.user_list.dedupe_columns, ['Venue'])
+        self.assertEqual(self.user_list.rows.get().data, {'Venue': 'Cafe', 'city': 'Paris'})
+
+        stats = import_entities(self.user_list, [{'Venue': 'Cafe', 'city': 'Lyon'}, {'Venue': 'Bar'}])
+        self.assertEqual((stats['imported_rows'], stats['updated_rows']), (1, 1))
+        self.assertEqual(self.user_list.rows.get(data__Venue='Cafe').data['city'], 'Lyon')
+
+        self.client.post(f'/lists/{self.user_list.pk}/columns/{column.pk}/delete/')
+        self.user_list.refresh_from_db()
+        self.assertEqual(self.user_list.dedupe_columns, [])
+        self.assertFalse(self.user_list.rows.exclude(key_hash=None).exists())
+
+    def test_upsert_keeps_user_columns(self):
+        """Test that re-importing a record keeps values users added to its row"""
+        set_dedupe_columns(self.user_list, ['name'])
+        ListColumn.objects.create(user_list=self.user_list, name='city', column_type='text', order=1)
+        ListColumn.objects.create(user_list=self.user_list, name='notes', column_type='text', order=2)
+        import_entities(self.user_list, [{'name': 'Cafe', 'city': 'Paris'}])
+
+        row = self.user_list.rows.get()
+        row.data['notes'] = 'Call back on Monday'
+        row.save()
+
+        stats = import_entities(self.user_list, [{'name': 'Cafe', 'city': 'Lyon'}])
+        self.assertEqual((stats['imported_rows'], stats['updated_rows']), (0, 1))
+        row.refresh_from_db()
+        self.assertEqual(row.data, {'name': 'Cafe', 'city': 'Lyon', 'notes': 'Call back on Monday'})
+
+
+class RunProfileTestCase(TestCase):
+    """Test the cached schema profile of a run"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='profiler', password='testpass123')
+        self.run = Run.objects.create(user=self.user, extracted={'results': [
+            {'name': 'Cafe', 'followers': '120', 'website': ''},
+            {'name': 'Bar', 'followers': '80', 'website': 'https://bar.example'},
+        ]})
+
+    def test_profile_fields(self):
+        """Test that the profile records types, samples and null rates"""
+        profile = get_profile(self.run)
+
+        fields = {field['name']: field for field in profile['fields']}
+        self.assertEqual(profile['entity_count'], 2)
+        self.assertEqual(fields['followers']['type'], 'number')
+        self.assertEqual(fields['website']['null_rate'], 0.5)
+        self.assertEqual(fields['website']['sample_values'], ['https://bar.example'])
+
+    def test_profile_reused_until_extraction_changes(self):
+        """Test that the stored profile is reused and rebuilt on change"""
+        get_profile(self.run)
+        run = Run.objects.get(pk=self.run.pk)
+        with patch('core.services.run_profile.build_profile') as build_profile:
+            get_profile(run)
+            build_profile.assert_not_called()
+
+        run.extracted = {'results': [{'name': 'Cafe', 'city': 'Paris'}]}
+        run.save()
+        profile = get_profile(run)
+        self.assertEqual([field['name'] for field in profile['fields']], ['name', 'city'])
+        self.assertEqual(Run.objects.get(pk=run.pk).schema_profile['entity_count'], 1)
+
+    @patch('core.views.run_views.get_n8n_execution_status', return_value={'status': 'success', 'data': {}})
+    def test_status_polls_profile_once_for_the_owner(self, execution_status):
+        """Test that the status endpoint needs the run's owner and profiles the run only once"""
+        url = f'/runs/{self.run.pk}/status/'
+        self.assertEqual(self.client.get(url).status_code, 302)
+        other = User.objects.create_user(username='stranger', password='testpass123')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        self.client.force_login(self.user)
+        with patch('core.views.run_views.get_profile', wraps=get_profile) as profile:
+            for _ in range(3):
+                self.assertEqual(self.client.get(url).json()['status'], 'success')
+        self.assertEqual(profile.call_count, 1)
+        self.assertEqual(Run.objects.get(pk=self.run.pk).schema_profile['entity_count'], 2)
+
+
+class FieldStatsTestCase(TestCase):
+    """Test single-pass field statistics"""
+
+    def test_distinct_estimate_and_merge(self):
+        """Test that distinct counts are estimated and merge across runs"""
+        first, second = FieldStats(), FieldStats()
+        for i in range(20000):
+            first.add(f'user{i}')
+            second.add(f'user{i + 10000}')
+        first.add('')
+
+        merged = FieldStats.from_json(first.to_json()).merge(second)
+        self.assertAlmostEqual(merged.distinct_count(), 30000, delta=3000)
+        self.assertEqual((merged.total, merged.empty), (40001, 1))
+        self.assertEqual(sum(merged.length_histogram.values()), 40000)
+
+    def test_conflicts_and_suggestions(self):
+        """Test that analysis sees every value and suggests select columns"""
+        user = User.objects.create_user(username='stats', password='testpass123')
+        user_list = UserList.objects.create(user=user, name='Stats')
+        ListColumn.objects.create(user_list=user_list, name='followers', column_type='number', order=0)
+        entities = [{'followers': str(i), 'status': ['open', 'closed'][i % 2]} for i in range(95)]
+        entities += [{'followers': 'n/a', 'status': 'open'}] * 5
+        profile = merge_profiles([build_profile(entities[:50]), build_profile(entities[50:])])
+
+        analysis = analyze_profile(profile, user_list)
+        self.assertEqual(analysis['conflicts'][0]['field'], 'followers')
+        self.assertEqual(analysis['conflicts'][0]['incompatible_count'], 5)
+        status = analysis['new_columns'][0]
+        self.assertEqual((status['suggested_type'], status['suggested_options']), ('select', ['closed', 'open']))
+
+
+class TypeInferenceTestCase(TestCase):
+    """Test single-pass column type inference"""
+
+    def test_infer_types(self):
+        """Test inference for each detectable type"""
+        self.assertEqual(infer_type(['true', 'no', True, '1']), 'boolean')
+        self.assertEqual(infer_type(['1', '2.5', 3, '', None, '-4e2']), 'number')
+        self.assertEqual(infer_type(['https://a.example', 'b.example']), 'url')
+        self.assertEqual(infer_type(['2024-01-05', 'Jan 05, 2024', 'soon']), 'date')
+        self.assertEqual(infer_type([{'a': 1}, 'x', 'y']), 'json')
+        self.assertEqual(infer_type(['Paris', 'Lyon']), 'text')
+        self.assertEqual(infer_type([]), 'text')
+
+    def test_thresholds_and_sample_size(self):
+        """Test that thresholds and sample size are configurable"""
+        values = ['1', '2', '3', 'n/a']
+        self.assertEqual(infer_type(values), 'text')
+        self.assertEqual(infer_type(values, thresholds={'number': 0.75}), 'number')
+        self.assertEqual(infer_type(values, sample_size=3), 'number')
+
+        tally = TypeTally().update(['0', '1', '7'])
+        self.assertEqual(tally.counts['number'], 3)
+        self.assertEqual(tally.best_type(), 'number')
+
+
+class ImportJobTestCase(TestCase):
+    """Test background import jobs"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='jobs', password='testpass123')
+        self.client.force_login(self.user)
+        self.run = Run.objects.create(user=self.user, extracted={'results': [
+            {'name': f'Cafe {i}', 'followers': str(i)} for i in range(5)
+        ]})
+        self.user_list = UserList.objects.create(user=self.user, name='Jobs')
+
+    def test_request_enqueues_and_worker_imports(self):
+        """Test that the import request only queues a job for the worker"""
+        response = self.client.post(f'/runs/{self.run.pk}/add-to-list/{self.user_list.pk}/')
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual(self.user_list.rows.count(), 0)
+
+        job = import_jobs.claim_next_job()
+        self.assertEqual(job.pk, data['job_id'])
+        self.assertIsNone(import_jobs.claim_next_job())
+        import_jobs.run_job(job)
+
+        status = self.client.get(data['status_url']).json()['job']
+        self.assertEqual(status['status'], 'completed')
+        self.assertEqual((status['processed_rows'], status['total_rows']), (5, 5))
+        self.assertEqual(status['result']['imported_rows'], 5)
+        self.assertEqual(self.user_list.rows.count(), 5)
+
+    def test_resume_after_processed_rows(self):
+        """Test that a resumed job skips the rows it already wrote"""
+        job = import_jobs.enqueue_import(self.user, self.user_list, [self.run.pk])
+        ImportJob.objects.filter(pk=job.pk).update(processed_rows=3, result={'imported_rows': 3})
+
+        job = import_jobs.run_job(import_jobs.claim_next_job())
+
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(job.result['imported_rows'], 5)
+        self.assertEqual(self.user_list.rows.count(), 2)
+
+    def test_merge_runs(self):
+        """Test that several runs are merged into one list without copies"""
+        other = Run.objects.create(user=self.user, extracted={'results': [
+            {'name': 'Cafe 0', 'followers': '0'},
+            {'name': 'Bar', 'followers': '7', 'city': 'Paris'},
+        ]})
+
+        response = self.client.post(
+            f'/lists/{self.user_list.pk}/merge-runs/',
+            json.dumps({'run_ids': [self.run.pk, other.pk]}),
+            content_type='application/json'
+        )
+        self.assertTrue(response.json()['success'])
+        job = import_jobs.claim_next_job()
+        self.assertEqual((job.run_ids, job.total_rows), ([self.run.pk, other.pk], 0))
+
+        job = import_jobs.run_job(job)
+        self.assertEqual((job.processed_rows, job.total_rows), (7, 7))
+        self.assertEqual(job.result['duplicate_rows'], 1)
+        self.assertEqual(self.user_list.rows.count(), 6)
+        self.assertEqual(list(self.user_list.columns.values_list('name', flat=True)), ['name', 'followers', 'city'])
+        self.assertEqual(self.user_list.columns.get(name='followers').column_type, 'number')
+
+    def test_mapping_saved_and_reused(self):
+        """Test that the first import saves a mapping that later imports reuse"""
+        import_jobs.run_job(import_jobs.enqueue_import(self.user, self.user_list, [self.run.pk]))
+        mapping = ImportMapping.objects.get(user_list=self.user_list)
+        self.assertEqual(mapping.fields['followers'], {'column': 'followers'})
+
+        response = self.client.post(
+            f'/lists/{self.user_list.pk}/import-mapping/',
+            json.dumps({'fields': {'name': {'column': 'name'}, 'followers': {'column': 'followers', 'type': 'text'}}}),
+            content_type='application/json'
+        )
+        self.assertTrue(response.json()['success'])
+
+        other = Run.objects.create(user=self.user, extracted={'results': [
+            {'name': 'Bar', 'followers': '7', 'city': 'Paris'},
+        ]})
+        with patch('core.services.import_mappings.analyze_profile', wraps=import_mappings.analyze_profile) as analyze:
+            import_jobs.run_job(import_jobs.enqueue_import(self.user, self.user_list, [other.pk]))
+        # Only the unseen field was analyzed
+        self.assertEqual([field['name'] for field in analyze.call_args[0][0]['fields']], ['city'])
+        row = self.user_list.rows.get(data__name='Bar')
+        self.assertEqual(row.data, {'name': 'Bar', 'followers': '7', 'city': 'Paris'})
+        self.assertIn('city', ImportMapping.objects.get(user_list=self.user_list).fields)
+
+    def test_mapping_follows_column_changes(self):
+        """Test that renames retarget mapping rules and rules of deleted columns are surfaced then dropped"""
+        import_jobs.run_job(import_jobs.enqueue_import(self.user, self.user_list, [self.run.pk]))
+        followers = self.user_list.columns.get(name='followers')
+        self.client.post(f'/lists/{self.user_list.pk}/columns/{followers.pk}/update/', {'name': 'fans'})
+        name = self.user_list.columns.get(name='name')
+        self.client.post(f'/lists/{self.user_list.pk}/columns/{name.pk}/delete/')
+
+        mapping = self.client.get(f'/lists/{self.user_list.pk}/import-mapping/').json()['mapping']
+        self.assertEqual(mapping['fields']['followers'], {'column': 'fans'})
+        self.assertEqual(mapping['stale_fields'], ['name'])
+
+        other = Run.objects.create(user=self.user, extracted={'results': [{'name': 'Bar', 'followers': '7'}]})
+        import_jobs.run_job(import_jobs.enqueue_import(self.user, self.user_list, [other.pk]))
+        mapping = ImportMapping.objects.get(user_list=self.user_list)
+        self.assertEqual(mapping.fields['name'], {'column': 'name'})
+        self.assertEqual(self.user_list.rows.get(data__name='Bar').data, {'name': 'Bar', 'fans': 7.0})
+
+
+class ListUploadTestCase(TestCase):
+    """Test importing uploaded files into lists"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='upload', password='testpass123')
+        self.client.force_login(self.user)
+        self.user_list = UserList.objects.create(user=self.user, name='Upload')
+
+    def upload(self, name, content):
+        return self.client.post(
+            f'/lists/{self.user_list.pk}/upload/',
+            {'file': SimpleUploadedFile(name, content)}
+        ).json()
+
+    def test_csv_upload(self):
+        """Test that a CSV file creates typed columns and rows"""
+        data = self.upload('cafes.csv', 'name;followers\nCafe A;10\nCafe B;20\n'.encode('utf-8-sig'))
+
+        self.assertTrue(data['success'])
+        self.assertEqual((data['imported_rows'], data['new_columns']), (2, 2))
+        self.assertEqual(self.user_list.columns.get(name='followers').column_type, 'number')
+        self.assertEqual(self.user_list.rows.get(data__name='Cafe B').data['followers'], 20.0)
+
+    def test_rejects_unknown_type(self):
+        """Test that unsupported files are rejected without writing rows"""
+        data = self.upload('cafes.pdf', b'%PDF')
+
+        self.assertFalse(data['success'])
+        self.assertEqual(self.user_list.rows.count(), 0)
+
+    @skipUnless(openpyxl, 'openpyxl is not installed')
+    def test_rejects_corrupt_xlsx(self):
+        """Test that a damaged spreadsheet is reported like other bad files"""
+        for content in (b'not a zip file', b'PK\x03\x04' + b'\x00' * 40):
+            data = self.upload('cafes.xlsx', content)
+
+            self.assertFalse(data['success'])
+            self.assertIn('not a valid XLSX file', data['error'])
+        self.assertEqual(self.user_list.rows.count(), 0)
+
+
+
+class ExportTestCase(TestCase):
+    """Test list and run exports"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='exporter', password='testpass123')
+        self.client.force_login(self.user)
+        self.user_list = UserList.objects.create(user=self.user, name='Export')
+        ListColumn.objects.create(user_list=self.user_list, name='name', column_type='text', order=0)
+        ListColumn.objects.create(user_list=self.user_list, name='tags', column_type='multi_select', order=1)
+        ListRow.objects.create(user_list=self.user_list, data={'name': 'Cafe, "A"', 'tags': ['x', 'y']})
+        self.run = Run.objects.create(user=self.user, extracted={'results': [
+            {'name': 'Cafe', 'tags': ['x', 'y'], 'meta': {'a': 1}},
+        ]})
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        patcher = patch('core.services.export_cache.EXPORT_CACHE_DIR', Path(cache_dir.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_list_csv_streams(self):
+        """Test that the list CSV is streamed with quoted values"""
+        response = self.client.get(f'/lists/{self.user_list.pk}/export/csv/')
+
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'ID,name,tags,Created At')
+        self.assertIn('"Cafe, ""A""","[""x"", ""y""]"', lines[1])
+
+    def test_run_csv_streams(self):
+        """Test that run entities are streamed as CSV"""
+        response = self.client.get(f'/runs/{self.run.pk}/export/csv/')
+
+        content = b''.join(response.streaming_content).decode()
+        self.assertEqual(list(csv.DictReader(content.splitlines())), [{'name': 'Cafe', 'tags': 'x, y', 'meta': '{"a": 1}'}])
+
+    def test_run_exports_require_owner(self):
+        """Test that run exports are only served to the run's owner"""
+        paths = [f'/runs/{self.run.pk}/export/{suffix}/' for suffix in ('csv', 'json', 'sqlite', 'posts/csv')]
+        self.client.force_login(User.objects.create_user(username='stranger', password='testpass123'))
+        for path in paths:
+            self.assertEqual(self.client.get(path).status_code, 404, path)
+
+        self.client.logout()
+        for path in paths:
+            self.assertEqual(self.client.get(path).status_code, 302, path)
+
+    def test_run_csv_has_every_field(self):
+        """Test that the run CSV covers fields missing from the first entity and selects columns"""
+        self.run.extracted = {'results': [{'name': 'Cafe'}, {'name': 'Bar', 'city': 'Oslo'}]}
+        self.run.save()
+        response = self.client.get(f'/runs/{self.run.pk}/export/csv/')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines, ['name,city', 'Cafe,', 'Bar,Oslo'])
+
+        response = self.client.get(f'/runs/{self.run.pk}/export/csv/?columns=city,name')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines, ['city,name', ',Cafe', 'Oslo,Bar'])
+
+        response = self.client.get(f'/runs/{self.run.pk}/export/csv/?columns=zip')
+        self.assertEqual(response.status_code, 400)
+
+    def test_run_exports_parse_like_the_profile(self):
+        """Test that run exports read entities the way the schema profile does"""
+        self.run.extracted = json.dumps({'data': [{'name': 'Cafe', 'city': 'Oslo'}]})
+        self.run.save()
+
+        lines = b''.join(self.client.get(f'/runs/{self.run.pk}/export/csv/').streaming_content).decode().splitlines()
+        self.assertEqual(lines, ['name,city', 'Cafe,Oslo'])
+        response = self.client.get(f'/runs/{self.run.pk}/export/json/?format=ndjson')
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), {'name': 'Cafe', 'city': 'Oslo'})
+
+    def test_list_export_filter_and_sort(self):
+        """Test that grid filter and sort models are applied to list exports"""
+        rating = ListColumn.objects.create(user_list=self.user_list, name='rating', column_type='number', order=2)
+        city = ListColumn.objects.create(user_list=self.user_list, name='city', column_type='text', order=3)
+        for name, city_name, value in (('A', 'Paris', '4.5'), ('B', 'paris', '12'), ('C', 'Oslo', '5'), ('D', 'Paris', 'n/a')):
+            ListRow.objects.create(user_list=self.user_list, data={'name': name, 'city': city_name, 'rating': value})
+
+        filter_model = json.dumps({str(city.pk): {'filterType': 'text', 'type': 'equals', 'filter': 'Paris'}})
+        sort_model = json.dumps([{'colId': str(rating.pk), 'sort': 'desc'}])
+        response = self.client.get(f'/lists/{self.user_list.pk}/export/json/', {
+            'format': 'ndjson', 'filter': filter_model, 'sort': sort_model,
+        })
+        names = [json.loads(line)['data']['name'] for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(names, ['B', 'A', 'D'])
+
+        filter_model = json.dumps({'rating': {'filterType': 'number', 'type': 'greaterThan', 'filter': 4.8}})
+        response = self.client.get(f'/lists/{self.user_list.pk}/export/csv/', {'filter': filter_model})
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(sorted(row['name'] for row in rows), ['B', 'C'])
+
+        response = self.client.get(f'/lists/{self.user_list.pk}/export/csv/', {'filter': '{"nope": {}}'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_list_export_query_skips_out_of_range_values(self):
+        """Test that sorting and filtering on values the database cannot cast still exports"""
+        rating = ListColumn.objects.create(user_list=self.user_list, name='rating', column_type='number', order=2)
+        opened = ListColumn.objects.create(user_list=self.user_list, name='opened', column_type='date', order=3)
+        for name, value, day in (('A', '3', '2024-01-05'), ('B', '1e999', '2024-13-45'), ('C', '7', '2024-02-30')):
+            ListRow.objects.create(user_list=self.user_list, data={'name': name, 'rating': value, 'opened': day})
+
+        filter_model = json.dumps({str(opened.pk): {'filterType': 'date', 'type': 'lessThan', 'dateFrom': '2025-01-01'}})
+        sort_model = json.dumps([{'colId': str(rating.pk), 'sort': 'desc'}])
+        response = self.client.get(f'/lists/{self.user_list.pk}/export/csv/', {'filter': filter_model})
+        self.assertEqual(response.status_code, 200)
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual([row['name'] for row in rows], ['A'])
+
+        response = self.client.get(f'/lists/{self.user_list.pk}/export/csv/', {'sort': sort_model})
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual([row['name'] for row in rows], ['C', 'A', 'B', 'Cafe, "A"'])
+
+    def test_json_streams_match_document(self):
+        """Test that streamed JSON equals the document and NDJSON has a record per line"""
+        response = self.client.get(f'/lists/{self.user_list.pk}/export/json/')
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(data['columns'][1], {'name': 'tags', 'type': 'multi_select', 'required': False})
+        self.assertEqual(data['rows'][0]['data']['tags'], ['x', 'y'])
+
+        self.run.scraped = {'instagram': [{'id': 1}, {'id': 2}], 'tiktok': []}
+        self.run.save()
+        response = self.client.get(f'/runs/{self.run.pk}/export/scraped/json/?format=ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [
+            {'platform': 'instagram', 'data': {'id': 1}},
+            {'platform': 'instagram', 'data': {'id': 2}},
+        ])
+
+
+    def test_scraped_posts_are_flattened(self):
+        """Test that scraped posts of each platform export to the same columns"""
+        self.run.scraped = {
+            'instagram': [{'url': 'https://instagram.com/p/1', 'caption': 'Hi', 'likesCount': 5, 'hashtags': ['a', 'b']}],
+            'tiktok': [{'webVideoUrl': 'https://tiktok.com/v/2', 'diggCount': 7, 'authorMeta': {'name': 'tok'},
+                        'hashtags': [{'name': 'c'}]}],
+        }
+        self.run.save()
+        response = self.client.get(f'/runs/{self.run.pk}/export/posts/csv/?columns=platform,url,likes,hashtags')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'platform,url,likes,hashtags')
+        self.assertEqual(sorted(lines[1:]), [
+            'instagram,https://instagram.com/p/1,5,"a, b"',
+            'tiktok,https://tiktok.com/v/2,7,c',
+        ])
+
+        response = self.client.get(f'/runs/{self.run.pk}/export/posts/ndjson/?columns=author,caption')
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertCountEqual(records, [{'author': None, 'caption': 'Hi'}, {'author': 'tok', 'caption': None}])
+        self.assertEqual(self.client.get(f'/runs/{self.run.pk}/export/posts/csv/?columns=nope').status_code, 400)
+
+    def test_conditional_get_and_cache(self):
+        """Test that unchanged exports are answered with 304 or from the cache"""
+        url = f'/lists/{self.user_list.pk}/export/csv/'
+        response = self.client.get(url)
+        first = b''.join(response.streaming_content)
+        etag = response['ETag']
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with patch('core.views.export_views.list_csv_stream') as stream:
+            response = self.client.get(url)
+            self.assertEqual(b''.join(response.streaming_content), first)
+            stream.assert_not_called()
+
+        ListRow.objects.create(user_list=self.user_list, data={'name': 'Bar'})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Bar', b''.join(response.streaming_content))
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_cache_evicts_least_recently_used(self):
+        """Test that adding to a full cache deletes the files served least recently"""
+        list_csv, list_json = f'/lists/{self.user_list.pk}/export/csv/', f'/lists/{self.user_list.pk}/export/json/'
+        for url in (list_csv, list_json):
+            b''.join(self.client.get(url).streaming_content)
+        files = {path.suffix: path for path in export_cache.EXPORT_CACHE_DIR.iterdir()}
+        os.utime(files['.csv'], (1000, 1000))
+        os.utime(files['.json'], (2000, 2000))
+        size = sum(path.stat().st_size for path in files.values())
+
+        with patch('core.services.export_cache.EXPORT_CACHE_MAX_BYTES', size):
+            b''.join(self.client.get(list_csv).streaming_content)
+            b''.join(self.client.get(f'/runs/{self.run.pk}/export/csv/').streaming_content)
+
+        remaining = sorted(path.name.split('-')[0] + path.suffix for path in export_cache.EXPORT_CACHE_DIR.iterdir())
+        self.assertEqual(remaining, ['list.csv', 'run.csv'])
+
+    def test_sqlite_snapshots(self):
+        """Test that lists and runs export to typed, indexed SQLite files"""
+        ListColumn.objects.create(user_list=self.user_list, name='followers', column_type='number', order=2)
+        ListRow.objects.create(user_list=self.user_list, data={'name': 'Bar', 'followers': '12'})
+        self.user_list.dedupe_columns = ['name']
+        self.user_list.save()
+
+        path = Path(tempfile.mkdtemp()) / 'export.sqlite'
+        self.addCleanup(shutil.rmtree, path.parent)
+        response = self.client.get(f'/lists/{self.user_list.pk}/export/sqlite/')
+        path.write_bytes(b''.join(response.streaming_content))
+        with closing(sqlite3.connect(path)) as connection:
+            self.assertEqual(connection.execute('SELECT followers FROM rows WHERE name = ?', ['Bar']).fetchone(), (12.0,))
+            indexes = connection.execute("SELECT sql FROM sqlite_master WHERE type = 'index'").fetchall()
+            self.assertIn('ON "rows" ("name")', ' '.join(sql for sql, in indexes))
+
+        self.run.scraped = {'tiktok': [{'id': 'v1', 'diggCount': 7}]}
+        self.run.save()
+        response = self.client.get(f'/runs/{self.run.pk}/export/sqlite/')
+        path.write_bytes(b''.join(response.streaming_content))
+        with closing(sqlite3.connect(path)) as connection:
+            self.assertEqual(connection.execute('SELECT name, tags FROM entities').fetchall(), [('Cafe', '["x", "y"]')])
+            self.assertEqual(connection.execute('SELECT platform, likes FROM posts').fetchall(), [('tiktok', 7)])
+
+    def test_sqlite_column_names_differ_only_in_case(self):
+        """Test that columns named like others but for case get numbered SQLite columns"""
+        ListColumn.objects.create(user_list=self.user_list, name='id', column_type='text', order=2)
+        ListColumn.objects.create(user_list=self.user_list, name='Name', column_type='text', order=3)
+        ListRow.objects.create(user_list=self.user_list, data={'name': 'Bar', 'Name': 'BAR', 'id': 'ext-1'})
+
+        path = Path(tempfile.mkdtemp()) / 'export.sqlite'
+        self.addCleanup(shutil.rmtree, path.parent)
+        response = self.client.get(f'/lists/{self.user_list.pk}/export/sqlite/')
+        path.write_bytes(b''.join(response.streaming_content))
+        with closing(sqlite3.connect(path)) as connection:
+            row = connection.execute('SELECT name, Name_2, id_2 FROM rows WHERE id_2 IS NOT NULL').fetchone()
+        self.assertEqual(row, ('Bar', 'BAR', 'ext-1'))
+
+    @skipUnless(pyarrow, 'pyarrow is not installed')
+    def test_parquet_and_arrow_are_typed(self):
+        """Test that columnar exports carry the column and profile types"""
+        ListColumn.objects.create(user_list=self.user_list, name='followers', column_type='number', order=2)
+        ListRow.objects.create(user_list=self.user_list, data={'name': 'Bar', 'followers': 12.0})
+
+        response = self.client.get(f'/lists/{self.user_list.pk}/export/parquet/')
+        table = pyarrow.parquet.read_table(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(str(table.schema.field('followers').type), 'double')
+        self.assertEqual(table.column('tags').to_pylist()[-1], ['x', 'y'])
+        self.assertEqual(sorted(table.column('followers').to_pylist(), key=str), [12.0, None])
+
+        response = self.client.get(f'/runs/{self.run.pk}/export/arrow/')
+        table = pyarrow.ipc.open_file(io.BytesIO(b''.join(response.streaming_content))).read_all()
+        self.assertEqual(table.column('meta').to_pylist(), ['{"a": 1}'])
+
+
+class ExportJobTestCase(TestCase):
+    """Test background exports and resumable downloads"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='bulk-exporter', password='testpass123')
+        self.client.force_login(self.user)
+        self.user_list = UserList.objects.create(user=self.user, name='Bulk')
+        ListColumn.objects.create(user_list=self.user_list, name='name', column_type='text', order=0)
+        ListRow.objects.bulk_create([ListRow(user_list=self.user_list, data={'name': f'Row {i}'}) for i in range(50)])
+        files_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(files_dir.cleanup)
+        patcher = patch('core.services.export_jobs.EXPORT_FILES_DIR', Path(files_dir.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_gzip_export_job(self):
+        """Test that a queued export is written compressed and downloads whole"""
+        data = self.client.post(f'/lists/{self.user_list.pk}/export/jobs/', {'format': 'ndjson', 'compress': '1'}).json()
+        self.assertIsNone(self.client.get(data['status_url']).json()['job']['download_url'])
+
+        job = export_jobs.run_job(export_jobs.claim_next_job())
+        self.assertEqual(job.status, 'completed')
+
+        status = self.client.get(data['status_url']).json()['job']
+        response = self.client.get(status['download_url'])
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(len(lines), 50)
+        self.assertEqual(status['bytes_written'], int(response['Content-Length']))
+
+    def test_range_download(self):
+        """Test that downloads resume with Range requests"""
+        job = export_jobs.enqueue_export(self.user, 'csv', user_list=self.user_list)
+        job = export_jobs.run_job(export_jobs.claim_next_job())
+        url = f'/exports/{job.pk}/download/'
+        full = self.client.get(url)
+        content = b''.join(full.streaming_content)
+
+        response = self.client.get(url, HTTP_RANGE='bytes=100-', HTTP_IF_RANGE=full['ETag'])
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-{len(content) - 1}/{len(content)}')
+        self.assertEqual(b''.join(response.streaming_content), content[100:])
+
+        response = self.client.get(url, HTTP_RANGE='bytes=100-', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_RANGE=f'bytes={len(content)}-').status_code, 416)
+
+
+class CompressionTestCase(TestCase):
+    """Test negotiated response compression"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='compressor', password='testpass123')
+        self.client.force_login(self.user)
+        self.user_list = UserList.objects.create(user=self.user, name='Compressed')
+        ListColumn.objects.create(user_list=self.user_list, name='name', column_type='text', order=0)
+        ListRow.objects.bulk_create([ListRow(user_list=self.user_list, data={'name': f'Place {i}'}) for i in range(200)])
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        patcher = patch('core.services.export_cache.EXPORT_CACHE_DIR', Path(cache_dir.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_negotiate(self):
+        """Test that the client's weights come first and server preference breaks ties"""
+        with patch('core.services.compression.available_encodings', return_value=['zstd', 'br', 'gzip']):
+            self.assertEqual(negotiate('gzip, deflate, br, zstd'), 'zstd')
+            self.assertEqual(negotiate('gzip, br;q=0.5'), 'gzip')
+            self.assertEqual(negotiate('*'), 'zstd')
+            self.assertIsNone(negotiate('identity'))
+            self.assertIsNone(negotiate('gzip;q=0'))
+
+    def test_export_compressed_then_served_precompressed(self):
+        """Test that exports are gzipped while streaming and then served from a precompressed copy"""
+        with patch('core.services.compression.available_encodings', return_value=['gzip']):
+            response = self.client.get(f'/lists/{self.user_list.pk}/export/json/', HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertIn('Accept-Encoding', response['Vary'])
+            data = json.loads(gzip.decompress(b''.join(response.streaming_content)))
+            self.assertEqual(len(data['rows']), 200)
+
+            url = f'/lists/{self.user_list.pk}/export/csv/'
+            plain = b''.join(self.client.get(url).streaming_content)
+            with patch('core.services.export_cache.compress_file', wraps=compress_file) as compress:
+                for _ in range(2):
+                    response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+                    self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), plain)
+                self.assertEqual(compress.call_count, 1)
+            self.assertTrue(response['ETag'].startswith('W/'))
+            self.assertEqual(self.client.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def assert_export_round_trip(self, encoding, decompress):
+        """Stream a list export in ``encoding``, then serve it precompressed, and compare both to the plain export"""
+        url = f'/lists/{self.user_list.pk}/export/csv/'
+        plain = b''.join(self.client.get(url).streaming_content)
+        for _ in range(2):
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING=encoding)
+            self.assertEqual(response['Content-Encoding'], encoding)
+            self.assertEqual(decompress(b''.join(response.streaming_content)), plain)
+
+    @skipUnless(brotli, 'brotli is not installed')
+    def test_export_brotli(self):
+        """Test that brotli exports decompress to the plain export"""
+        self.assert_export_round_trip('br', brotli.decompress)
+
+    @skipUnless(zstandard, 'zstandard is not installed')
+    def test_export_zstd(self):
+        """Test that zstd exports decompress to the plain export"""
+        self.assert_export_round_trip('zstd', lambda data: zstandard.ZstdDecompressor().decompressobj().decompress(data))
+
+    def test_html_only_gzipped_with_padding(self):
+        """Test that pages are left to GZipMiddleware, which pads the gzip header against BREACH"""
+        page = HttpResponse('<form><input name="csrfmiddlewaretoken" value="secret"></form>' * 50)
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='zstd, br, gzip')
+        with patch('core.services.compression.available_encodings', return_value=['zstd', 'br', 'gzip']):
+            response = CompressionMiddleware(lambda request: page)(request)
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        # FNAME flag: the random-length file name is the padding
+        self.assertTrue(response.content[3] & 0x08)
+        self.assertIn(b'secret', gzip.decompress(response.content))
+
+    def test_small_and_ranged_responses_are_not_compressed(self):
+        """Test that small responses and range-capable downloads are sent as they are"""
+        response = self.client.get('/exports/0/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+        files_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(files_dir.cleanup)
+        with patch('core.services.export_jobs.EXPORT_FILES_DIR', Path(files_dir.name)):
+            export_jobs.enqueue_export(self.user, 'csv', user_list=self.user_list)
+            job = export_jobs.run_job(export_jobs.claim_next_job())
+            response = self.client.get(f'/exports/{job.pk}/download/', HTTP_ACCEPT_ENCODING='gzip')
+            self.assertFalse(response.has_header('Content-Encoding'))
+            response.close()
+
+
+@patch('core.auth_backends._client', None)
+class SupabaseClientTestCase(TestCase):
+    """Test the shared Supabase client"""
+
+    @patch.dict('os.environ', {'SUPABASE_URL': 'http://supabase.test', 'SUPABASE_ANON_KEY': 'anon'})
+    @patch('core.auth_backends.create_client')
+    def test_client_created_once_on_first_use(self, create_client):
+        """Test that backends share one lazily created client across threads"""
+        backend = auth_backends.SupabaseAuthBackend()
+        create_client.assert_not_called()
+
+        clients = []
+        threads = [threading.Thread(target=lambda: clients.append(backend.client)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        create_client.assert_called_once()
+        self.assertEqual(len(set(map(id, clients))), 1)
+        self.assertIs(auth_backends.SupabaseAuthBackend().client, clients[0])
+
+    @patch.dict('os.environ', {'SUPABASE_URL': '', 'SUPABASE_ANON_KEY': ''})
+    def test_missing_configuration_fails_on_use(self):
+        """Test that a missing configuration only fails when the client is needed"""
+        backend = auth_backends.SupabaseAuthBackend()
+        self.assertIsNone(backend.get_user(0))
+        with self.assertRaises(ImproperlyConfigured):
+            backend.client
+
+    @patch.dict('os.environ', {'SUPABASE_URL': 'http://supabase.test', 'SUPABASE_ANON_KEY': 'anon'})
+    @patch('core.auth_backends.create_client')
+    @patch('core.auth_backends.requests.post')
+    def test_refresh_keeps_no_session_on_shared_client(self, post, create_client):
+        """Test that token refresh calls the token endpoint without the shared client"""
+        post.return_value = MagicMock(content=json.dumps({
+            'access_token': 'new-access', 'refresh_token': 'new-refresh', 'token_type': 'bearer',
+            'expires_in': 3600, 'user': {
+                'id': '00000000-0000-0000-0000-000000000001', 'aud': 'authenticated',
+                'app_metadata': {}, 'user_metadata': {}, 'created_at': '2024-01-01T00:00:00Z',
+            },
+        }).encode())
+
+        session = auth_backends.SupabaseAuthBackend().refresh_token('old-refresh')
+
+        self.assertEqual((session.access_token, session.refresh_token), ('new-access', 'new-refresh'))
+        self.assertEqual(post.call_args.kwargs['params'], {'grant_type': 'refresh_token'})
+        self.assertEqual(post.call_args.kwargs['json'], {'refresh_token': 'old-refresh'})
+        create_client.assert_not_called()
+
@@ -1,176 +1,454 @@
-import json
-import csv
+import os
+import re
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponse, JsonResponse
-from ..models import Run, UserList, ListColumn, ListRow
+from django.contrib.auth.decorators import login_required
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_http_methods
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from ..models import Run, UserList, ListColumn, ListRow, ExportJob
+from ..services.export_cache import (
+    build_in_cache, cached_file, compressed_file, list_export_key, run_export_key, tee_to_cache, write_to_cache,
+)
+from ..services.compression import COMPRESSION_MIN_SIZE, is_compressible, negotiate
+from ..services.export_jobs import CONTENT_TYPES, enqueue_export, export_name, job_path, job_status, read_range
+from ..services.exports import (
+    COLUMNAR_FORMATS, POST_COLUMNS, columnar_available, json_stream, list_csv_stream, list_json_document,
+    list_json_rows, ndjson_stream, post_records, posts_csv_stream, run_csv_stream, scraped_records,
+    select_fields, write_list_columnar, write_list_sqlite, write_run_columnar, write_run_sqlite,
+)
+from ..services.list_query import parse_query, query_rows
+from ..services.run_profile import get_profile, parse_extracted_data
 
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
 
+SQLITE_CONTENT_TYPE = 'application/vnd.sqlite3'
+
+# Run payloads are only loaded once the export is known not to be cached
+RUN_PAYLOAD_FIELDS = ('scraped', 'extracted', 'output', 'schema_profile')
+
+
+def wants_ndjson(request):
+    """JSON exports are NDJSON, one record per line, with ?format=ndjson"""
+    return request.GET.get('format') == 'ndjson'
+
+
+def json_extension(request):
+    return 'ndjson' if wants_ndjson(request) else 'json'
+
+
+def requested_fields(request):
+    """Fields selected with ?columns=a,b or repeated ?columns=, in order"""
+    names = [name.strip() for value in request.GET.getlist('columns') for name in value.split(',')]
+    return [name for name in names if name]
+
+
+def json_content_type(key):
+    return 'application/x-ndjson' if key.extension == 'ndjson' else 'application/json'
+
+
+def conditional_export(request, key):
+    """304 response if the client's copy of the export is current"""
+    last_modified = key.last_modified.timestamp() if key.last_modified else None
+    return get_conditional_response(request, etag=quote_etag(key.etag), last_modified=last_modified)
+
+
+def export_response(request, key, filename, content_type, chunks=None, write=None, build=None, cached=None):
+    """Download of an export, served from the cache or rendered into it.
+
+    Text exports pass ``chunks`` and stream to the client while they are
+    cached; file exports pass ``write``, or ``build`` to get a file name, and
+    are rendered before sending. Cached exports are sent precompressed when
+    the client accepts an encoding; others are compressed by the middleware.
+    """
+    encoding = None
+    if cached is not None and is_compressible(content_type) and os.fstat(cached.fileno()).st_size >= COMPRESSION_MIN_SIZE:
+        encoding = negotiate(request.headers.get('Accept-Encoding'))
+    compressed = compressed_file(key, encoding) if encoding else None
+
+    if compressed is not None:
+        cached.close()
+        response = FileResponse(compressed, content_type=content_type)
+        response['Content-Encoding'] = encoding
+    elif cached is not None:
+        response = FileResponse(cached, content_type=content_type)
+    elif chunks is not None:
+        response = StreamingHttpResponse(tee_to_cache(chunks, key), content_type=content_type)
+    elif build is not None:
+        response = FileResponse(build_in_cache(build, key), content_type=content_type)
+    else:
+        response = FileResponse(write_to_cache(write, key), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{key.extension}"'
+    # Encoded copies are not byte-identical to the export, so their ETag is weak
+    response['ETag'] = ('W/' if compressed is not None else '') + quote_etag(key.etag)
+    if cached is not None and is_compressible(content_type):
+        patch_vary_headers(response, ('Accept-Encoding',))
+    if key.last_modified:
+        response['Last-Modified'] = http_date(key.last_modified.timestamp())
+    # Exports are per user; clients revalidate with the ETag before reuse
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def list_query(request, list_obj):
+    """Rows and cache key state for the grid's ?filter= and ?sort= models.
+
+    Raises ValueError for malformed models or unknown columns.
+    """
+    filter_model, sort_model = parse_query(request.GET.get('filter'), request.GET.get('sort'))
+    rows = query_rows(list_obj, filter_model, sort_model)
+    return rows, [filter_model, sort_model] if filter_model or sort_model else None
+
+
+@login_required
 def export_list_csv(request, pk):
+    """CSV of a list, optionally filtered and sorted like the grid"""
     list_obj = get_object_or_404(UserList, pk=pk, user=request.user)
-    columns = list_obj.columns.all().order_by('order')
-    rows = list_obj.rows.all()
-
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="{list_obj.name}.csv"'
-
-    writer = csv.writer(response)
-    # Write header
-    header = ['ID'] + [col.name for col in columns] + ['Created At']
-    writer.writerow(header)
-
-    for row in rows:
-        row_data = [row.pk]
-        for col in columns:
-            value = row.data.get(col.name, '')
-            if isinstance(value, (dict, list)):
-                value = json.dumps(value)
-            row_data.append(str(value))
-        row_data.append(row.created_at.isoformat())
-        writer.writerow(row_data)
+    try:
+        rows, query = list_query(request, list_obj)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    key = list_export_key(list_obj, 'csv', query)
 
-    return response
+    not_modified = conditional_export(request, key)
+    if not_modified:
+        return not_modified
+
+    cached = cached_file(key)
+    if cached:
+        return export_response(request, key, list_obj.name, 'text/csv', cached=cached)
 
+    return export_response(request, key, list_obj.name, 'text/csv', chunks=list_csv_stream(list_obj, rows))
 
+
+@login_required
 def export_list_json(request, pk):
+    """JSON or NDJSON of a list, optionally filtered and sorted like the grid"""
     list_obj = get_object_or_404(UserList, pk=pk, user=request.user)
-    columns = list_obj.columns.all().order_by('order')
-    rows = list_obj.rows.all()
-
-    data = {
-        'list': {
-            'id': list_obj.pk,
-            'name': list_obj.name,
-            'description': list_obj.description,
-            'created_at': list_obj.created_at.isoformat()
-        },
-        'columns': [
-            {
-                'name': col.name,
-                'type': col.column_type,
-                'required': col.required
-            } for col in columns
-        ],
-        'rows': [
-            {
-                'id': row.pk,
-                'data': row.data,
-                'created_at': row.created_at.isoformat(),
-                'updated_at': row.updated_at.isoformat()
-            } for row in rows
-        ]
-    }
-
-    response = HttpResponse(json.dumps(data, indent=2), content_type='application/json')
-    response['Content-Disposition'] = f'attachment; filename="{list_obj.name}.json"'
+    try:
+        rows, query = list_query(request, list_obj)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    key = list_export_key(list_obj, json_extension(request), query)
 
-    return response
+    not_modified = conditional_export(request, key)
+    if not_modified:
+        return not_modified
+
+    cached = cached_file(key)
+    if cached:
+        return export_response(request, key, list_obj.name, json_content_type(key), cached=cached)
+
+    if key.extension == 'ndjson':
+        chunks = ndjson_stream(list_json_rows(list_obj, rows))
+    else:
+        chunks = json_stream(list_json_document(list_obj, rows))
+    return export_response(request, key, list_obj.name, json_content_type(key), chunks=chunks)
+
+
+@login_required
+def export_list_columnar(request, pk, file_format):
+    if not columnar_available():
+        return JsonResponse({"error": "Parquet and Arrow exports require pyarrow"}, status=501)
+    list_obj = get_object_or_404(UserList, pk=pk, user=request.user)
+    content_type, extension = COLUMNAR_FORMATS[file_format]
+    key = list_export_key(list_obj, extension)
+
+    not_modified = conditional_export(request, key)
+    if not_modified:
+        return not_modified
+
+    cached = cached_file(key)
+    if cached:
+        return export_response(request, key, list_obj.name, content_type, cached=cached)
 
+    return export_response(
+        request, key, list_obj.name, content_type, write=lambda sink: write_list_columnar(list_obj, file_format, sink),
+    )
+
+
+@login_required
+def export_list_sqlite(request, pk):
+    """SQLite database file of a list for offline queries"""
+    list_obj = get_object_or_404(UserList, pk=pk, user=request.user)
+    key = list_export_key(list_obj, 'sqlite')
 
+    not_modified = conditional_export(request, key)
+    if not_modified:
+        return not_modified
+
+    cached = cached_file(key)
+    if cached:
+        return export_response(request, key, list_obj.name, SQLITE_CONTENT_TYPE, cached=cached)
+
+    return export_response(
+        request, key, list_obj.name, SQLITE_CONTENT_TYPE, build=lambda path: write_list_sqlite(list_obj, path),
+    )
+
+
+@login_required
 def export_run_csv(request, pk):
-    run = get_object_or_404(Run, pk=pk)
-    entities = []
-
-    # Extract entities from various possible data structures
-    if run.extracted:
-        if isinstance(run.extracted, dict):
-            if 'result' in run.extracted and isinstance(run.extracted['result'], list):
-                entities = run.extracted['result']
-            elif 'results' in run.extracted and isinstance(run.extracted['results'], list):
-                entities = run.extracted['results']
-            elif 'output' in run.extracted and isinstance(run.extracted['output'], dict):
-                output = run.extracted['output']
-                if 'results' in output and isinstance(output['results'], list):
-                    entities = output['results']
-                elif 'result' in output and isinstance(output['result'], list):
-                    entities = output['result']
-        elif isinstance(run.extracted, list):
-            entities = run.extracted
-
-    # Fallback to legacy output
-    if not entities and run.output and isinstance(run.output, list):
-        entities = run.output
+    """CSV of a run's entities with a column for every extracted field.
+
+    ``?columns=`` selects and orders the columns.
+    """
+    run = get_object_or_404(Run.objects.defer(*RUN_PAYLOAD_FIELDS), pk=pk, user_id=request.user.id)
+    selected = requested_fields(request)
+    key = run_export_key(run, 'extracted', 'csv', selected)
+
+    not_modified = conditional_export(request, key)
+    if not_modified:
+        return not_modified
 
+    cached = cached_file(key)
+    if cached:
+        return export_response(request, key, f'run_{pk}_extracted', 'text/csv', cached=cached)
+
+    entities = parse_extracted_data(run.extracted)
     if not entities:
         return HttpResponse("No extracted data available for export", status=404)
 
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="run_{pk}_extracted.csv"'
-
-    writer = csv.writer(response)
-
-    # Write headers from first entity
-    if entities:
-        headers = list(entities[0].keys())
-        writer.writerow(headers)
-
-        # Write data rows
-        for entity in entities:
-            row = []
-            for header in headers:
-                value = entity.get(header, '')
-                if isinstance(value, list):
-                    row.append(', '.join(str(v) for v in value))
-                elif isinstance(value, dict):
-                    row.append(json.dumps(value))
-                else:
-                    row.append(str(value))
-            writer.writerow(row)
+    names = [field['name'] for field in get_profile(run)['fields']]
+    try:
+        headers = select_fields(names, selected)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return export_response(request, key, f'run_{pk}_extracted', 'text/csv', chunks=run_csv_stream(entities, headers))
 
-    return response
 
+@login_required
+def export_run_columnar(request, pk, file_format):
+    if not columnar_available():
+        return JsonResponse({"error": "Parquet and Arrow exports require pyarrow"}, status=501)
+    run = get_object_or_404(Run.objects.defer(*RUN_PAYLOAD_FIELDS), pk=pk, user_id=request.user.id)
+    content_type, extension = COLUMNAR_FORMATS[file_format]
+    key = run_export_key(run, 'extracted', extension)
 
-def export_run_json(request, pk):
-    run = get_object_or_404(Run, pk=pk)
-    entities = []
-
-    # Extract entities from various possible data structures
-    if run.extracted:
-        if isinstance(run.extracted, dict):
-            if 'result' in run.extracted and isinstance(run.extracted['result'], list):
-                entities = run.extracted['result']
-            elif 'results' in run.extracted and isinstance(run.extracted['results'], list):
-                entities = run.extracted['results']
-            elif 'output' in run.extracted and isinstance(run.extracted['output'], dict):
-                output = run.extracted['output']
-                if 'results' in output and isinstance(output['results'], list):
-                    entities = output['results']
-                elif 'result' in output and isinstance(output['result'], list):
-                    entities = output['result']
-        elif isinstance(run.extracted, list):
-            entities = run.extracted
-
-    # Fallback to legacy output
-    if not entities and run.output and isinstance(run.output, list):
-        entities = run.output
+    not_modified = conditional_export(request, key)
+    if not_modified:
+        return not_modified
 
+    cached = cached_file(key)
+    if cached:
+        return export_response(request, key, f'run_{pk}_extracted', content_type, cached=cached)
+
+    entities = parse_extracted_data(run.extracted)
     if not entities:
         return JsonResponse({"error": "No extracted data available for export"}, status=404)
 
-    data = {
-        "run_id": run.pk,
-        "created_at": run.created_at.isoformat(),
-        "entities": entities
-    }
+    profile = get_profile(run)
+    return export_response(
+        request, key, f'run_{pk}_extracted', content_type,
+        write=lambda sink: write_run_columnar(entities, profile, file_format, sink),
+    )
 
-    response = HttpResponse(json.dumps(data, indent=2), content_type='application/json')
-    response['Content-Disposition'] = f'attachment; filename="run_{pk}_extracted.json"'
 
-    return response
+@login_required
+def export_run_sqlite(request, pk):
+    """SQLite database file of a run's entities and scraped posts"""
+    run = get_object_or_404(Run.objects.defer(*RUN_PAYLOAD_FIELDS), pk=pk, user_id=request.user.id)
+    key = run_export_key(run, 'snapshot', 'sqlite')
 
+    not_modified = conditional_export(request, key)
+    if not_modified:
+        return not_modified
 
+    cached = cached_file(key)
+    if cached:
+        return export_response(request, key, f'run_{pk}', SQLITE_CONTENT_TYPE, cached=cached)
+
+    entities = parse_extracted_data(run.extracted)
+    if not entities and not run.scraped:
+        return JsonResponse({"error": "No data available for export"}, status=404)
+
+    profile = get_profile(run)
+    return export_response(
+        request, key, f'run_{pk}', SQLITE_CONTENT_TYPE, build=lambda path: write_run_sqlite(run, entities, profile, path),
+    )
+
+
+@login_required
+def export_run_json(request, pk):
+    run = get_object_or_404(Run.objects.defer(*RUN_PAYLOAD_FIELDS), pk=pk, user_id=request.user.id)
+    key = run_export_key(run, 'extracted', json_extension(request))
+
+    not_modified = conditional_export(request, key)
+    if not_modified:
+        return not_modified
+
+    cached = cached_file(key)
+    if cached:
+        return export_response(request, key, f'run_{pk}_extracted', json_content_type(key), cached=cached)
+
+    entities = parse_extracted_data(run.extracted)
+    if not entities:
+        return JsonResponse({"error": "No extracted data available for export"}, status=404)
+
+    if key.extension == 'ndjson':
+        chunks = ndjson_stream(entities)
+    else:
+        chunks = json_stream({
+            "run_id": run.pk,
+            "created_at": run.created_at.isoformat(),
+            "entities": entities
+        })
+    return export_response(request, key, f'run_{pk}_extracted', json_content_type(key), chunks=chunks)
+
+
+@login_required
 def export_run_scraped_json(request, pk):
-    run = get_object_or_404(Run, pk=pk)
-    
+    run = get_object_or_404(Run.objects.defer(*RUN_PAYLOAD_FIELDS), pk=pk, user_id=request.user.id)
+    key = run_export_key(run, 'scraped', json_extension(request))
+
+    not_modified = conditional_export(request, key)
+    if not_modified:
+        return not_modified
+
+    cached = cached_file(key)
+    if cached:
+        return export_response(request, key, f'run_{pk}_scraped', json_content_type(key), cached=cached)
+
+    if not run.scraped:
+        return JsonResponse({"error": "No scraped data available for export"}, status=404)
+
+    if key.extension == 'ndjson':
+        chunks = ndjson_stream(scraped_records(run.scraped))
+    else:
+        chunks = json_stream({
+            "run_id": run.pk,
+            "created_at": run.created_at.isoformat(),
+            "scraped_data": run.scraped
+        })
+    return export_response(request, key, f'run_{pk}_scraped', json_content_type(key), chunks=chunks)
+
+
+@login_required
+def export_run_posts(request, pk, file_format):
+    """Scraped posts of a run flattened to one row per post, as CSV or NDJSON.
+
+    ``?columns=`` selects and orders the columns out of ``POST_COLUMNS``.
+    """
+    selected = requested_fields(request)
+    try:
+        columns = select_fields(POST_COLUMNS, selected)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    run = get_object_or_404(Run.objects.defer(*RUN_PAYLOAD_FIELDS), pk=pk, user_id=request.user.id)
+    key = run_export_key(run, 'posts', file_format, selected)
+    content_type = 'text/csv' if file_format == 'csv' else 'application/x-ndjson'
+
+    not_modified = conditional_export(request, key)
+    if not_modified:
+        return not_modified
+
+    cached = cached_file(key)
+    if cached:
+        return export_response(request, key, f'run_{pk}_posts', content_type, cached=cached)
+
     if not run.scraped:
         return JsonResponse({"error": "No scraped data available for export"}, status=404)
-    
-    data = {
-        "run_id": run.pk,
-        "created_at": run.created_at.isoformat(),
-        "scraped_data": run.scraped
-    }
-    
-    response = HttpResponse(json.dumps(data, indent=2), content_type='application/json')
-    response['Content-Disposition'] = f'attachment; filename="run_{pk}_scraped.json"'
-    
-    return response
\ No newline at end of file
+
+    if file_format == 'csv':
+        chunks = posts_csv_stream(run.scraped, columns)
+    else:
+        chunks = ndjson_stream(post_records(run.scraped, columns))
+    return export_response(request, key, f'run_{pk}_posts', content_type, chunks=chunks)
+
+
+# -------------------------------------------------------------------------
+# Background export jobs
+# -------------------------------------------------------------------------
+def queue_export(request, **target):
+    """Create an export job from the POSTed format options"""
+    try:
+        job = enqueue_export(
+            request.user,
+            request.POST.get('format', 'csv'),
+            source=request.POST.get('source', 'extracted'),
+            compress=request.POST.get('compress') in ('1', 'true', 'on'),
+            **target,
+        )
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+    return JsonResponse({'success': True, 'job_id': job.pk, 'status_url': f"/exports/{job.pk}/"})
+
+
+@login_required
+@require_http_methods(["POST"])
+def export_list_job(request, pk):
+    """Queue a background export of a list"""
+    list_obj = get_object_or_404(UserList, pk=pk, user=request.user)
+    return queue_export(request, user_list=list_obj)
+
+
+@login_required
+@require_http_methods(["POST"])
+def export_run_job(request, pk):
+    """Queue a background export of a run's extracted or scraped data"""
+    run = get_object_or_404(Run.objects.defer(*RUN_PAYLOAD_FIELDS), pk=pk, user_id=request.user.id)
+    return queue_export(request, run=run)
+
+
+@login_required
+def export_job_status(request, pk):
+    """Progress of a background export job"""
+    job = get_object_or_404(ExportJob, pk=pk, user=request.user)
+    return JsonResponse({'success': True, 'job': job_status(job)})
+
+
+def byte_range(header, size):
+    """(start, end) of a single-range Range header, None to send the whole file.
+
+    Raises ValueError when the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header or '')
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    else:
+        start, end = max(size - int(last), 0), size - 1
+    if start > end or start >= size:
+        raise ValueError(header)
+    return start, end
+
+
+@login_required
+def export_job_download(request, pk):
+    """Download a finished export; supports Range requests to resume downloads"""
+    job = get_object_or_404(ExportJob.objects.select_related('user_list'), pk=pk, user=request.user, status='completed')
+    path = job_path(job) if job.file_name else None
+    if path is None or not path.exists():
+        raise Http404("Export file has expired")
+
+    size = path.stat().st_size
+    etag = quote_etag(f'export-{job.pk}-{size}-{int(job.finished_at.timestamp())}')
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified:
+        return not_modified
+
+    try:
+        requested = byte_range(request.headers.get('Range'), size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    # A Range for an older version of the file gets the whole current file
+    if requested and request.headers.get('If-Range', etag) != etag:
+        requested = None
+
+    content_type = 'application/gzip' if job.compress else CONTENT_TYPES[job.export_format]
+    if requested:
+        start, end = requested
+        response = StreamingHttpResponse(read_range(path, start, end), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    else:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Content-Disposition'] = f'attachment; filename="{export_name(job)}"'
+    return response
+
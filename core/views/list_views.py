@@ -6,7 +6,16 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
 from django.template.loader import render_to_string
-from ..models import User, UserList, ListColumn, ListRow
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from ..models import User, UserList, ListColumn, ListRow, ImportMapping
+from ..services.coercion import RowCoercer
+from ..services.column_validation import check_type_change, TYPE_CHANGE_SAMPLE_SIZE
+from ..services.file_import import import_file
+from ..services.import_mappings import mapping_state, retarget_rules, validate_mapping
+from ..services.list_aggregation import cached_aggregate, parse_metric
+from ..services.list_import import IMPORT_MODES, drop_dedupe_column, rename_dedupe_column, set_dedupe_columns
+from ..services.list_journal import record_changes, column_state, rename_row_data, undo, redo, restore
 
 logger = logging.getLogger(__name__)
 
@@ -143,14 +152,16 @@ def list_column_create(request, pk):
                 options = []
 
         if name and column_type:
-            new_column = ListColumn.objects.create(
-                user_list=list_obj,
-                name=name,
-                column_type=column_type,
-                required=required,
-                order=order,
-                options=options
-            )
+            with record_changes(list_obj, request.user) as changes:
+                new_column = ListColumn.objects.create(
+                    user_list=list_obj,
+                    name=name,
+                    column_type=column_type,
+                    required=required,
+                    order=order,
+                    options=options
+                )
+                changes.column_created(new_column)
 
             # Check if this is an HTMX request
             if request.headers.get('HX-Request'):
@@ -206,52 +217,32 @@ def list_row_create(request, pk):
     columns = list_obj.columns.all().order_by('order')
 
     if request.method == 'POST':
-        row_data = {}
-        for column in columns:
-            value = request.POST.get(f'column_{column.pk}')
-            if column.column_type == 'number' and value:
-                try:
-                    row_data[column.name] = float(value)
-                except ValueError:
-                    row_data[column.name] = value
-            elif column.column_type == 'boolean':
-                row_data[column.name] = value == 'on'
-            elif column.column_type == 'select' and value:
-                row_data[column.name] = value
-            elif column.column_type == 'multi_select' and value:
-                # Handle multi-select as comma-separated values
-                tags = [tag.strip() for tag in value.split(',') if tag.strip()]
-                row_data[column.name] = tags if tags else None
-            elif column.column_type == 'url' and value:
-                row_data[column.name] = value
-            elif column.column_type == 'json' and value:
-                try:
-                    row_data[column.name] = json.loads(value)
-                except json.JSONDecodeError:
-                    row_data[column.name] = value
-            else:
-                row_data[column.name] = value or None
+        coercer = RowCoercer(columns, key='pk')
+        posted = {column.pk: request.POST.get(f'column_{column.pk}') for column in columns}
+        row_data = coercer.coerce_row(posted, fill_blanks=True)
 
         # Handle insert_after parameter for positioning
         insert_after = request.POST.get('insert_after')
-        if insert_after:
-            try:
-                after_row = ListRow.objects.get(pk=int(insert_after), user_list=list_obj)
-                # For now, just create at the end. Could implement proper ordering later
-                ListRow.objects.create(
-                    user_list=list_obj,
-                    data=row_data
-                )
-            except (ListRow.DoesNotExist, ValueError):
-                ListRow.objects.create(
+        with record_changes(list_obj, request.user) as changes:
+            if insert_after:
+                try:
+                    after_row = ListRow.objects.get(pk=int(insert_after), user_list=list_obj)
+                    # For now, just create at the end. Could implement proper ordering later
+                    new_row = ListRow.objects.create(
+                        user_list=list_obj,
+                        data=row_data
+                    )
+                except (ListRow.DoesNotExist, ValueError):
+                    new_row = ListRow.objects.create(
+                        user_list=list_obj,
+                        data=row_data
+                    )
+            else:
+                new_row = ListRow.objects.create(
                     user_list=list_obj,
                     data=row_data
                 )
-        else:
-            ListRow.objects.create(
-                user_list=list_obj,
-                data=row_data
-            )
+            changes.row_created(new_row)
 
         # Check if this is an HTMX request
         if request.headers.get('HX-Request'):
@@ -312,23 +303,20 @@ def update_cell(request, pk):
             row = ListRow.objects.get(pk=row_id, user_list=list_obj)
             row_data = row.data.copy() if row.data else {}
 
-            # Convert value based on type
-            if cell_type == 'boolean':
-                row_data[column] = value.lower() == 'true'
-            elif cell_type == 'number' and value:
-                try:
-                    row_data[column] = float(value)
-                except ValueError:
-                    row_data[column] = value
-            elif cell_type == 'date' and value:
-                row_data[column] = value
+            # Convert with the column's own type and options when the column exists
+            list_column = list_obj.columns.filter(name=column).first()
+            if list_column:
+                coercer = RowCoercer([list_column])
             else:
-                row_data[column] = value if value else None
+                coercer = RowCoercer([ListColumn(name=column, column_type=cell_type or 'text')])
+            row_data[column] = coercer.coerce(column, value)
 
-            row.data = row_data
-            row.save()
+            with record_changes(list_obj, request.user) as changes:
+                changes.cell(row.pk, column, (row.data or {}).get(column), row_data[column])
+                row.data = row_data
+                row.save()
 
-            return JsonResponse({'success': True})
+            return JsonResponse({'success': True, 'coercion_errors': coercer.failure_report()})
         except ListRow.DoesNotExist:
             return JsonResponse({'success': False, 'error': 'Row not found'})
     return JsonResponse({'success': False, 'error': 'Invalid request'})
@@ -344,7 +332,9 @@ def delete_row(request, pk):
             if isinstance(row_id, str):
                 row_id = int(row_id)
             row = ListRow.objects.get(pk=row_id, user_list=list_obj)
-            row.delete()
+            with record_changes(list_obj, request.user) as changes:
+                changes.row_deleted(row)
+                row.delete()
             return JsonResponse({'success': True})
         except (ListRow.DoesNotExist, ValueError):
             return JsonResponse({'success': False, 'error': 'Row not found'})
@@ -361,24 +351,15 @@ def add_blank_row(request, pk):
         insert_after_id = request.POST.get('insert_after')
         
         # Create row with empty data for all columns
-        row_data = {}
-        for column in columns:
-            if column.column_type == 'boolean':
-                row_data[column.name] = False
-            elif column.column_type == 'number':
-                row_data[column.name] = None
-            elif column.column_type == 'select':
-                row_data[column.name] = None
-            elif column.column_type == 'multi_select':
-                row_data[column.name] = []
-            else:
-                row_data[column.name] = None
+        row_data = RowCoercer(columns).blank_row()
 
         # Create new row
-        new_row = ListRow.objects.create(
-            user_list=list_obj,
-            data=row_data
-        )
+        with record_changes(list_obj, request.user) as changes:
+            new_row = ListRow.objects.create(
+                user_list=list_obj,
+                data=row_data
+            )
+            changes.row_created(new_row)
 
         # If insert_after is specified, handle positioning
         if insert_after_id:
@@ -423,41 +404,33 @@ def table_save(request, pk):
         logger = logging.getLogger(__name__)
         logger.info(f"Table save request for list {pk} with data: {data}")
 
-        updated_rows = 0
-
-        # Process each row's changes
-        for row_id, changes in data.items():
-            try:
-                row = ListRow.objects.get(pk=int(row_id), user_list=list_obj)
-                row_data = row.data.copy() if row.data else {}
-
-                # Apply changes to row data
-                for column_id, value in changes.items():
-                    # Find column by ID to get column name
-                    column = list_obj.columns.filter(pk=int(column_id)).first()
-                    if column:
-                        # Convert value based on column type
-                        if column.column_type == 'boolean':
-                            row_data[column.name] = value.lower() == 'true' if isinstance(value, str) else bool(value)
-                        elif column.column_type == 'number' and value:
-                            try:
-                                row_data[column.name] = float(value)
-                            except (ValueError, TypeError):
-                                row_data[column.name] = value
-                        elif column.column_type == 'date' and value:
-                            row_data[column.name] = value
-                        else:
-                            row_data[column.name] = value if value else None
-
-                row.data = row_data
-                row.save()
-                updated_rows += 1
-                logger.info(f"Updated row {row_id} with changes: {changes}")
-
-            except ListRow.DoesNotExist:
-                logger.warning(f"Row {row_id} does not exist")
-                continue  # Skip rows that don't exist
-
+        # Build converters once and load all changed rows in one query
+        coercer = RowCoercer(list_obj.columns.all(), key='pk')
+        rows_by_id = ListRow.objects.filter(user_list=list_obj).in_bulk([int(row_id) for row_id in data])
+        now = timezone.now()
+        changed_rows = []
+
+        with record_changes(list_obj, request.user) as changes:
+            # Process each row's changes
+            for row_id, row_changes in data.items():
+                row = rows_by_id.get(int(row_id))
+                if row is None:
+                    logger.warning(f"Row {row_id} does not exist")
+                    continue  # Skip rows that don't exist
+
+                posted = {int(column_id): value for column_id, value in row_changes.items()}
+                old_data = row.data or {}
+                new_values = coercer.coerce_row(posted)
+                for column_name, new_value in new_values.items():
+                    changes.cell(row.pk, column_name, old_data.get(column_name), new_value)
+                row.data = {**old_data, **new_values}
+                row.updated_at = now
+                changed_rows.append(row)
+
+            ListRow.objects.bulk_update(changed_rows, ['data', 'updated_at'], batch_size=500)
+        updated_rows = len(changed_rows)
+        if coercer.failure_count:
+            logger.info(f"Kept {coercer.failure_count} values unconverted in list {pk}")
         logger.info(f"Successfully updated {updated_rows} rows")
 
         # Re-render the table editor with updated data
@@ -507,6 +480,7 @@ def update_column(request, pk, column_id):
     if request.method == 'POST':
         list_obj = get_object_or_404(UserList, pk=pk, user=request.user)
         column = get_object_or_404(ListColumn, pk=column_id, user_list=list_obj)
+        old_state = column_state(column)
 
         # Update name
         if 'name' in request.POST:
@@ -542,7 +516,13 @@ def update_column(request, pk, column_id):
         if 'required' in request.POST:
             column.required = request.POST.get('required').lower() == 'true'
 
-        column.save()
+        with record_changes(list_obj, request.user) as changes:
+            column.save()
+            changes.column_updated(old_state, column)
+            if column.name != old_state['name']:
+                rename_row_data(list_obj, old_state['name'], column.name)
+                rename_dedupe_column(list_obj, old_state['name'], column.name)
+                retarget_rules(list_obj, old_state['name'], column.name)
         return JsonResponse({'success': True})
 
     return JsonResponse({'success': False, 'error': 'Invalid request'})
@@ -558,105 +538,22 @@ def validate_column_type_change(request, pk, column_id):
     if not new_type or new_type not in dict(ListColumn.COLUMN_TYPES):
         return JsonResponse({'success': False, 'error': 'Invalid column type'})
     
-    # Get existing data
-    rows = list_obj.rows.all()
-    existing_data = [row.data.get(column.name) for row in rows if row.data.get(column.name) is not None]
-    
-    # Remove empty values
-    non_empty_data = [str(val).strip() for val in existing_data if str(val).strip()]
-    
-    if not non_empty_data:
-        return JsonResponse({
-            'success': True, 
-            'allowed': True, 
-            'message': 'Column is empty - any type allowed',
-            'sample_conflicts': []
-        })
-    
-    # Validate compatibility based on current type
-    validation = validate_type_compatibility(non_empty_data, column.column_type, new_type)
+    # Fast mode only checks a sample of rows, for very large lists
+    sample_size = TYPE_CHANGE_SAMPLE_SIZE if request.POST.get('mode') == 'sample' else None
+    validation = check_type_change(list_obj, column, new_type, sample_size=sample_size)
     
     return JsonResponse({
         'success': True,
         'allowed': validation['allowed'],
         'message': validation['message'],
-        'sample_conflicts': validation.get('sample_conflicts', [])
+        'sample_conflicts': validation['sample_conflicts'],
+        'checked_count': validation['checked_count'],
+        'conflict_count': validation['conflict_count'],
+        'sampled': validation['sampled'],
+        'suggested_type': validation.get('suggested_type')
     })
 
 
-def validate_type_compatibility(data, current_type, new_type):
-    """Check if data can be safely converted to new type"""
-    
-    # Define compatibility rules
-    def is_number(value):
-        try:
-            float(value)
-            return True
-        except ValueError:
-            return False
-    
-    def is_date(value):
-        try:
-            from datetime import datetime
-            # Try common date formats
-            for fmt in ['%Y-%m-%d', '%m/%d/%Y', '%d/%m/%Y', '%Y-%m-%d %H:%M:%S']:
-                try:
-                    datetime.strptime(value, fmt)
-                    return True
-                except ValueError:
-                    continue
-            return False
-        except:
-            return False
-    
-    def is_boolean(value):
-        return str(value).lower() in ['true', 'false', '1', '0', 'yes', 'no']
-    
-    def is_url(value):
-        try:
-            from urllib.parse import urlparse
-            result = urlparse(value)
-            return all([result.scheme, result.netloc])
-        except:
-            return False
-    
-    # Check for incompatible data
-    conflicts = []
-    
-    # If current type is number, check for non-numeric values
-    if current_type == 'number':
-        for value in data:
-            if not is_number(value):
-                conflicts.append(value)
-    
-    # If current type is date, check for non-date values
-    elif current_type == 'date':
-        for value in data:
-            if not is_date(value):
-                conflicts.append(value)
-    
-    # If current type is boolean, check for non-boolean values
-    elif current_type == 'boolean':
-        for value in data:
-            if not is_boolean(value):
-                conflicts.append(value)
-    
-    # If current type is url, check for non-url values
-    elif current_type == 'url':
-        for value in data:
-            if not is_url(value) and value.strip():  # Allow empty strings
-                conflicts.append(value)
-    
-    if conflicts:
-        return {
-            'allowed': False,
-            'message': f'Cannot change to {new_type}: {len(conflicts)} values would be incompatible',
-            'sample_conflicts': conflicts[:3]  # Show first 3 conflicts
-        }
-    
-    return {'allowed': True, 'message': 'Type change is safe'}
-
-
 def delete_column(request, pk, column_id):
     if request.method == 'POST':
         list_obj = get_object_or_404(UserList, pk=pk, user=request.user)
@@ -666,7 +563,10 @@ def delete_column(request, pk, column_id):
         if list_obj.columns.count() <= 1:
             return JsonResponse({'success': False, 'error': 'Cannot delete the last column'})
 
-        column.delete()
+        with record_changes(list_obj, request.user) as changes:
+            changes.column_deleted(column)
+            column.delete()
+            drop_dedupe_column(list_obj, column.name)
         return JsonResponse({'success': True})
 
     return JsonResponse({'success': False, 'error': 'Invalid request'})
@@ -707,11 +607,15 @@ def delete_selected_rows(request, pk):
         if not row_ids:
             return JsonResponse({'success': False, 'error': 'No rows selected'})
         
-        # Delete rows
-        deleted_count = ListRow.objects.filter(
+        # Delete rows, journaling each one so the deletion can be undone
+        rows = ListRow.objects.filter(
             pk__in=row_ids,
             user_list=list_obj
-        ).delete()[0]
+        )
+        with record_changes(list_obj, request.user) as changes:
+            for row in rows.only('pk', 'data', 'key_hash'):
+                changes.row_deleted(row)
+            deleted_count = rows.delete()[0]
         
         return JsonResponse({
             'success': True, 
@@ -744,12 +648,14 @@ def add_column_ag_grid(request, pk):
         
         # Create new column
         order = list_obj.columns.count()
-        new_column = ListColumn.objects.create(
-            user_list=list_obj,
-            name=name,
-            column_type=column_type,
-            order=order
-        )
+        with record_changes(list_obj, request.user) as changes:
+            new_column = ListColumn.objects.create(
+                user_list=list_obj,
+                name=name,
+                column_type=column_type,
+                order=order
+            )
+            changes.column_created(new_column)
         
         return JsonResponse({
             'success': True,
@@ -787,4 +693,156 @@ def update_list_icon(request, pk):
         return JsonResponse({'success': False, 'error': 'Invalid JSON data'})
     except Exception as e:
         logger.error(f"Error updating list icon: {e}")
-        return JsonResponse({'success': False, 'error': 'Server error'})
\ No newline at end of file
+        return JsonResponse({'success': False, 'error': 'Server error'})
+
+
+@login_required
+def list_history(request, pk):
+    """Recent journaled changes of a list, optionally only those after ?since=<version>"""
+    list_obj = get_object_or_404(UserList, pk=pk, user=request.user)
+    changes = list_obj.changes.select_related('actor')
+
+    since = request.GET.get('since')
+    if since:
+        try:
+            changes = changes.filter(version__gt=int(since))
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'Invalid version'})
+        changes = changes.order_by('version', 'pk')[:1000]
+    else:
+        changes = reversed(changes.order_by('-version', '-pk')[:100])
+
+    return JsonResponse({
+        'success': True,
+        'version': list_obj.version,
+        'changes': [
+            {
+                'version': change.version,
+                'kind': change.kind,
+                'action': change.action,
+                'row_id': change.row_id,
+                'column': change.column,
+                'old_value': change.old_value,
+                'new_value': change.new_value,
+                'actor': change.actor.username if change.actor else None,
+                'created_at': change.created_at.isoformat()
+            } for change in changes
+        ]
+    })
+
+
+@login_required
+@require_http_methods(["POST"])
+def list_undo(request, pk):
+    """Undo the most recent change to a list"""
+    list_obj = get_object_or_404(UserList, pk=pk, user=request.user)
+    version = undo(list_obj, request.user)
+    if version is None:
+        return JsonResponse({'success': False, 'error': 'Nothing to undo'})
+    return JsonResponse({'success': True, 'version': version})
+
+
+@login_required
+@require_http_methods(["POST"])
+def list_redo(request, pk):
+    """Redo the most recently undone change to a list"""
+    list_obj = get_object_or_404(UserList, pk=pk, user=request.user)
+    version = redo(list_obj, request.user)
+    if version is None:
+        return JsonResponse({'success': False, 'error': 'Nothing to redo'})
+    return JsonResponse({'success': True, 'version': version})
+
+
+@login_required
+@require_http_methods(["POST"])
+def list_restore(request, pk):
+    """Restore a list to its state as of a point in time"""
+    list_obj = get_object_or_404(UserList, pk=pk, user=request.user)
+    at = parse_datetime(request.POST.get('at', ''))
+    if at is None:
+        return JsonResponse({'success': False, 'error': 'Invalid timestamp'})
+    if timezone.is_naive(at):
+        at = timezone.make_aware(at)
+
+    version = restore(list_obj, at, request.user)
+    if version is None:
+        return JsonResponse({'success': False, 'error': 'No history available for that time'})
+    return JsonResponse({'success': True, 'version': version})
+
+
+@login_required
+def list_aggregate(request, pk):
+    """Group-by summary of a list.
+
+    Query parameters: ``group_by`` (repeatable column name) and ``metric``
+    (repeatable ``op:column``, op one of count, distinct, sum, avg, min, max).
+    """
+    list_obj = get_object_or_404(UserList, pk=pk, user=request.user)
+    group_by = [name for name in request.GET.getlist('group_by') if name]
+    metrics = [parse_metric(spec) for spec in request.GET.getlist('metric') if spec]
+
+    try:
+        result = cached_aggregate(list_obj, group_by, metrics)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+    return JsonResponse({'success': True, 'version': list_obj.version, **result})
+
+
+@login_required
+@require_http_methods(["POST"])
+def list_dedupe_columns(request, pk):
+    """Set the columns that identify rows of a list across imports"""
+    list_obj = get_object_or_404(UserList, pk=pk, user=request.user)
+    try:
+        data = json.loads(request.body)
+        result = set_dedupe_columns(list_obj, data.get('columns', []))
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON data'})
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+    return JsonResponse({'success': True, 'dedupe_columns': list_obj.dedupe_columns, **result})
+
+
+@login_required
+@require_http_methods(["GET", "POST"])
+def list_import_mapping(request, pk):
+    """View or edit the saved mapping used by imports into a list"""
+    list_obj = get_object_or_404(UserList, pk=pk, user=request.user)
+    mapping = ImportMapping.objects.filter(user_list=list_obj).first() or ImportMapping(user_list=list_obj)
+    if request.method == 'POST':
+        try:
+            data = json.loads(request.body)
+            fields = data.get('fields', mapping.fields)
+            ignored = data.get('ignored', mapping.ignored)
+            validate_mapping(list_obj, fields, ignored)
+        except json.JSONDecodeError:
+            return JsonResponse({'success': False, 'error': 'Invalid JSON data'})
+        except ValueError as e:
+            return JsonResponse({'success': False, 'error': str(e)})
+        mapping.fields = fields
+        mapping.ignored = ignored
+        mapping.save()
+
+    return JsonResponse({'success': True, 'mapping': mapping_state(mapping)})
+
+
+@login_required
+@require_http_methods(["POST"])
+def list_upload(request, pk):
+    """Import rows from an uploaded CSV or XLSX file into a list"""
+    list_obj = get_object_or_404(UserList, pk=pk, user=request.user)
+    upload = request.FILES.get('file')
+    if upload is None:
+        return JsonResponse({'success': False, 'error': 'No file uploaded'})
+    mode = request.POST.get('mode', 'upsert')
+    if mode not in IMPORT_MODES:
+        return JsonResponse({'success': False, 'error': f'Unknown import mode: {mode}'})
+
+    try:
+        stats = import_file(list_obj, upload, actor=request.user, mode=mode)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+    return JsonResponse({'success': True, **stats})
@@ -2,6 +2,8 @@
 ASGI config for vibe_scraper project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP requests go to Django; WebSocket connections go to the realtime list
+updates in ``core.realtime``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +15,13 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "vibe_scraper.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from core.realtime import list_socket  # noqa: E402  (needs the app registry)
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        await list_socket(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -20,9 +20,9 @@ from django.urls import path
 from django.conf import settings
 from django.conf.urls.static import static
 from core.views.utility_views import home, pricing
-from core.views.run_views import run_create, run_list, run_detail, run_by_n8n, run_status_api, empty_source_form, platform_config, analyze_import_to_list, add_extracted_to_list
-from core.views.list_views import list_list, list_detail, list_create, list_column_create, list_row_create, update_cell, delete_row, add_blank_row, update_column, delete_column, delete_list, table_save, validate_column_type_change, delete_selected_rows, add_column_ag_grid, update_list_icon
-from core.views.export_views import export_list_csv, export_list_json, export_run_csv, export_run_json, export_run_scraped_json
+from core.views.run_views import run_create, run_list, run_detail, run_by_n8n, run_status_api, empty_source_form, platform_config, analyze_import_to_list, add_extracted_to_list, import_job_status, merge_runs_to_list
+from core.views.list_views import list_list, list_detail, list_create, list_column_create, list_row_create, update_cell, delete_row, add_blank_row, update_column, delete_column, delete_list, table_save, validate_column_type_change, delete_selected_rows, add_column_ag_grid, update_list_icon, list_history, list_undo, list_redo, list_restore, list_aggregate, list_dedupe_columns, list_import_mapping, list_upload
+from core.views.export_views import export_list_csv, export_list_json, export_run_csv, export_run_json, export_run_scraped_json, export_run_posts, export_list_columnar, export_run_columnar, export_list_sqlite, export_run_sqlite, export_list_job, export_run_job, export_job_status, export_job_download
 from core.views.auth_views import login_view,callback_page, logout_view, dashboard_view, supabase_auth_callback, get_oauth_config, refresh_token
 
 urlpatterns = [
@@ -47,10 +47,18 @@ urlpatterns = [
     path("runs/<int:pk>/status/", run_status_api, name="run_status_api"),
     path("runs/<int:pk>/export/csv/", export_run_csv, name="export_run_csv"),
     path("runs/<int:pk>/export/json/", export_run_json, name="export_run_json"),
+    path("runs/<int:pk>/export/parquet/", export_run_columnar, {"file_format": "parquet"}, name="export_run_parquet"),
+    path("runs/<int:pk>/export/arrow/", export_run_columnar, {"file_format": "arrow"}, name="export_run_arrow"),
+    path("runs/<int:pk>/export/sqlite/", export_run_sqlite, name="export_run_sqlite"),
+    path("runs/<int:pk>/export/jobs/", export_run_job, name="export_run_job"),
     path("runs/<int:pk>/export/scraped/json/", export_run_scraped_json, name="export_run_scraped_json"),
+    path("runs/<int:pk>/export/posts/csv/", export_run_posts, {"file_format": "csv"}, name="export_run_posts_csv"),
+    path("runs/<int:pk>/export/posts/ndjson/", export_run_posts, {"file_format": "ndjson"}, name="export_run_posts_ndjson"),
     path("runs/by-n8n/<int:n8n_execution_id>/", run_by_n8n, name="run_by_n8n"),
     path("runs/<int:run_pk>/analyze-import/<str:list_pk>/", analyze_import_to_list, name="analyze_import_to_list"),
     path("runs/<int:run_pk>/add-to-list/<str:list_pk>/", add_extracted_to_list, name="add_extracted_to_list"),
+    path("imports/<int:pk>/", import_job_status, name="import_job_status"),
+    path("lists/<int:list_pk>/merge-runs/", merge_runs_to_list, name="merge_runs_to_list"),
     # User List Management
     path("lists/", list_list, name="list_list"),
     path("lists/create/", list_create, name="list_create"),
@@ -68,8 +76,22 @@ urlpatterns = [
     path("lists/<int:pk>/delete-rows/", delete_selected_rows, name="delete_selected_rows"),
     path("lists/<int:pk>/add-column/", add_column_ag_grid, name="add_column_ag_grid"),
     path("lists/<int:pk>/update-icon/", update_list_icon, name="update_list_icon"),
+    path("lists/<int:pk>/history/", list_history, name="list_history"),
+    path("lists/<int:pk>/aggregate/", list_aggregate, name="list_aggregate"),
+    path("lists/<int:pk>/dedupe-columns/", list_dedupe_columns, name="list_dedupe_columns"),
+    path("lists/<int:pk>/import-mapping/", list_import_mapping, name="list_import_mapping"),
+    path("lists/<int:pk>/upload/", list_upload, name="list_upload"),
+    path("lists/<int:pk>/undo/", list_undo, name="list_undo"),
+    path("lists/<int:pk>/redo/", list_redo, name="list_redo"),
+    path("lists/<int:pk>/restore/", list_restore, name="list_restore"),
     path("lists/<int:pk>/export/csv/", export_list_csv, name="export_list_csv"),
     path("lists/<int:pk>/export/json/", export_list_json, name="export_list_json"),
+    path("lists/<int:pk>/export/parquet/", export_list_columnar, {"file_format": "parquet"}, name="export_list_parquet"),
+    path("lists/<int:pk>/export/arrow/", export_list_columnar, {"file_format": "arrow"}, name="export_list_arrow"),
+    path("lists/<int:pk>/export/sqlite/", export_list_sqlite, name="export_list_sqlite"),
+    path("lists/<int:pk>/export/jobs/", export_list_job, name="export_list_job"),
+    path("exports/<int:pk>/", export_job_status, name="export_job_status"),
+    path("exports/<int:pk>/download/", export_job_download, name="export_job_download"),
 ]
 
 # Serve static files in development